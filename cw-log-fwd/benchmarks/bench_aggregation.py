@@ -0,0 +1,46 @@
+"""Bytes shipped with raw forwarding against log-to-metric aggregation.
+
+Aggregates FastAPI access logs by status_code and response_time (grouped
+by method) and compares the serialized size of the raw events with the
+size of the metric series that replace them when drop_raw is set.
+
+    python benchmarks/bench_aggregation.py [--sizes 100,1000,10000]
+"""
+import argparse
+import json
+
+from common import fastapi_messages, report, timeit
+
+import lambda_function
+from aggregation import Aggregation
+
+CONTEXT = {'log_group_name': '/aws/lambda/fastapi-demo', 'log_stream_name': 'app', 'aws_region': 'us-east-1'}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    args = parser.parse_args()
+
+    aggregation = Aggregation(counters=['status_code'], histograms=['response_time'], group_by=['method'])
+    rows = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        events = [{'id': str(i), 'timestamp': i, 'message': m} for i, m in enumerate(fastapi_messages(size))]
+        processed = lambda_function.process_log_events(events, CONTEXT)
+        series = aggregation.aggregate(processed, CONTEXT['log_group_name'])
+        raw_bytes = len(json.dumps(processed).encode('utf-8'))
+        series_bytes = len(json.dumps({'series': series}).encode('utf-8'))
+        rows.append({
+            'events': size,
+            'series': len(series),
+            'raw_kb': raw_bytes / 1024,
+            'series_kb': series_bytes / 1024,
+            'reduction': raw_bytes / series_bytes,
+            'aggregate_ms': timeit(lambda: aggregation.aggregate(processed, CONTEXT['log_group_name']))['median_ms'],
+        })
+
+    report("Raw events against aggregated series (median of 5)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Peak memory of a subscription payload, in memory against streamed.
+
+For each payload size and message kind, from the base64 payload to the
+request body:
+  in_memory  - process_log_batch, then serialization of the whole batch
+  streamed   - process_log_batch with stream_chunk, a chunk at a time
+Peaks are measured with tracemalloc and also given per byte of decompressed
+payload, the figure DD_FORWARDER_MEMORY_PER_BYTE projects memory with.
+
+    python benchmarks/bench_memory.py [--sizes 5000,20000] [--chunk 1000]
+"""
+import argparse
+import tracemalloc
+
+from common import fastapi_messages, make_subscription_event, report
+
+import lambda_function
+from records import SerializedEvents, serialize_records
+
+
+def plain_messages(count: int):
+    return [f"GET /api/users/{i % 500} 200 {10 + i % 90}ms client=192.168.1.{i % 250}" for i in range(count)]
+
+
+def run(payload: str, stream_chunk: int) -> int:
+    log_data, _, _ = lambda_function.decode_log_data(payload)
+    context = {'log_group_name': log_data['logGroup'], 'log_stream_name': log_data['logStream']}
+    events = lambda_function.process_log_batch(log_data['logEvents'], context, None, 1, stream_chunk)
+    if not isinstance(events, SerializedEvents):
+        data, count = serialize_records(events)
+        events = SerializedEvents([data], count)
+    return len(events.body())
+
+
+def peak_kib(payload: str, stream_chunk: int) -> float:
+    tracemalloc.start()
+    try:
+        run(payload, stream_chunk)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='5000,20000')
+    parser.add_argument('--chunk', type=int, default=1000)
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        for source, messages in (('json', fastapi_messages), ('plain', plain_messages)):
+            event = make_subscription_event(messages(size), log_group=f"/bench/{source}")
+            payload = event['awslogs']['data']
+            raw_kib = lambda_function.decode_log_data(payload)[2] / 1024
+            assert run(payload, 0) == run(payload, args.chunk)
+            in_memory = peak_kib(payload, 0)
+            streamed = peak_kib(payload, args.chunk)
+            rows.append({
+                'messages': source,
+                'events': size,
+                'raw_kib': raw_kib,
+                'in_memory_kib': in_memory,
+                'streamed_kib': streamed,
+                'in_memory_per_byte': in_memory / raw_kib,
+                'streamed_per_byte': streamed / raw_kib,
+            })
+
+    report(f"Peak memory per payload (chunks of {args.chunk} events)", rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Crossover point of multi-process batch parsing against in-process parsing.
+
+Compares, per batch size, from raw CloudWatch events to the request body:
+  serial      - process_log_records then json.dumps, in one process
+  N_workers   - process_in_parallel with N processes (the caller included)
+
+and reports, for each worker count, the smallest batch where it beats
+serial; use it for DD_FORWARDER_PARALLEL_THRESHOLD. Parallel parsing only
+pays on a machine with as many CPUs as workers, so run this on the memory
+size you deploy (a Lambda function gets one vCPU per 1,769 MB) or on a host
+with that many cores.
+
+    python benchmarks/bench_parallel.py [--sizes 1000,5000,20000,50000,100000] [--workers 2,4]
+"""
+import argparse
+import json
+import os
+
+from common import fastapi_messages, report, timeit
+
+import lambda_function
+from parallel import process_in_parallel
+from records import materialize
+
+CONTEXT = {'log_group_name': '/aws/lambda/fastapi-demo', 'log_stream_name': 'app', 'aws_region': 'us-east-1'}
+
+
+def build(chunk):
+    return lambda_function.build_records(chunk, lambda_function.BatchContext(CONTEXT), None)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,5000,20000,50000,100000')
+    parser.add_argument('--workers', default='2,4')
+    args = parser.parse_args()
+    worker_counts = [int(w) for w in args.workers.split(',')]
+
+    rows = []
+    crossover = {}
+    for size in (int(s) for s in args.sizes.split(',')):
+        events = [{'id': str(i), 'timestamp': i, 'message': m} for i, m in enumerate(fastapi_messages(size))]
+        serial = timeit(lambda: json.dumps(build(events), default=materialize).encode('utf-8'))
+        row = {'events': size, 'serial_ms': serial['median_ms']}
+        for workers in worker_counts:
+            result = timeit(lambda: process_in_parallel(events, build, workers).body())
+            row[f'{workers}_workers_ms'] = result['median_ms']
+            if result['median_ms'] < serial['median_ms']:
+                crossover.setdefault(workers, size)
+        rows.append(row)
+
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    report(f"Batch parsing, serial against worker processes, on {cpus} CPU(s) (median of 5)", rows)
+    for workers in worker_counts:
+        print(f"{workers} workers: faster than serial from "
+              f"{crossover[workers] if workers in crossover else 'no tested size'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Per-line parse cost for each registered log format.
+
+For every format this times the bare parser, parse_record with the parser
+selected, and parse_record without one (the JSON-or-plain default path),
+so the cost of structuring a format can be compared with forwarding it opaque.
+
+    python benchmarks/bench_parsers.py [--lines 10000]
+"""
+import argparse
+
+from common import fastapi_messages, report, timeit
+
+import parsers
+from lambda_function import parse_record
+
+NGINX = ('203.0.113.{n} - - [21/Feb/2025:10:00:01 +0000] "GET /api/users/{n}?page=2 HTTP/1.1" '
+         '200 {n}53 "https://example.com/" "Mozilla/5.0 (X11; Linux x86_64)"')
+APACHE = '198.51.100.{n} - - [21/Feb/2025:10:00:02 +0000] "POST /login HTTP/1.0" 401 -'
+KEY_VALUE = 'ts=2025-02-21T10:00:01Z level=info msg="request done" path=/api/users/{n} status=200 duration_ms={n}.5'
+VPC_FLOW = '2 123456789012 eni-0a1b2c3d 10.0.1.{n} 10.0.2.9 443 4915{d} 6 10 84{n} 1708509600 1708509660 ACCEPT OK'
+
+
+def corpus(template: str, lines: int):
+    return [template.format(n=i % 250, d=i % 10) for i in range(lines)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lines', type=int, default=10000)
+    args = parser.parse_args()
+
+    cases = [
+        ('json', 'json', fastapi_messages(args.lines)),
+        ('access_log (nginx)', 'access_log', corpus(NGINX, args.lines)),
+        ('access_log (apache)', 'access_log', corpus(APACHE, args.lines)),
+        ('key_value', 'key_value', corpus(KEY_VALUE, args.lines)),
+        ('vpc_flow', 'vpc_flow', corpus(VPC_FLOW, args.lines)),
+    ]
+
+    rows = []
+    for name, parser_name, lines in cases:
+        log_parser = parsers.PARSERS[parser_name]
+        selected = None if parser_name == 'json' else log_parser
+
+        def bare():
+            parse = log_parser.parse
+            for line in lines:
+                parse(line)
+
+        def with_parser():
+            for line in lines:
+                parse_record(line, selected)
+
+        def default_path():
+            for line in lines:
+                parse_record(line)
+
+        per_line = 1000 / len(lines)  # ms per batch -> us per line
+        rows.append({
+            'format': name,
+            'parser_us': timeit(bare)['median_ms'] * per_line,
+            'parse_record_us': timeit(with_parser)['median_ms'] * per_line,
+            'default_path_us': timeit(default_path)['median_ms'] * per_line,
+            'detected_as': parsers.detect_format(lines[:parsers.DETECTION_SAMPLE_SIZE]) or 'plain',
+        })
+
+    report(f"Parse cost per line ({args.lines} lines, median of 5, microseconds)", rows)
+
+
+if __name__ == '__main__':
+    main()
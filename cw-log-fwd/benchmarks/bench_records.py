@@ -0,0 +1,86 @@
+"""Memory and time of processing a batch into event dicts against slotted records.
+
+Compares, per batch size, from raw CloudWatch events to the serialized body:
+  dicts    - process_log_events, one full dict per event, then json.dumps
+  records  - process_log_records, dicts built one at a time while encoding
+
+Held memory is what the processed batch keeps alive until it is sent; peak
+covers processing plus serialization. Both are measured with tracemalloc,
+for JSON messages (FastAPI access logs) and for plain text lines.
+
+    python benchmarks/bench_records.py [--sizes 1000,10000,50000]
+"""
+import argparse
+import json
+import tracemalloc
+
+from common import fastapi_messages, report, timeit
+
+import lambda_function
+from records import materialize
+
+CONTEXT = {'log_group_name': '/aws/lambda/fastapi-demo', 'log_stream_name': 'app', 'aws_region': 'us-east-1'}
+
+
+def plain_messages(count: int):
+    return [f"GET /api/users/{i % 500} 200 {10 + i % 90}ms client=192.168.1.{i % 250}" for i in range(count)]
+
+
+def as_dicts(events):
+    return json.dumps(lambda_function.process_log_events(events, CONTEXT))
+
+
+def as_records(events):
+    return json.dumps(lambda_function.process_log_records(events, CONTEXT), default=materialize)
+
+
+def peak_kib(run, events) -> float:
+    tracemalloc.start()
+    try:
+        run(events)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def held_kib(process, events) -> float:
+    """Memory still held by the processed batch, before serialization"""
+    tracemalloc.start()
+    try:
+        batch = process(events, CONTEXT)
+        held = tracemalloc.get_traced_memory()[0]
+        del batch
+        return held / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    args = parser.parse_args()
+
+    rows = []
+    sources = (('json', fastapi_messages), ('plain', plain_messages))
+    for size in (int(s) for s in args.sizes.split(',')):
+        for source, messages in sources:
+            events = [{'id': str(i), 'timestamp': i, 'message': m} for i, m in enumerate(messages(size))]
+            assert json.loads(as_dicts(events)) == json.loads(as_records(events))
+            dicts = timeit(lambda: as_dicts(events))
+            records = timeit(lambda: as_records(events))
+            rows.append({
+                'messages': source,
+                'events': size,
+                'dicts_held_kib': held_kib(lambda_function.process_log_events, events),
+                'records_held_kib': held_kib(lambda_function.process_log_records, events),
+                'dicts_peak_kib': peak_kib(as_dicts, events),
+                'records_peak_kib': peak_kib(as_records, events),
+                'dicts_ms': dicts['median_ms'],
+                'records_ms': records['median_ms'],
+            })
+
+    report("Processed batch representation (median of 5)", rows)
+
+
+if __name__ == '__main__':
+    main()
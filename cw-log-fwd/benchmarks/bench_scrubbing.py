@@ -0,0 +1,55 @@
+"""Per-event cost of PII/secret scrubbing.
+
+Compares, on the parsed attributes of FastAPI access log events:
+  combined  - Scrubber, every rule in one compiled pattern
+  per_rule  - one pattern per rule applied to every string attribute
+
+    python benchmarks/bench_scrubbing.py [--events 10000]
+"""
+import argparse
+import copy
+import re
+
+from common import fastapi_messages, report, timeit
+
+import lambda_function
+from scrubbing import RULES, Scrubber, expand_rules
+
+CONTEXT = {'log_group_name': '/aws/lambda/fastapi-demo', 'log_stream_name': 'app', 'aws_region': 'us-east-1'}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=10000)
+    args = parser.parse_args()
+
+    events = [{'id': str(i), 'timestamp': i, 'message': m} for i, m in enumerate(fastapi_messages(args.events))]
+    # What the pipeline scrubs: each record's attributes, before the forwarder's fields are added
+    processed = [record.attributes for record in lambda_function.process_log_records(events, CONTEXT)]
+    scrubber = Scrubber(expand_rules(['all']))
+    separate = [re.compile(RULES[name]) for name in scrubber.rules]
+
+    def per_rule(batch):
+        for data in batch:
+            for key, value in data.items():
+                if isinstance(value, str):
+                    for pattern in separate:
+                        value = pattern.sub('[REDACTED]', value)
+                    data[key] = value
+
+    def combined(batch):
+        for data in batch:
+            scrubber.scrub_event(data)
+
+    # Scrubbing mutates events, so every timed run gets a fresh copy made beforehand
+    rows = []
+    for name, func in (('combined', combined), ('per_rule', per_rule)):
+        copies = [copy.deepcopy(processed) for _ in range(5)]
+        ms = timeit(lambda: func(copies.pop()), repeat=5)['median_ms']
+        rows.append({'mode': name, 'batch_ms': ms, 'us_per_event': ms * 1000 / args.events})
+
+    report(f"Scrubbing {args.events} events, {len(scrubber.rules)} rules (median of 5)", rows)
+
+
+if __name__ == '__main__':
+    main()
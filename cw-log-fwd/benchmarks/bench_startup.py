@@ -0,0 +1,82 @@
+"""Cold-start benchmark: module import time and time-to-first-send.
+
+Each sample runs in a fresh interpreter so nothing is cached between runs.
+Time-to-first-send covers interpreter-level import of the handler plus the
+first lambda_handler call against a local intake stand-in, with DD_API_KEY
+taken from the environment (no AWS calls).
+
+    python benchmarks/bench_startup.py [--runs 10]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from common import SRC_DIR, IntakeStub, report
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {src!r})
+{imports}
+imported = time.perf_counter()
+result = {{'import_ms': (imported - started) * 1000, 'boto3_loaded': 'boto3' in sys.modules}}
+if {send!r}:
+    sys.path.insert(0, {bench!r})
+    from common import MockContext, make_subscription_event
+    event = make_subscription_event(['first log line'])
+    import contextlib, io
+    with contextlib.redirect_stdout(io.StringIO()):
+        response = lambda_function.lambda_handler(event, MockContext())
+    result['first_send_ms'] = (time.perf_counter() - started) * 1000
+    result['status'] = response['statusCode']
+print(json.dumps(result))
+'''
+
+
+def run_child(imports: str, send: bool, env: dict) -> dict:
+    code = CHILD.format(src=SRC_DIR, imports=imports, send=send,
+                        bench=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    with IntakeStub() as intake:
+        env = dict(os.environ, DD_API_KEY='benchmark-key', DD_INTAKE_URL=intake.url,
+                   AWS_DEFAULT_REGION='us-east-1')
+        cases = [
+            ('import lambda_function', 'import lambda_function', False),
+            ('import health_check', 'import health_check', False),
+            ('import boto3 (reference)', 'import boto3', False),
+            ('import + first send', 'import lambda_function', True),
+        ]
+        rows = []
+        for name, imports, send in cases:
+            try:
+                samples = [run_child(imports, send, env) for _ in range(args.runs)]
+            except subprocess.CalledProcessError as e:
+                rows.append({'case': name, 'error': (e.stderr or '').strip().splitlines()[-1:]})
+                continue
+            key = 'first_send_ms' if send else 'import_ms'
+            values = [s[key] for s in samples]
+            rows.append({
+                'case': name,
+                'median_ms': statistics.median(values),
+                'min_ms': min(values),
+                'boto3_loaded': samples[0]['boto3_loaded'],
+            })
+
+    report(f"Startup ({args.runs} fresh interpreters per case)", rows,
+           ['case', 'median_ms', 'min_ms', 'boto3_loaded', 'error'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""Cost of reading each event's own timestamp, cached parser against datetime.
+
+Parses the "timestamp" of FastAPI access logs (ISO-8601, microseconds, "Z")
+to epoch milliseconds, per batch size:
+  cached     - timestamps.parse_iso8601, calendar arithmetic once per second
+  strptime   - datetime.strptime with an explicit format
+  isoformat  - datetime.fromisoformat, with "Z" rewritten as "+00:00" since
+               the python3.9 runtime does not accept it
+
+    python benchmarks/bench_timestamps.py [--sizes 1000,10000,50000]
+"""
+import argparse
+import json
+from datetime import datetime
+
+from common import fastapi_messages, report, timeit
+
+from timestamps import parse_iso8601
+
+
+def cached(values):
+    return [parse_iso8601(value) for value in values]
+
+
+def strptime(values):
+    return [int(datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z').timestamp() * 1000) for value in values]
+
+
+def isoformat(values):
+    return [int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000) for value in values]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,50000')
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        values = [json.loads(message)['timestamp'] for message in fastapi_messages(size)]
+        assert cached(values) == strptime(values) == isoformat(values)
+        row = {'events': size}
+        for name, parse in (('cached', cached), ('strptime', strptime), ('isoformat', isoformat)):
+            row[f'{name}_ms'] = timeit(lambda: parse(values))['median_ms']
+        row['cached_us_per_event'] = row['cached_ms'] * 1000 / size
+        rows.append(row)
+
+    report("Event timestamp parsing (median of 5)", rows)
+
+
+if __name__ == '__main__':
+    main()
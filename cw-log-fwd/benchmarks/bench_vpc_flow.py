@@ -0,0 +1,60 @@
+"""Bulk VPC flow log parsing against the generic per-event path.
+
+Compares, per batch size:
+  opaque   - build_records without a parser (lines forwarded as plain text)
+  generic  - build_records with the vpc_flow parser, one line at a time
+  bulk     - build_fixed_field_records, the batch fast path
+
+    python benchmarks/bench_vpc_flow.py [--sizes 100,1000,10000]
+"""
+import argparse
+
+from common import report, timeit
+
+import lambda_function
+from parsers import VPC_FLOW_PARSER
+from records import BatchContext
+
+CONTEXT = {'log_group_name': '/aws/vpc/flow-logs', 'log_stream_name': 'eni-0a1b2c3d-all', 'aws_region': 'us-east-1'}
+
+
+def flow_events(count: int):
+    events = []
+    for i in range(count):
+        if i % 50 == 49:
+            message = '2 123456789012 eni-0a1b2c3d - - - - - - - 1708509600 1708509660 - NODATA'
+        else:
+            action = 'REJECT' if i % 7 == 0 else 'ACCEPT'
+            message = (f"2 123456789012 eni-0a1b2c3d 10.0.{i % 256}.{i % 200} 10.0.2.9 "
+                       f"{1024 + i % 60000} 443 6 {1 + i % 40} {60 + i * 13 % 90000} "
+                       f"1708509600 1708509660 {action} OK")
+        events.append({'id': str(i), 'timestamp': 1708509600000 + i, 'message': message})
+    return events
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100,1000,10000')
+    args = parser.parse_args()
+
+    rows = []
+    for size in (int(s) for s in args.sizes.split(',')):
+        events = flow_events(size)
+        batch = BatchContext(CONTEXT)
+        opaque = timeit(lambda: lambda_function.build_records(events, batch, None))
+        generic = timeit(lambda: lambda_function.build_records(events, batch, VPC_FLOW_PARSER))
+        bulk = timeit(lambda: lambda_function.build_fixed_field_records(events, batch, VPC_FLOW_PARSER))
+        rows.append({
+            'events': size,
+            'opaque_ms': opaque['median_ms'],
+            'generic_ms': generic['median_ms'],
+            'bulk_ms': bulk['median_ms'],
+            'bulk_us_per_event': bulk['median_ms'] * 1000 / size,
+            'speedup_vs_generic': generic['median_ms'] / bulk['median_ms'],
+        })
+
+    report("VPC flow log batch processing (median of 5)", rows)
+
+
+if __name__ == '__main__':
+    main()
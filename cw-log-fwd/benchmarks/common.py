@@ -0,0 +1,170 @@
+"""Shared helpers for the forwarder benchmarks.
+
+The benchmarks use only the standard library so they can run anywhere the
+Lambda code runs. Run them from the cw-log-fwd directory, e.g.
+
+    python benchmarks/bench_startup.py
+"""
+import base64
+import gzip
+import http.server
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+
+SRC_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+
+class IntakeStub:
+    """Local stand-in for the Datadog logs intake.
+
+    Accepts POSTs on any path, records request sizes and answers with
+    `status`. Use as a context manager; `url` is the address to put in
+    DD_INTAKE_URL.
+    """
+
+    def __init__(self, status: int = 202, latency: float = 0.0):
+        self.status = status
+        self.latency = latency
+        self.requests: List[int] = []
+        self.bodies: List[bytes] = []
+        self.keep_bodies = False
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                with stub._lock:
+                    stub.requests.append(len(body))
+                    if stub.keep_bodies:
+                        stub.bodies.append(body)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/v2/logs"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self) -> 'IntakeStub':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MockContext:
+    invoked_function_arn = "arn:aws:lambda:us-east-1:123456789012:function:benchmark"
+    aws_request_id = "benchmark"
+
+    def __init__(self, timeout_ms: int = 300000):
+        self._deadline = time.monotonic() + timeout_ms / 1000
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self._deadline - time.monotonic()) * 1000)
+
+
+def make_subscription_event(messages: List[str], log_group: str = '/poc/dd-log',
+                            log_stream: str = '2025/02/21/[$LATEST]benchmark') -> Dict[str, Any]:
+    """Build a CloudWatch Logs subscription event carrying `messages`"""
+    now = int(time.time() * 1000)
+    data = {
+        "messageType": "DATA_MESSAGE",
+        "owner": "123456789012",
+        "logGroup": log_group,
+        "logStream": log_stream,
+        "subscriptionFilters": ["benchmark"],
+        "logEvents": [
+            {"id": str(i), "timestamp": now + i, "message": message}
+            for i, message in enumerate(messages)
+        ],
+    }
+    compressed = gzip.compress(json.dumps(data).encode('utf-8'))
+    return {"awslogs": {"data": base64.b64encode(compressed).decode('utf-8')}}
+
+
+def fastapi_messages(count: int) -> List[str]:
+    """JSON access logs shaped like the ones send_cloudwatch_logs.py produces"""
+    methods = ['GET', 'POST', 'PUT', 'DELETE']
+    paths = ['/api/users', '/api/orders', '/api/products', '/api/cart', '/api/checkout']
+    statuses = [200, 200, 200, 201, 204, 400, 404, 500]
+    messages = []
+    for i in range(count):
+        status_code = statuses[i % len(statuses)]
+        messages.append(json.dumps({
+            "timestamp": f"2025-02-21T10:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}000Z",
+            "level": "ERROR" if status_code >= 400 else "INFO",
+            "logger": "fastapi",
+            "path": paths[i % len(paths)],
+            "method": methods[i % len(methods)],
+            "status_code": status_code,
+            "trace_id": f"trace_{1000 + i % 9000}",
+            "request_id": f"req_{10000 + i % 90000}",
+            "response_time": 10 + (i * 37) % 990,
+            "client_ip": f"192.168.1.{1 + i % 255}",
+        }))
+    return messages
+
+
+def plain_messages(count: int) -> List[str]:
+    """Unstructured text lines"""
+    return [f"worker {i % 8} finished job {i} in {10 + i % 90}ms" for i in range(count)]
+
+
+def access_messages(count: int) -> List[str]:
+    """Common log format access lines"""
+    return [f'10.0.{i % 250}.{i % 200} - - [21/Feb/2025:10:{i // 60 % 60:02d}:{i % 60:02d} +0000] '
+            f'"GET /api/items/{i % 300} HTTP/1.1" {(200, 404)[i % 2]} {512 + i}' for i in range(count)]
+
+
+def timeit(func: Callable[[], Any], repeat: int = 5, number: int = 1) -> Dict[str, float]:
+    """Run `func` `number` times per sample and summarise the per-call milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - started) * 1000 / number)
+    return {
+        'min_ms': min(samples),
+        'median_ms': statistics.median(samples),
+        'max_ms': max(samples),
+    }
+
+
+def report(title: str, rows: List[Dict[str, Any]], columns: Optional[List[str]] = None) -> None:
+    """Print benchmark results as an aligned table"""
+    if not rows:
+        return
+    columns = columns or list(rows[0])
+    widths = {c: max(len(c), *(len(_fmt(r.get(c))) for r in rows)) for c in columns}
+    print(f"\n{title}")
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    print('  '.join('-' * widths[c] for c in columns))
+    for row in rows:
+        print('  '.join(_fmt(row.get(c)).ljust(widths[c]) for c in columns))
+
+
+def _fmt(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.4f}" if value < 10 else f"{value:.1f}"
+    return '' if value is None else str(value)
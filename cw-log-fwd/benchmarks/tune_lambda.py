@@ -0,0 +1,198 @@
+"""Memory-size tuning for the Lambda function: cost and latency per configuration.
+
+Replays a fixed corpus of subscription payloads through lambda_handler
+against a local intake stand-in, once per candidate memory size, each in a
+fresh interpreter with AWS_LAMBDA_FUNCTION_MEMORY_SIZE set so the memory
+budget and "auto" worker count behave as they would on Lambda. Other
+DD_FORWARDER_* settings are taken from the environment, so export the ones
+you deploy with before running it.
+
+Lambda gives a function CPU in proportion to its memory, one vCPU per
+1,769 MB. Each invocation's CPU time, measured here, is stretched by that
+share; the time spent waiting on the intake is not. CPU time includes any
+child processes the invocation waited for. An invocation whose resident
+memory peaked past the memory size would have been killed, and that size
+is marked infeasible. Duration is billed per millisecond per GB, plus a
+fee per request.
+
+The cheapest feasible size (or the cheapest within --max-latency-ms) is
+printed as Terraform variable values for the lambda module, with a timeout
+of --headroom times the slowest invocation.
+
+    python benchmarks/tune_lambda.py [--memory 128,256,512,1024,1769,3008]
+        [--batches 100,1000,5000] [--repeat 3] [--intake-latency 0.05]
+        [--cpu-factor 1.0] [--rate 1000] [--max-latency-ms 0]
+
+--cpu-factor scales the measured CPU time, for a host faster (above 1) or
+slower (below 1) than a Lambda vCPU. --rate is the expected events per
+second, for the concurrency each size would need.
+"""
+import argparse
+import contextlib
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Tuple
+
+from common import (
+    IntakeStub, MockContext, access_messages, fastapi_messages, make_subscription_event, plain_messages, report
+)
+
+# us-east-1 x86_64 prices
+PRICE_PER_GB_SECOND = 0.0000166667
+PRICE_PER_REQUEST = 0.0000002
+MB_PER_VCPU = 1769
+# Lambda's own limits on the timeout, in seconds
+MIN_TIMEOUT = 3
+MAX_TIMEOUT = 900
+
+
+KINDS = (('json', fastapi_messages), ('plain', plain_messages), ('access', access_messages))
+
+
+def corpus(batches: List[int]) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """The fixed payloads replayed for every memory size, each message kind at each batch size.
+
+    Each payload is built only when it is replayed, so earlier ones are not
+    resident while later ones run.
+    """
+    for kind, messages in KINDS:
+        for size in batches:
+            yield size, make_subscription_event(messages(size), log_group=f"/tune/{kind}")
+
+
+def cpu_seconds() -> float:
+    """CPU time of this process and of the child processes it has waited for"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def reset_peak_rss() -> bool:
+    """Restart the kernel's resident memory high-water mark; False where it cannot be (not Linux)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb(resettable: bool) -> float:
+    """Highest resident memory since reset_peak_rss(), or of the process so far where it cannot be reset"""
+    import memory
+
+    if resettable:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    return memory.max_rss_mb()
+
+
+def replay(batches: List[int], repeat: int) -> Dict[str, Any]:
+    """Child process body: run the corpus through the handler and measure each invocation"""
+    import lambda_function
+
+    invocations = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Warm up first, as a cold start is not what the memory size decides
+        lambda_function.lambda_handler(make_subscription_event(fastapi_messages(batches[0])), MockContext())
+        for count, event in corpus(batches):
+            samples = []
+            for _ in range(repeat):
+                resettable = reset_peak_rss()
+                cpu = cpu_seconds()
+                wall = time.perf_counter()
+                status = lambda_function.lambda_handler(event, MockContext())['statusCode']
+                samples.append((cpu_seconds() - cpu, time.perf_counter() - wall, status, peak_rss_mb(resettable)))
+            cpu_s, wall_s, status, _ = min(samples)
+            invocations.append({'events': count, 'cpu_ms': cpu_s * 1000, 'wait_ms': max(0.0, wall_s - cpu_s) * 1000,
+                                'status': status, 'rss_mb': max(sample[3] for sample in samples)})
+            # Let this payload go before the next one is built
+            del event
+    return {'invocations': invocations}
+
+
+def run_child(memory_mb: int, args: argparse.Namespace, env: Dict[str, str]) -> Dict[str, Any]:
+    command = [sys.executable, os.path.abspath(__file__), '--replay', '--batches', args.batches,
+               '--repeat', str(args.repeat)]
+    output = subprocess.run(command, env=dict(env, AWS_LAMBDA_FUNCTION_MEMORY_SIZE=str(memory_mb)),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def evaluate(memory_mb: int, result: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    """Simulated Lambda duration, cost and concurrency of one memory size"""
+    share = min(1.0, memory_mb / MB_PER_VCPU)
+    durations = [i['cpu_ms'] / args.cpu_factor / share + i['wait_ms'] for i in result['invocations']]
+    events = sum(i['events'] for i in result['invocations'])
+    cost = sum(memory_mb / 1024 * math.ceil(d) / 1000 * PRICE_PER_GB_SECOND + PRICE_PER_REQUEST for d in durations)
+    failed = sum(1 for i in result['invocations'] if i['status'] != 200)
+    max_rss_mb = max(i['rss_mb'] for i in result['invocations'])
+    return {
+        'memory_mb': memory_mb,
+        'vcpu': round(memory_mb / MB_PER_VCPU, 2),
+        'max_rss_mb': round(max_rss_mb, 1),
+        'feasible': max_rss_mb < memory_mb and not failed,
+        'mean_ms': sum(durations) / len(durations),
+        'max_ms': max(durations),
+        'usd_per_million_events': f"{cost / events * 1_000_000:.6f}",
+        # Instances busy at once to keep up with --rate events per second
+        'concurrency': math.ceil(args.rate * sum(durations) / 1000 / events) if args.rate else None,
+    }
+
+
+def recommend(rows: List[Dict[str, Any]], args: argparse.Namespace) -> None:
+    candidates = [row for row in rows if row['feasible']]
+    if args.max_latency_ms:
+        candidates = [row for row in candidates if row['max_ms'] <= args.max_latency_ms]
+    if not candidates:
+        print("\nNo candidate memory size fits the corpus"
+              + (f" within {args.max_latency_ms:g} ms" if args.max_latency_ms else ''))
+        return
+    best = min(candidates, key=lambda row: (float(row['usd_per_million_events']), row['max_ms']))
+    timeout = min(MAX_TIMEOUT, max(MIN_TIMEOUT, math.ceil(best['max_ms'] * args.headroom / 1000)))
+    print("\nRecommended lambda module variables:")
+    print(f"memory_size = {best['memory_mb']}")
+    print(f"timeout     = {timeout}")
+    if best['concurrency'] is not None:
+        print(f"# concurrency at {args.rate:g} events/s: about {best['concurrency']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--memory', default='128,256,512,1024,1769,3008')
+    parser.add_argument('--batches', default='100,1000,5000')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--intake-latency', type=float, default=0.05)
+    parser.add_argument('--cpu-factor', type=float, default=1.0)
+    parser.add_argument('--rate', type=float, default=0)
+    parser.add_argument('--max-latency-ms', type=float, default=0)
+    parser.add_argument('--headroom', type=float, default=3.0)
+    parser.add_argument('--replay', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    batches = [int(b) for b in args.batches.split(',')]
+
+    if args.replay:
+        print(json.dumps(replay(batches, args.repeat)))
+        return
+
+    rows = []
+    with IntakeStub(latency=args.intake_latency) as intake:
+        env = dict(os.environ, DD_API_KEY='benchmark-key', DD_INTAKE_URL=intake.url,
+                   AWS_DEFAULT_REGION='us-east-1')
+        for memory_mb in (int(m) for m in args.memory.split(',')):
+            rows.append(evaluate(memory_mb, run_child(memory_mb, args, env), args))
+
+    report(f"Simulated Lambda cost and latency, {len(batches) * 3} payloads of {args.batches} events "
+           f"(intake latency {args.intake_latency * 1000:g} ms)", rows,
+           ['memory_mb', 'vcpu', 'max_rss_mb', 'feasible', 'mean_ms', 'max_ms', 'usd_per_million_events']
+           + (['concurrency'] if args.rate else []))
+    recommend(rows, args)
+
+
+if __name__ == '__main__':
+    main()
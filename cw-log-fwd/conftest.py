@@ -3,3 +3,19 @@ import sys
 
 # Add src directory to Python path
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), 'src')))
+
+import pytest
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'perf: performance regression tests against perf_baseline.json')
+
+
+@pytest.fixture(autouse=True)
+def reset_health_check_cache():
+    """Health results are cached across invocations; start every test without one"""
+    yield
+    for name in ('health_check', 'src.health_check'):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.clear_cache()
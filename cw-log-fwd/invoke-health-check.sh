@@ -5,12 +5,14 @@ set -e
 ENVIRONMENT=${ENVIRONMENT:-"dev"}
 FUNCTION_NAME=${FUNCTION_NAME:-"datadog-forwarder-${ENVIRONMENT}"}
 REGION=${REGION:-"us-east-1"}
+# REFRESH=true skips the cached result
+REFRESH=${REFRESH:-"false"}
 
 # Invoke Lambda function with health check payload
 aws lambda invoke \
   --function-name "$FUNCTION_NAME" \
   --region $REGION \
-  --payload '{"healthCheck": true}' \
+  --payload "{\"healthCheck\": true, \"refresh\": ${REFRESH}}" \
   --cli-binary-format raw-in-base64-out \
   response.json
 
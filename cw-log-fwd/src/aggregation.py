@@ -0,0 +1,145 @@
+import bisect
+import re
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+# Datadog metric intake (v2 series) type. Every series is a COUNT, as counts
+# from separate invocations add up into correct totals; per-invocation
+# gauges such as an average or a percentile cannot be combined across them.
+COUNT = 1
+
+DEFAULT_PREFIX = 'cloudwatch.logs'
+
+# Upper bounds of the histogram buckets, suited to latencies in milliseconds
+DEFAULT_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_METRIC_NAME_RE = re.compile(r'[^A-Za-z0-9_.]')
+
+_CONFIG_KEYS = {'counters', 'histograms', 'buckets', 'group_by', 'drop_raw', 'prefix'}
+
+
+def get_field(event: Any, path: str) -> Any:
+    """Value at a dotted path such as "http.status_code", or None.
+
+    `event` is a dict or anything with a dict-like get(), such as a LogRecord.
+    """
+    key, _, rest = path.partition('.')
+    value = event.get(key)
+    if rest:
+        for key in rest.split('.'):
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+    return value
+
+
+def metric_name(*parts: str) -> str:
+    return '.'.join(_METRIC_NAME_RE.sub('_', part) for part in parts)
+
+
+class Aggregation:
+    """Turns a batch of processed events into a handful of metric series.
+
+    Counters count events per value of a field (e.g. status_code:500);
+    histograms summarize a numeric field (e.g. response_time) into
+    cumulative bucket counts tagged le:<bound> (le:inf for all of them), a
+    sample count and a sum. Bucket counts from any number of invocations
+    add up, so percentiles over any interval can be estimated from them,
+    and the average is sum / samples. Every series is tagged with the log
+    group and the values of the `group_by` fields. Events collapsed by the
+    dedup stage count `repeat_count` times.
+    """
+
+    def __init__(self, counters: Optional[List[str]] = None, histograms: Optional[List[str]] = None,
+                 group_by: Optional[List[str]] = None, drop_raw: bool = False, prefix: str = DEFAULT_PREFIX,
+                 buckets: Optional[List[float]] = None):
+        self.counters = list(counters or [])
+        self.histograms = list(histograms or [])
+        self.buckets = list(DEFAULT_BUCKETS if buckets is None else buckets)
+        self.group_by = list(group_by or [])
+        self.drop_raw = bool(drop_raw)
+        self.prefix = prefix
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], match: str = '') -> 'Aggregation':
+        """Build from a route's "aggregate" object"""
+        if not isinstance(config, dict):
+            raise ValueError(f"aggregate must be an object in route '{match}'")
+        unknown = set(config) - _CONFIG_KEYS
+        if unknown:
+            raise ValueError(f"Unknown aggregate settings {sorted(unknown)} in route '{match}'")
+        for key in ('counters', 'histograms', 'group_by'):
+            if not isinstance(config.get(key, []), list):
+                raise ValueError(f"aggregate.{key} must be a list in route '{match}'")
+        if not config.get('counters') and not config.get('histograms'):
+            raise ValueError(f"aggregate needs counters or histograms in route '{match}'")
+        buckets = config.get('buckets', DEFAULT_BUCKETS)
+        if not buckets or not isinstance(buckets, (list, tuple)) \
+                or not all(isinstance(b, (int, float)) and not isinstance(b, bool) for b in buckets) \
+                or any(a >= b for a, b in zip(buckets, buckets[1:])):
+            raise ValueError(f"aggregate.buckets must be a list of increasing numbers in route '{match}'")
+        return cls(**config)
+
+    def aggregate(self, events: List[Any], log_group: str,
+                  timestamp: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Build Datadog v2 series for one batch"""
+        timestamp = timestamp if timestamp is not None else int(time.time())
+        counters = self.counters
+        histograms = self.histograms
+        group_by = self.group_by
+        buckets = self.buckets
+
+        # group tags -> event count, {(field, value): count}, {field: [count, sum, per-bucket counts]}
+        groups: Dict[Tuple[str, ...], List[Any]] = {}
+        for event in events:
+            weight = event.get('repeat_count', 1)
+            key = tuple(f"{field}:{get_field(event, field)}" for field in group_by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = [0, defaultdict(int), {}]
+            group[0] += weight
+            for field in counters:
+                value = get_field(event, field)
+                if value is not None:
+                    group[1][(field, value)] += weight
+            for field in histograms:
+                value = get_field(event, field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    observed = group[2].get(field)
+                    if observed is None:
+                        observed = group[2][field] = [0, 0, [0] * len(buckets)]
+                    observed[0] += weight
+                    observed[1] += value * weight
+                    # The first bucket whose bound is at least the value; none past the last bound
+                    index = bisect.bisect_left(buckets, value)
+                    if index < len(buckets):
+                        observed[2][index] += weight
+
+        series = []
+        base_tags = [f"log_group:{log_group}"]
+
+        def add(name: str, metric_type: int, value: float, tags: List[str]) -> None:
+            series.append({
+                'metric': name,
+                'type': metric_type,
+                'points': [{'timestamp': timestamp, 'value': value}],
+                'tags': tags,
+            })
+
+        for key, (count, counted, observed) in groups.items():
+            tags = base_tags + list(key)
+            add(metric_name(self.prefix, 'events'), COUNT, count, tags)
+            for (field, value), field_count in counted.items():
+                add(metric_name(self.prefix, field, 'count'), COUNT, field_count, tags + [f"{field}:{value}"])
+            for field, (field_count, total, bucket_counts) in observed.items():
+                # Distinct from the counters' <field>.count, so a field can be both
+                add(metric_name(self.prefix, field, 'samples'), COUNT, field_count, tags)
+                add(metric_name(self.prefix, field, 'sum'), COUNT, total, tags)
+                name = metric_name(self.prefix, field, 'bucket')
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, bucket_counts):
+                    cumulative += bucket_count
+                    add(name, COUNT, cumulative, tags + [f"le:{bound:g}"])
+                add(name, COUNT, field_count, tags + ['le:inf'])
+        return series
@@ -0,0 +1,155 @@
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from records import SerializedEvents
+
+# Datadog accepts at most 1000 events and 5 MB per request; send_to_datadog
+# never exceeds either. Within them, each log group's request size adapts to
+# how the intake answers it and is kept across warm invocations: requests
+# shrink while the intake is slow (long tail latency, or a 413) and grow
+# while it is fast or answering 429, since smaller requests only mean more
+# of them. DD_FORWARDER_ADAPTIVE_BATCHING=false keeps requests at the limits.
+MAX_BATCH_EVENTS = 1000
+MAX_BATCH_BYTES = 5000000
+ADAPTIVE_BATCHING = os.environ.get('DD_FORWARDER_ADAPTIVE_BATCHING', 'true').lower() in ('true', '1', 'yes', 'on')
+# Request latency, in milliseconds, requests are sized to stay under
+TARGET_LATENCY_MS = float(os.environ.get('DD_FORWARDER_BATCH_TARGET_LATENCY', '1000'))
+# Smallest request adaptation may go down to, in bytes
+MIN_BATCH_BYTES = int(os.environ.get('DD_FORWARDER_BATCH_MIN_BYTES', '262144'))
+
+if not 0 < MIN_BATCH_BYTES <= MAX_BATCH_BYTES:
+    raise ValueError(f"DD_FORWARDER_BATCH_MIN_BYTES must be between 1 and {MAX_BATCH_BYTES}")
+
+# Status observed for a request that timed out unanswered; timeouts are
+# latency signals, unlike other errors
+TIMED_OUT = 408
+TIMEOUT_STATUSES = (TIMED_OUT, 504)
+
+# Weight of the newest request in the rolling averages
+SMOOTHING = 0.3
+# Share of recent requests answered 429 above which requests grow
+THROTTLE_THRESHOLD = 0.1
+GROWTH = 1.25
+# Log groups whose state is kept; the least recently sent to is forgotten first
+MAX_LOG_GROUPS = 1000
+
+
+class BatchSizer:
+    """Request size for one log group, from its rolling intake latency, 429 rate and event size"""
+
+    __slots__ = ('target_bytes', 'latency_ms', 'throttle_rate', 'bytes_per_event')
+
+    def __init__(self):
+        self.target_bytes = MAX_BATCH_BYTES
+        self.latency_ms: Optional[float] = None
+        self.throttle_rate = 0.0
+        self.bytes_per_event: Optional[float] = None
+
+    def limits(self) -> Tuple[int, int]:
+        """Most events and bytes to put in the next request"""
+        return self.target_events(), self.target_bytes
+
+    def target_events(self) -> int:
+        if not self.bytes_per_event:
+            return MAX_BATCH_EVENTS
+        return max(1, min(MAX_BATCH_EVENTS, int(self.target_bytes / self.bytes_per_event)))
+
+    def observe(self, events: int, size: int, latency_ms: float, status: int) -> None:
+        """Fold one request's outcome into the rolling averages and resize"""
+        throttled = status == 429
+        self.throttle_rate += SMOOTHING * (throttled - self.throttle_rate)
+        if events:
+            per_event = size / events
+            self.bytes_per_event = per_event if self.bytes_per_event is None else \
+                self.bytes_per_event + SMOOTHING * (per_event - self.bytes_per_event)
+
+        if status == 413:
+            # The intake's limit is below ours; stay well under what it refused
+            self._resize(min(self.target_bytes, size) / 2)
+            return
+        if status >= 400 and not throttled and status not in TIMEOUT_STATUSES:
+            # Other errors say nothing about the request size
+            return
+        if not throttled:
+            self.latency_ms = latency_ms if self.latency_ms is None else \
+                self.latency_ms + SMOOTHING * (latency_ms - self.latency_ms)
+
+        if self.throttle_rate > THROTTLE_THRESHOLD:
+            # Smaller requests would only raise the request rate being limited
+            self._resize(self.target_bytes * GROWTH)
+        elif self.latency_ms > TARGET_LATENCY_MS:
+            # Latency grows with the body; scale towards the target, at most halving at once
+            self._resize(self.target_bytes * max(0.5, TARGET_LATENCY_MS / self.latency_ms))
+        elif self.latency_ms < TARGET_LATENCY_MS / 2 and size >= self.target_bytes * 0.8:
+            # Only a full request shows that a larger one would still be fast
+            self._resize(self.target_bytes * GROWTH)
+
+    def _resize(self, target: float) -> None:
+        self.target_bytes = int(min(MAX_BATCH_BYTES, max(MIN_BATCH_BYTES, target)))
+
+
+class BatchSizers:
+    """Per-log-group sizers, shared by warm invocations of one instance"""
+
+    def __init__(self, adaptive: bool = ADAPTIVE_BATCHING, max_log_groups: int = MAX_LOG_GROUPS):
+        self.adaptive = adaptive
+        self.max_log_groups = max_log_groups
+        self.sizers: Dict[str, BatchSizer] = {}
+
+    def get(self, log_group: str) -> BatchSizer:
+        sizer = self.sizers.pop(log_group, None)
+        if sizer is None:
+            sizer = BatchSizer()
+            if len(self.sizers) >= self.max_log_groups:
+                del self.sizers[next(iter(self.sizers))]
+        # Reinserted so the dict stays in least recently used order
+        self.sizers[log_group] = sizer
+        return sizer
+
+    def limits(self, log_group: str) -> Tuple[int, int]:
+        if not self.adaptive:
+            return MAX_BATCH_EVENTS, MAX_BATCH_BYTES
+        return self.get(log_group).limits()
+
+    def observe(self, log_group: str, events: int, size: int, latency_ms: float, status: int) -> None:
+        if self.adaptive:
+            self.get(log_group).observe(events, size, latency_ms, status)
+
+
+def split_body(events: SerializedEvents, max_events: int, max_bytes: int) -> Iterator[Tuple[int, bytes]]:
+    """Request bodies for a batch as (event count, JSON array), each built only when it is sent.
+
+    A batch within the limits goes out as one body. A larger one is cut at
+    newlines, so each request copies its own slice of the encoded chunks and
+    the events are never split into separate lines.
+    """
+    if len(events) <= max_events and events.body_size() <= max_bytes:
+        yield len(events), events.body()
+        return
+    pieces: List[bytes] = []
+    count = 0
+    # The brackets of the array, then one comma or bracket per event
+    size = 1
+    for chunk in events.chunks:
+        if not chunk:
+            continue
+        start = position = 0
+        while position <= len(chunk):
+            newline = chunk.find(b'\n', position)
+            if newline == -1:
+                newline = len(chunk)
+            length = newline - position + 1
+            if count and (count >= max_events or size + length > max_bytes):
+                if position > start:
+                    pieces.append(chunk[start:position - 1])
+                yield count, b'[' + b','.join(piece.replace(b'\n', b',') for piece in pieces) + b']'
+                pieces, count, size, start = [], 0, 1, position
+            count += 1
+            size += length
+            position = newline + 1
+        pieces.append(chunk[start:])
+    if count:
+        yield count, b'[' + b','.join(piece.replace(b'\n', b',') for piece in pieces) + b']'
+
+
+sizers = BatchSizers()
@@ -0,0 +1,373 @@
+import os
+import signal
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from records import SerializedEvents
+
+# Opt-in: hold serialized events in the warm execution environment and send
+# them in fewer, larger requests. Every batch still held when the invocation
+# returns is also written to the spill store, so events held while the
+# environment is frozen survive it being recycled.
+BUFFER_ENABLED = os.environ.get('DD_FORWARDER_BUFFER', 'false').lower() in ('true', '1', 'yes', 'on')
+# Datadog accepts at most 1000 events and 5 MB per request
+BUFFER_MAX_EVENTS = int(os.environ.get('DD_FORWARDER_BUFFER_MAX_EVENTS', '1000'))
+BUFFER_MAX_BYTES = int(os.environ.get('DD_FORWARDER_BUFFER_MAX_BYTES', '4000000'))
+BUFFER_MAX_AGE = float(os.environ.get('DD_FORWARDER_BUFFER_MAX_AGE', '10'))
+# Flush when an invocation has less than this many milliseconds left
+BUFFER_DEADLINE_MARGIN = int(os.environ.get('DD_FORWARDER_BUFFER_DEADLINE_MARGIN', '2000'))
+# s3://bucket/prefix, shared by every instance; required with buffering on,
+# since a directory under /tmp is lost with the execution environment
+BUFFER_SPILL = os.environ.get('DD_FORWARDER_BUFFER_SPILL', '')
+# Seconds after which another instance's S3 spill file is taken over; the
+# store is listed again for such files once this long after the last listing
+BUFFER_ORPHAN_AGE = float(os.environ.get('DD_FORWARDER_BUFFER_ORPHAN_AGE', '900'))
+
+
+class LocalSpillStore:
+    """Spill files in a local directory, for tests and local runs.
+
+    Only one invocation runs in an environment at a time, so every file a
+    fresh buffer finds was left by an earlier runtime process of the same
+    environment and can be taken over at once.
+    """
+
+    shared = False
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, name: str, data: bytes) -> None:
+        # Written under a temporary name so a crash never leaves half a file
+        target = os.path.join(self.path, name)
+        with open(target + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def exists(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self.path, name))
+
+    def delete(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+    def delete_many(self, names: List[str]) -> None:
+        for name in names:
+            self.delete(name)
+
+    def list(self) -> List[Tuple[str, float]]:
+        """(name, modified time) of every spill file"""
+        return [
+            (entry.name, entry.stat().st_mtime)
+            for entry in os.scandir(self.path)
+            if entry.is_file() and not entry.name.endswith('.tmp')
+        ]
+
+
+class S3SpillStore:
+    """Spill files under an S3 prefix, shared by every instance of the function"""
+
+    shared = True
+
+    def __init__(self, url: str, client: Any = None):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        self.bucket = bucket
+        self.prefix = f"{prefix.rstrip('/')}/" if prefix else ''
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+        return self._client
+
+    def write(self, name: str, data: bytes) -> None:
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + name, Body=data)
+
+    def read(self, name: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + name)['Body'].read()
+
+    def exists(self, name: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + name)
+            return True
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def delete(self, name: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + name)
+
+    def delete_many(self, names: List[str]) -> None:
+        """Delete files in one request per 1000, the most DeleteObjects takes"""
+        for start in range(0, len(names), 1000):
+            objects = [{'Key': self.prefix + name} for name in names[start:start + 1000]]
+            errors = self.client.delete_objects(
+                Bucket=self.bucket, Delete={'Objects': objects, 'Quiet': True}
+            ).get('Errors')
+            if errors:
+                raise OSError(f"{len(errors)} spill files not deleted: {errors[0].get('Message')}")
+
+    def list(self) -> List[Tuple[str, float]]:
+        entries = []
+        for page in self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                entries.append((item['Key'][len(self.prefix):], item['LastModified'].timestamp()))
+        return entries
+
+
+class BufferedChunk:
+    """One invocation's serialized events for one intake URL, and its spill file"""
+
+    __slots__ = ('url', 'data', 'count', 'name', 'added_at', 'spilled')
+
+    def __init__(self, url: str, data: bytes, count: int, name: str, added_at: float, spilled: bool = False):
+        self.url = url
+        self.data = data
+        self.count = count
+        self.name = name
+        self.added_at = added_at
+        self.spilled = spilled
+
+
+def encode_chunk(url: str, data: bytes, count: int) -> bytes:
+    """Spill file contents: the intake URL and event count on one line each, then the events"""
+    return f"{url}\n{count}\n".encode('utf-8') + data
+
+
+def decode_chunk(raw: bytes) -> Tuple[str, int, bytes]:
+    url, count, data = raw.split(b'\n', 2)
+    return url.decode('utf-8'), int(count), data
+
+
+class EventBuffer:
+    """Serialized events held across warm invocations until a flush is due.
+
+    Delivery is at least once. add() only holds the events; persist(),
+    called before the invocation returns, writes the ones a flush did not
+    send to the spill store, so events sent by the invocation that added
+    them never cost a spill write. A spill file is deleted only after the
+    intake accepted its events, and a flush deletes its files together.
+    An environment that is recycled with events still buffered therefore
+    leaves them in the spill store. A later buffer sends them: with a local
+    store, the next runtime process of the same environment; with a shared
+    S3 store, any instance, once the file is older than `orphan_age`. The
+    store is listed again every `orphan_age`, so files orphaned after a
+    buffer started are still taken over. A failed or interrupted flush, or
+    an instance thawing after another took its files over, can send an
+    event twice; an event is never acknowledged without being sent or
+    spilled.
+    """
+
+    def __init__(self, store: Any, max_events: int = BUFFER_MAX_EVENTS, max_bytes: int = BUFFER_MAX_BYTES,
+                 max_age: float = BUFFER_MAX_AGE, deadline_margin: int = BUFFER_DEADLINE_MARGIN,
+                 orphan_age: float = BUFFER_ORPHAN_AGE, clock: Callable[[], float] = time.time):
+        self.store = store
+        self.max_events = max_events
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.deadline_margin = deadline_margin
+        self.orphan_age = orphan_age
+        self.clock = clock
+        # Spill files are named after the instance that wrote them
+        self.owner = uuid.uuid4().hex[:12]
+        self.chunks: List[BufferedChunk] = []
+        self.events = 0
+        self.bytes = 0
+        self._scanned_at: Optional[float] = None
+
+    def add(self, url: str, data: bytes, count: int) -> None:
+        """Buffer one batch of serialized events (JSON lines); see persist()"""
+        if not count:
+            return
+        self.recover()
+        now = self.clock()
+        name = f"buffer-{self.owner}-{int(now * 1000)}-{uuid.uuid4().hex[:8]}"
+        self._append(BufferedChunk(url, data, count, name, now))
+
+    def persist(self) -> int:
+        """Write buffered chunks not yet in the spill store; returns the events written.
+
+        Chunks that could not be written are taken out of the buffer before
+        the error is raised, so the caller can send them another way.
+        """
+        written = 0
+        try:
+            for chunk in self.chunks:
+                if not chunk.spilled:
+                    self.store.write(chunk.name, encode_chunk(chunk.url, chunk.data, chunk.count))
+                    chunk.spilled = True
+                    written += chunk.count
+        except Exception:
+            self._replace([chunk for chunk in self.chunks if chunk.spilled])
+            raise
+        return written
+
+    def _append(self, chunk: BufferedChunk) -> None:
+        self.chunks.append(chunk)
+        self.events += chunk.count
+        self.bytes += len(chunk.data)
+
+    def _replace(self, chunks: List[BufferedChunk]) -> None:
+        self.chunks = []
+        self.events = self.bytes = 0
+        for chunk in chunks:
+            self._append(chunk)
+
+    def recover(self) -> int:
+        """Take over spill files left by earlier runtimes; returns the events recovered.
+
+        Lists the store on first use and again once `orphan_age` has passed
+        since the last listing, when files too young before may be orphans.
+        """
+        now = self.clock()
+        if self._scanned_at is not None and now - self._scanned_at < self.orphan_age:
+            return 0
+        self._scanned_at = now
+        held = {chunk.name for chunk in self.chunks}
+        recovered = 0
+        try:
+            for name, modified in sorted(self.store.list(), key=lambda entry: entry[1]):
+                if not name.startswith('buffer-') or name.startswith(f"buffer-{self.owner}-") or name in held:
+                    continue
+                if self.store.shared and now - modified < self.orphan_age:
+                    continue
+                url, count, data = decode_chunk(self.store.read(name))
+                self._append(BufferedChunk(url, data, count, name, modified, spilled=True))
+                recovered += count
+        except Exception as e:
+            print(f"Error recovering buffered events from the spill store: {str(e)}")
+        if recovered:
+            print(f"Recovered {recovered} buffered events from the spill store")
+        return recovered
+
+    def oldest(self) -> Optional[float]:
+        return min(chunk.added_at for chunk in self.chunks) if self.chunks else None
+
+    def due(self, remaining_ms: Optional[int] = None) -> Optional[str]:
+        """Why the buffer should be flushed now, or None"""
+        if not self.chunks:
+            return None
+        if self.events >= self.max_events:
+            return 'events'
+        if self.bytes >= self.max_bytes:
+            return 'bytes'
+        if self.clock() - self.oldest() >= self.max_age:
+            return 'age'
+        if remaining_ms is not None and remaining_ms < self.deadline_margin:
+            return 'deadline'
+        return None
+
+    def _still_owned(self, chunk: BufferedChunk) -> bool:
+        # Held long enough that another instance may have taken the file over
+        if not self.store.shared or self.clock() - chunk.added_at < self.orphan_age:
+            return True
+        try:
+            return self.store.exists(chunk.name)
+        except Exception:
+            return True
+
+    def batches(self) -> List[Tuple[str, List[BufferedChunk]]]:
+        """Buffered chunks grouped per URL, in order, within the per-request limits"""
+        batches: List[Tuple[str, List[BufferedChunk]]] = []
+        open_batches: Dict[str, Tuple[List[BufferedChunk], List[int]]] = {}
+        for chunk in self.chunks:
+            current = open_batches.get(chunk.url)
+            if current is not None:
+                chunks, totals = current
+                if totals[0] + chunk.count > self.max_events or totals[1] + len(chunk.data) > self.max_bytes:
+                    current = None
+            if current is None:
+                current = open_batches[chunk.url] = ([], [0, 0])
+                batches.append((chunk.url, current[0]))
+            current[0].append(chunk)
+            current[1][0] += chunk.count
+            current[1][1] += len(chunk.data)
+        return batches
+
+    def flush(self, send: Callable[[str, SerializedEvents], bool]) -> Tuple[int, int]:
+        """Send everything buffered; returns (events sent, events still buffered).
+
+        `send(url, events)` returns whether the intake accepted the events.
+        Chunks that were not accepted stay buffered, and spilled once
+        persisted, for the next flush.
+        """
+        self.recover()
+        kept: List[BufferedChunk] = []
+        delivered: List[str] = []
+        sent = 0
+        for url, chunks in self.batches():
+            chunks = [chunk for chunk in chunks if self._still_owned(chunk)]
+            if not chunks:
+                continue
+            count = sum(chunk.count for chunk in chunks)
+            try:
+                accepted = send(url, SerializedEvents([chunk.data for chunk in chunks], count))
+            except Exception as e:
+                print(f"Error flushing buffered events to {url}: {str(e)}")
+                accepted = False
+            if not accepted:
+                kept.extend(chunks)
+                continue
+            sent += count
+            delivered.extend(chunk.name for chunk in chunks if chunk.spilled)
+
+        if delivered:
+            try:
+                self.store.delete_many(delivered)
+            except Exception as e:
+                # Sent again by whoever recovers them; at least once still holds
+                print(f"Error deleting {len(delivered)} spill files: {str(e)}")
+
+        kept.sort(key=lambda chunk: chunk.added_at)
+        self._replace(kept)
+        return sent, self.events
+
+
+def flush_on_shutdown(buffer: EventBuffer, send: Callable[[str, SerializedEvents], bool]) -> bool:
+    """Flush the buffer when the runtime receives SIGTERM.
+
+    Lambda only sends SIGTERM (with about 500 ms to act on it) to functions
+    with an extension registered; without one, events buffered at shutdown
+    are recovered from the spill store instead.
+    """
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handle(signum, frame):
+        try:
+            sent, kept = buffer.flush(send)
+            print(f"Flushed {sent} buffered events on shutdown, {kept} left in the spill store")
+        finally:
+            if callable(previous):
+                previous(signum, frame)
+            else:
+                raise SystemExit(0)
+
+    try:
+        signal.signal(signal.SIGTERM, handle)
+        return True
+    except ValueError:
+        # Not the main thread, e.g. under a test runner
+        return False
+
+
+def create_event_buffer() -> Optional[EventBuffer]:
+    """Build the buffer from the environment, or None when buffering is off"""
+    if not BUFFER_ENABLED:
+        return None
+    if not BUFFER_SPILL.startswith('s3://'):
+        raise ValueError("DD_FORWARDER_BUFFER needs DD_FORWARDER_BUFFER_SPILL set to s3://bucket/prefix")
+    return EventBuffer(S3SpillStore(BUFFER_SPILL))
+
+
+event_buffer = create_event_buffer()
@@ -0,0 +1,208 @@
+import os
+import re
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set
+
+# DD_FORWARDER_DEDUP=batch collapses runs of consecutive identical messages
+# within a batch; =window also suppresses repeats of a message forwarded less
+# than DD_FORWARDER_DEDUP_WINDOW seconds earlier, across warm invocations
+DEDUP_MODE = os.environ.get('DD_FORWARDER_DEDUP', 'off').lower()
+DEDUP_WINDOW = float(os.environ.get('DD_FORWARDER_DEDUP_WINDOW', '10'))
+# DD_FORWARDER_DEDUP_NORMALIZE=true also matches free-text lines differing
+# only in numbers and ids; JSON lines are always matched exactly, as their
+# numbers are usually the data (status codes, durations)
+DEDUP_NORMALIZE = os.environ.get('DD_FORWARDER_DEDUP_NORMALIZE', 'false').lower() in ('true', '1', 'yes', 'on')
+DEDUP_CACHE_SIZE = int(os.environ.get('DD_FORWARDER_DEDUP_CACHE_SIZE', '10000'))
+
+# Variable parts replaced before fingerprinting so near-identical lines match:
+# UUIDs, hex ids, IPv4 addresses and numbers
+_VARIABLE_RE = re.compile(
+    r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+    r'|0x[0-9a-fA-F]+'
+    r'|\b[0-9a-fA-F]{16,}\b'
+    r'|\d+(?:\.\d+)*'
+)
+
+
+def normalize(message: str) -> str:
+    """Replace variable tokens with a placeholder; JSON messages are returned unchanged"""
+    if message.lstrip().startswith(('{', '[')):
+        return message
+    return _VARIABLE_RE.sub('#', message)
+
+
+class _Entry:
+    __slots__ = ('log_group', 'forwarded_at', 'pending', 'first_pending', 'last_pending', 'sample')
+
+    def __init__(self, log_group: str, forwarded_at: int):
+        self.log_group = log_group
+        self.forwarded_at = forwarded_at
+        self.pending = 0
+        self.first_pending = 0
+        self.last_pending = 0
+        self.sample: Optional[Dict[str, Any]] = None
+
+
+def _collapsed(event: Dict[str, Any], count: int, first_timestamp: Any, last_timestamp: Any) -> Dict[str, Any]:
+    collapsed = dict(event)
+    collapsed['timestamp'] = first_timestamp
+    collapsed['repeat_count'] = count
+    collapsed['first_timestamp'] = first_timestamp
+    collapsed['last_timestamp'] = last_timestamp
+    return collapsed
+
+
+class Deduplicator:
+    """Collapses repeated messages into single events carrying a repeat_count.
+
+    Works on raw CloudWatch events ({"timestamp", "message"}), before
+    parsing, so collapsed copies are never parsed. Collapsed events get
+    repeat_count, first_timestamp and last_timestamp keys.
+
+    With a window, fingerprints of forwarded messages are kept in an LRU of
+    at most `max_entries` entries. Repeats inside the window are counted
+    rather than forwarded, and the count is sent as one collapsed event once
+    the window has passed (seen from a later batch of the same log group) or
+    when the entry is evicted. Counts evicted by another log group's batch,
+    and those of a group gone quiet once its window has passed, are held per
+    log group: the group's next batch carries them, and take_held() hands
+    them over for sending on their own. Counts still pending when the
+    execution environment is recycled are lost.
+    """
+
+    def __init__(self, window_seconds: float = 0.0, max_entries: int = DEDUP_CACHE_SIZE,
+                 normalize_messages: bool = DEDUP_NORMALIZE):
+        self.window_ms = int(window_seconds * 1000)
+        self.max_entries = max_entries
+        self.normalize_messages = normalize_messages
+        self._seen: 'OrderedDict[int, _Entry]' = OrderedDict()
+        self._pending: Dict[str, Set[int]] = {}
+        # Released counts waiting for a batch of their own log group
+        self._held: Dict[str, List[Dict[str, Any]]] = {}
+
+    def fingerprint(self, log_group: str, message: str) -> int:
+        if self.normalize_messages:
+            message = normalize(message)
+        return hash((log_group, message))
+
+    def collapse(self, log_events: List[Dict[str, Any]], log_group: str = '') -> List[Dict[str, Any]]:
+        """Return the events with runs of repeated messages collapsed"""
+        output: List[Dict[str, Any]] = self._held.pop(log_group, [])
+        run_event: Optional[Dict[str, Any]] = None
+        run_fingerprint = None
+        run_count = 0
+        last_timestamp = None
+        exact = not self.normalize_messages
+
+        for event in log_events:
+            message = event.get('message', '')
+            # Cheap check first: identical to the previous line
+            if run_event is not None and message == run_event.get('message', ''):
+                run_count += 1
+                last_timestamp = event.get('timestamp')
+                continue
+            fingerprint = hash((log_group, message)) if exact else self.fingerprint(log_group, message)
+            if fingerprint == run_fingerprint:
+                run_count += 1
+                last_timestamp = event.get('timestamp')
+                continue
+            if run_event is not None:
+                self._close_run(output, log_group, run_fingerprint, run_event, run_count, last_timestamp)
+            run_event, run_fingerprint, run_count = event, fingerprint, 1
+            last_timestamp = event.get('timestamp')
+
+        if run_event is not None:
+            self._close_run(output, log_group, run_fingerprint, run_event, run_count, last_timestamp)
+        if self.window_ms and log_events:
+            self._flush_expired(output, log_group, log_events[-1].get('timestamp') or 0)
+        return output
+
+    def _close_run(self, output: List[Dict[str, Any]], log_group: str, fingerprint: int,
+                   event: Dict[str, Any], count: int, last_timestamp: Any) -> None:
+        first_timestamp = event.get('timestamp')
+        if not self.window_ms:
+            output.append(event if count == 1 else _collapsed(event, count, first_timestamp, last_timestamp))
+            return
+
+        entry = self._seen.get(fingerprint)
+        if entry is not None and (first_timestamp or 0) - entry.forwarded_at < self.window_ms:
+            # Forwarded recently: count the run instead of sending it
+            if not entry.pending:
+                entry.first_pending = first_timestamp
+                entry.sample = event
+                self._pending.setdefault(log_group, set()).add(fingerprint)
+            entry.pending += count
+            entry.last_pending = last_timestamp
+            self._seen.move_to_end(fingerprint)
+            return
+
+        if entry is not None and entry.pending:
+            output.append(self._release(fingerprint, entry))
+        output.append(event if count == 1 else _collapsed(event, count, first_timestamp, last_timestamp))
+        self._remember(fingerprint, _Entry(log_group, first_timestamp or 0), output)
+
+    def _remember(self, fingerprint: int, entry: _Entry, output: List[Dict[str, Any]]) -> None:
+        self._seen[fingerprint] = entry
+        self._seen.move_to_end(fingerprint)
+        while len(self._seen) > self.max_entries:
+            evicted_fingerprint, evicted = self._seen.popitem(last=False)
+            # Never drop a pending count silently; only emit it into a batch of the same log group
+            if evicted.pending and evicted.log_group == entry.log_group:
+                output.append(self._release(evicted_fingerprint, evicted))
+            elif evicted.pending:
+                self._held.setdefault(evicted.log_group, []).append(self._release(evicted_fingerprint, evicted))
+
+    def _release(self, fingerprint: int, entry: _Entry) -> Dict[str, Any]:
+        collapsed = _collapsed(entry.sample, entry.pending, entry.first_pending, entry.last_pending)
+        entry.pending = 0
+        entry.sample = None
+        pending = self._pending.get(entry.log_group)
+        if pending is not None:
+            pending.discard(fingerprint)
+            if not pending:
+                del self._pending[entry.log_group]
+        return collapsed
+
+    def take_held(self, now: int) -> Dict[str, List[Dict[str, Any]]]:
+        """Counts waiting for another log group's batch, by log group, and forget them.
+
+        Counts of any group whose window has passed by `now` (epoch
+        milliseconds) are released first, so a group that went quiet does
+        not keep its suppressed lines.
+        """
+        for log_group in list(self._pending):
+            released: List[Dict[str, Any]] = []
+            self._flush_expired(released, log_group, now)
+            if released:
+                self._held.setdefault(log_group, []).extend(released)
+        held, self._held = self._held, {}
+        return held
+
+    def _flush_expired(self, output: List[Dict[str, Any]], log_group: str, now: int) -> None:
+        pending = self._pending.get(log_group)
+        if not pending:
+            return
+        for fingerprint in list(pending):
+            entry = self._seen.get(fingerprint)
+            if entry is None or not entry.pending:
+                pending.discard(fingerprint)
+                if not pending:
+                    del self._pending[log_group]
+            elif now - entry.forwarded_at >= self.window_ms:
+                output.append(self._release(fingerprint, entry))
+                # The released count restarts the window for this message
+                entry.forwarded_at = now
+
+
+def create_deduplicator() -> Optional[Deduplicator]:
+    """Build the deduplicator configured by DD_FORWARDER_DEDUP, or None when off"""
+    if DEDUP_MODE == 'batch':
+        return Deduplicator()
+    if DEDUP_MODE == 'window':
+        return Deduplicator(window_seconds=DEDUP_WINDOW)
+    if DEDUP_MODE not in ('off', 'false', ''):
+        raise ValueError(f"Unknown DD_FORWARDER_DEDUP mode '{DEDUP_MODE}'")
+    return None
+
+
+deduplicator = create_deduplicator()
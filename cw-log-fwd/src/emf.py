@@ -0,0 +1,125 @@
+import json
+import os
+import sys
+import time
+from typing import Dict, Any, List, Optional
+
+NAMESPACE = os.environ.get('DD_FORWARDER_METRICS_NAMESPACE', 'DatadogLogForwarder')
+
+# Every metric is emitted on every invocation so dashboards see a stable schema
+METRIC_UNITS = {
+    'EventsIn': 'Count',
+    'EventsOut': 'Count',
+    'EventsDropped': 'Count',
+    'BytesIn': 'Bytes',
+    'BytesOut': 'Bytes',
+    'CompressionRatio': 'None',
+    'Chunks': 'Count',
+    'Retries': 'Count',
+    'IntakeLatency': 'Milliseconds',
+    'SecretCacheHits': 'Count',
+    'ConnectionReuse': 'Count',
+    'SeriesOut': 'Count',
+    'EventsOverQuota': 'Count',
+    'EventsSpilled': 'Count',
+    # Over-quota spill writes that failed; their events were sampled instead
+    'SpillFailures': 'Count',
+    'EventsBuffered': 'Count',
+    'SinkFailures': 'Count',
+    'MaxRss': 'Megabytes',
+    'ProjectedMemory': 'Megabytes',
+    'StreamedBatches': 'Count',
+    'TargetBatchEvents': 'Count',
+    'TargetBatchBytes': 'Bytes',
+    'ThrottledRequests': 'Count',
+    # 1 when the invocation failed (returned a 5xx)
+    'Errors': 'Count',
+}
+
+# EMF allows at most 100 values per metric in one document
+MAX_VALUES_PER_METRIC = 100
+
+# Prefix of every line written by emit(); used to keep our own metrics out of
+# the forwarded stream when the forwarder's log group is itself subscribed
+EMF_PREFIX = '{"_aws":'
+
+
+def metrics_enabled() -> bool:
+    """Check whether EMF emission is enabled (on by default)"""
+    return os.environ.get('DD_FORWARDER_METRICS', 'true').lower() not in ('false', '0', 'no', 'off')
+
+
+def own_log_group() -> str:
+    """Log group this function writes to, empty outside Lambda"""
+    function_name = os.environ.get('AWS_LAMBDA_FUNCTION_NAME')
+    return os.environ.get('AWS_LAMBDA_LOG_GROUP_NAME') or (f"/aws/lambda/{function_name}" if function_name else '')
+
+
+def is_emf_line(message: str) -> bool:
+    """Check whether a log line is an EMF document, ours or another function's"""
+    return message.startswith(EMF_PREFIX)
+
+
+class InvocationMetrics:
+    """Collects forwarder metrics for one invocation and writes them as one EMF line"""
+
+    def __init__(self, log_group: str = ''):
+        self.log_group = log_group
+        self.values: Dict[str, Any] = dict.fromkeys(METRIC_UNITS, 0)
+        self.values['IntakeLatency'] = []
+        self.extra_units: Dict[str, str] = {}
+
+    def increment(self, name: str, value: float = 1) -> None:
+        self.values[name] += value
+
+    def set(self, name: str, value: float) -> None:
+        self.values[name] = value
+
+    def add_metric(self, name: str, unit: str, value: float) -> None:
+        """Add a metric outside the fixed schema, e.g. profiling stage timings"""
+        self.extra_units[name] = unit
+        self.values[name] = value
+
+    def record_payload(self, compressed_bytes: int, decompressed_bytes: int) -> None:
+        """Record the size of the subscription payload before and after gunzip"""
+        self.values['BytesIn'] = decompressed_bytes
+        if compressed_bytes:
+            self.values['CompressionRatio'] = round(decompressed_bytes / compressed_bytes, 3)
+
+    def record_latency(self, milliseconds: float) -> None:
+        latencies: List[float] = self.values['IntakeLatency']
+        if len(latencies) < MAX_VALUES_PER_METRIC:
+            latencies.append(round(milliseconds, 3))
+
+    def to_document(self, timestamp_ms: Optional[int] = None) -> Dict[str, Any]:
+        """Build the EMF document for this invocation"""
+        values = self.values
+        document = {
+            '_aws': {
+                'Timestamp': timestamp_ms if timestamp_ms is not None else int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': NAMESPACE,
+                    'Dimensions': [['LogGroup']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for units in (METRIC_UNITS, self.extra_units) for name, unit in units.items()],
+                }],
+            },
+            'LogGroup': self.log_group or 'unknown',
+        }
+        for name in METRIC_UNITS:
+            document[name] = values[name]
+        for name in self.extra_units:
+            document[name] = values[name]
+        return document
+
+    def emit(self) -> bool:
+        """Write the EMF line to stdout; skipped when it could feed back into the forwarder"""
+        if not metrics_enabled():
+            return False
+        # Metrics about our own log group would be written back into it and
+        # trigger another invocation, so they are never emitted
+        own_group = own_log_group()
+        if own_group and self.log_group == own_group:
+            return False
+
+        sys.stdout.write(json.dumps(self.to_document(), separators=(',', ':')) + '\n')
+        return True
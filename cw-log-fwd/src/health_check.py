@@ -1,12 +1,39 @@
+import concurrent.futures
 import json
 import os
-import boto3
+import re
+import socket
+import ssl
+import time
 import urllib.request
 import urllib.error
-from typing import Dict, Any, Tuple
+from datetime import datetime, timezone
+from typing import Dict, Any, Callable, Optional, Tuple
+from urllib.parse import urlsplit
 
-# Initialize AWS clients
-secrets_client = boto3.client('secretsmanager', region_name='us-east-1')
+import intake
+
+# Results are reused for this many seconds so the check is cheap enough to
+# run every minute; failures are kept for less time so recovery shows quickly.
+# {"healthCheck": true, "refresh": true} always runs the probes.
+HEALTH_CACHE_TTL = float(os.environ.get('DD_HEALTH_CHECK_TTL', '60'))
+HEALTH_FAILURE_TTL = float(os.environ.get('DD_HEALTH_CHECK_FAILURE_TTL', '10'))
+# Seconds each probe may take; probes run in parallel
+PROBE_TIMEOUT = float(os.environ.get('DD_HEALTH_CHECK_TIMEOUT', '3'))
+
+_cache: Optional[Dict[str, Any]] = None
+_cache_expires_at = 0.0
+
+# Created on first use so importing this module does not import boto3
+secrets_client = None
+
+def get_secrets_client():
+    """Get the Secrets Manager client, creating it on first use"""
+    global secrets_client
+    if secrets_client is None:
+        import boto3
+        secrets_client = boto3.client('secretsmanager', region_name='us-east-1')
+    return secrets_client
 
 def get_secret() -> Dict[str, str]:
     """Get secret from AWS Secrets Manager"""
@@ -15,7 +42,7 @@ def get_secret() -> Dict[str, str]:
         if not secret_arn:
             raise ValueError("DD_API_KEY_SECRET_ARN environment variable not set")
 
-        response = secrets_client.get_secret_value(SecretId=secret_arn)
+        response = get_secrets_client().get_secret_value(SecretId=secret_arn)
         secret = json.loads(response['SecretString'])
         return secret
     except Exception as e:
@@ -40,101 +67,176 @@ def get_api_key() -> str:
         raise ValueError(f"Failed to get API key: {str(e)}")
 
 def get_dd_url() -> str:
-    """Get the Datadog URL based on site configuration"""
+    """Get the Datadog logs intake URL the forwarder sends to"""
+    return intake.logs_url()
+
+def get_validate_url() -> str:
+    """Get the Datadog API key validation URL"""
     dd_site = os.environ.get('DD_SITE', 'datadoghq.com')
-    return f"https://http-intake.logs.{dd_site}/api/v2/logs"
+    return f"https://api.{dd_site}/api/v1/validate"
+
+def parse_version(version: str) -> Tuple[int, ...]:
+    """Numeric release parts of a version string: "1.26.0rc1" -> (1, 26, 0)"""
+    parts = []
+    for part in version.split('.'):
+        match = re.match(r'\d+', part)
+        if not match:
+            break
+        parts.append(int(match.group()))
+    return tuple(parts)
 
 def check_dependencies() -> Tuple[bool, list]:
     """Check if all required dependencies are installed with correct versions"""
+    import importlib.metadata
+
     required_packages = {
         'boto3': '1.20.0',
         'urllib3': '1.26.0'
     }
-    
+
     missing = []
     for package, min_version in required_packages.items():
+        # Read installed metadata instead of importing the package
         try:
-            import importlib
-            module = importlib.import_module(package)
-            if hasattr(module, '__version__'):
-                if module.__version__ < min_version:
-                    missing.append(f"{package} version {module.__version__} is lower than required {min_version}")
-        except ImportError:
+            version = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
             missing.append(f"{package} is not installed")
-    
+            continue
+        if parse_version(version) < parse_version(min_version):
+            missing.append(f"{package} version {version} is lower than required {min_version}")
+
     return len(missing) == 0, missing
 
-def check_datadog_access() -> Tuple[bool, str]:
-    """Check if we can access Datadog API."""
+def validate_api_key(api_key: str, timeout: float = PROBE_TIMEOUT) -> Tuple[bool, str]:
+    """Validate the API key against the Datadog API"""
+    request = urllib.request.Request(
+        get_validate_url(),
+        headers={
+            "DD-API-KEY": api_key,
+            "Content-Type": "application/json"
+        }
+    )
     try:
-        api_key = get_api_key()
-        dd_url = get_dd_url()
-        
-        # Test API access
-        url = f"https://api.{dd_url}/api/v1/validate"
-        request = urllib.request.Request(
-            url,
-            headers={
-                "DD-API-KEY": api_key,
-                "Content-Type": "application/json"
-            }
-        )
-        
-        with urllib.request.urlopen(request) as response:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
             if response.status == 200:
                 return True, "Successfully validated Datadog API key"
-            else:
-                return False, f"Failed to validate Datadog API key: HTTP {response.status}"
-                
+            return False, f"Failed to validate Datadog API key: HTTP {response.status}"
+    except urllib.error.HTTPError as e:
+        return False, f"Failed to validate Datadog API key: HTTP {e.code}"
+
+def check_intake(timeout: float = PROBE_TIMEOUT) -> Tuple[bool, str]:
+    """Resolve the intake host and complete a TLS handshake with it"""
+    parts = urlsplit(get_dd_url())
+    host = parts.hostname
+    https = parts.scheme == 'https'
+    started = time.perf_counter()
+    address = socket.getaddrinfo(host, parts.port or (443 if https else 80), type=socket.SOCK_STREAM)[0][4]
+    resolved = time.perf_counter()
+    with socket.create_connection(address[:2], timeout=timeout) as sock:
+        # A plain-HTTP DD_INTAKE_URL (a local stand-in) has no handshake to time
+        if not https:
+            return True, (f"Resolved {host} in {(resolved - started) * 1000:.1f}ms, "
+                          f"connected in {(time.perf_counter() - resolved) * 1000:.1f}ms")
+        with ssl.create_default_context().wrap_socket(sock, server_hostname=host):
+            handshake_done = time.perf_counter()
+    return True, (f"Resolved {host} in {(resolved - started) * 1000:.1f}ms, "
+                  f"TLS handshake in {(handshake_done - resolved) * 1000:.1f}ms")
+
+def _run_probe(probe: Callable[[], Tuple[bool, Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        ok, details = probe()
     except Exception as e:
-        error_msg = str(e)
-        if "DD_API_KEY_SECRET_ARN" in error_msg:
-            return False, "DD_API_KEY_SECRET_ARN environment variable not set"
-        elif "Access denied" in error_msg:
-            raise  # Re-raise Secrets Manager access errors
-        else:
-            return False, f"Failed to get API key or URL: {error_msg}"
+        ok, details = False, str(e)
+    return {
+        'status': 'ok' if ok else 'error',
+        'details': details,
+        'latency_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def run_probes(timeout: float = PROBE_TIMEOUT) -> Dict[str, Dict[str, Any]]:
+    """Run every probe in parallel, each bounded by `timeout` seconds"""
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=5, thread_name_prefix='health-probe')
+    try:
+        # The key is fetched once; the secret and validation probes share it
+        api_key = executor.submit(get_api_key)
+
+        def secret() -> Tuple[bool, str]:
+            api_key.result(timeout=timeout)
+            source = 'environment' if os.environ.get('DD_API_KEY') else 'Secrets Manager'
+            return True, f"DD_API_KEY available from {source}"
+
+        def datadog_access() -> Tuple[bool, str]:
+            return validate_api_key(api_key.result(timeout=timeout), timeout)
+
+        probes = {
+            'dependencies': check_dependencies,
+            'secret': secret,
+            'intake': lambda: check_intake(timeout),
+            'datadog_access': datadog_access,
+        }
+        futures = {name: executor.submit(_run_probe, probe) for name, probe in probes.items()}
+
+        deadline = time.monotonic() + timeout
+        checks = {}
+        for name, future in futures.items():
+            try:
+                checks[name] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except concurrent.futures.TimeoutError:
+                checks[name] = {
+                    'status': 'error',
+                    'details': f"Timed out after {timeout}s",
+                    'latency_ms': round(timeout * 1000, 1)
+                }
+        return checks
+    finally:
+        # Never wait for a probe that timed out
+        executor.shutdown(wait=False)
+
+def clear_cache() -> None:
+    """Forget the cached health result"""
+    global _cache, _cache_expires_at
+    _cache = None
+    _cache_expires_at = 0.0
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """Health check Lambda handler function."""
+    global _cache, _cache_expires_at
     try:
-        # Check dependencies
-        dependencies_status = check_dependencies()
-        
-        # Check Datadog access
-        datadog_status = check_datadog_access()
-        
-        # Combine all checks
-        all_checks = {
-            'dependencies': {
-                'status': 'ok' if dependencies_status[0] else 'error',
-                'details': dependencies_status[1]
-            },
-            'datadog_access': {
-                'status': 'ok' if datadog_status[0] else 'error',
-                'details': datadog_status[1]
+        if _cache is not None and not event.get('refresh') and time.monotonic() < _cache_expires_at:
+            return {
+                'statusCode': _cache['statusCode'],
+                'body': json.dumps({**_cache['body'], 'cached': True})
             }
-        }
-        
+
+        started = time.perf_counter()
+        all_checks = run_probes()
+
         # Determine overall status
         is_healthy = all(
-            check.get('status') == 'ok' 
+            check.get('status') == 'ok'
             for check in all_checks.values()
         )
-        
+
+        body = {
+            'status': 'ok' if is_healthy else 'error',
+            'checks': all_checks,
+            'error': None if is_healthy else next(
+                (details['details'] for details in all_checks.values()
+                 if details['status'] == 'error'),
+                'Unknown error'
+            ),
+            'checked_at': datetime.now(timezone.utc).isoformat(),
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1)
+        }
+        _cache = {'statusCode': 200 if is_healthy else 500, 'body': body}
+        _cache_expires_at = time.monotonic() + (HEALTH_CACHE_TTL if is_healthy else HEALTH_FAILURE_TTL)
+
         return {
-            'statusCode': 200 if is_healthy else 500,
-            'body': json.dumps({
-                'status': 'ok' if is_healthy else 'error',
-                'checks': all_checks,
-                'error': None if is_healthy else next(
-                    (details['details'] for details in all_checks.values() 
-                     if details['status'] == 'error'),
-                    'Unknown error'
-                )
-            })
+            'statusCode': _cache['statusCode'],
+            'body': json.dumps({**body, 'cached': False})
         }
-        
+
     except Exception as e:
         error_msg = f"Health check failed: {str(e)}"
         print(error_msg)
@@ -0,0 +1,146 @@
+import http.client
+import io
+import os
+import threading
+import urllib.error
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+# Seconds to wait on a single intake request
+INTAKE_TIMEOUT = 30
+
+# Datadog HTTP logs intake (v2); takes a JSON list of log objects
+LOGS_PATH = '/api/v2/logs'
+
+# Errors meaning a kept-alive connection was closed by the server while idle,
+# e.g. while the execution environment was frozen between invocations
+_STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.CannotSendRequest,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class IntakeResponse(NamedTuple):
+    status: int
+    body: bytes
+    reused: bool
+
+
+class IntakeClient:
+    """Keep-alive HTTP(S) connection to one intake URL.
+
+    urllib.request opens a new connection (DNS, TCP and TLS) for every
+    request; this client keeps one open across warm invocations so it can
+    also be opened ahead of time during the init phase. Failures are raised
+    as urllib.error exceptions so callers handle both transports the same way.
+    """
+
+    def __init__(self, url: str, timeout: float = INTAKE_TIMEOUT):
+        parts = urlsplit(url)
+        self.url = url
+        self.timeout = timeout
+        self._https = parts.scheme == 'https'
+        self._netloc = parts.netloc
+        self._path = parts.path or '/'
+        if parts.query:
+            self._path += '?' + parts.query
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def connect(self, timeout: Optional[float] = None) -> None:
+        """Open the connection now (DNS lookup, TCP connect and TLS handshake)"""
+        with self._lock:
+            self._connect(timeout)
+
+    def close(self) -> None:
+        with self._lock:
+            self._close()
+
+    def post(self, body: bytes, headers: Dict[str, str]) -> IntakeResponse:
+        """POST `body`, reusing the open connection and reconnecting once if it went stale"""
+        with self._lock:
+            # Covers connections opened by a warmup as well as by earlier requests
+            reused = self._conn is not None
+            try:
+                return self._post(body, headers)
+            except _STALE_CONNECTION_ERRORS as e:
+                self._close()
+                if not reused:
+                    raise urllib.error.URLError(e)
+            # The idle connection was dropped; retry once on a fresh one
+            try:
+                return self._post(body, headers)
+            except _STALE_CONNECTION_ERRORS as e:
+                self._close()
+                raise urllib.error.URLError(e)
+
+    def _post(self, body: bytes, headers: Dict[str, str]) -> IntakeResponse:
+        reused = self._conn is not None
+        if not reused:
+            self._connect()
+        try:
+            self._conn.request('POST', self._path, body=body, headers=headers)
+            response = self._conn.getresponse()
+            response_body = response.read()
+        except _STALE_CONNECTION_ERRORS:
+            raise
+        except (OSError, http.client.HTTPException) as e:
+            self._close()
+            raise urllib.error.URLError(e)
+
+        if response.will_close:
+            self._close()
+        if response.status >= 400:
+            raise urllib.error.HTTPError(self.url, response.status, response.reason,
+                                         response.headers, io.BytesIO(response_body))
+        return IntakeResponse(response.status, response_body, reused)
+
+    def _connect(self, timeout: Optional[float] = None) -> None:
+        if self._conn is not None:
+            return
+        conn_class = http.client.HTTPSConnection if self._https else http.client.HTTPConnection
+        conn = conn_class(self._netloc, timeout=timeout or self.timeout)
+        try:
+            conn.connect()
+        except OSError as e:
+            conn.close()
+            raise urllib.error.URLError(e)
+        # The connect timeout may be shorter than the one used for requests
+        if conn.sock is not None:
+            conn.sock.settimeout(self.timeout)
+        self._conn = conn
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+
+
+def logs_url(destination: Optional[str] = None) -> str:
+    """The logs intake URL for a destination, or for this function's DD_SITE.
+
+    A destination is either a full intake URL or a Datadog site. The
+    forwarder, its sinks and the health check all go through here, so they
+    always agree on the endpoint.
+    """
+    if destination and '://' in destination:
+        return destination
+    # DD_INTAKE_URL points the forwarder at a local intake stand-in for benchmarks
+    intake_url = os.environ.get('DD_INTAKE_URL')
+    if intake_url and not destination:
+        return intake_url
+    dd_site = destination or os.environ.get('DD_SITE', 'datadoghq.com')
+    return f"https://http-intake.logs.{dd_site}{LOGS_PATH}"
+
+
+_clients: Dict[str, IntakeClient] = {}
+
+
+def get_client(url: str) -> IntakeClient:
+    """Get the shared client for `url`, kept for the life of the execution environment"""
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = IntakeClient(url)
+    return client
@@ -1,15 +1,69 @@
 import base64
+import email.utils
 import gzip
 import json
 import os
-import urllib.request
+import random
+import socket
 import urllib.error
-import boto3
-from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional, Union
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple, Union
 
-# Initialize AWS clients
-secrets_client = boto3.client('secretsmanager', region_name='us-east-1')
+import batching
+import buffering
+import dedup
+import intake
+import memory
+import profiling
+import quotas
+import scrubbing
+import sinks
+from emf import InvocationMetrics, is_emf_line, own_log_group
+from parallel import PARALLEL_THRESHOLD, WORKER_TIME_SHARE, process_in_parallel, worker_count
+from parsers import DETECTION_SAMPLE_SIZE, FixedFieldParser, LogParser, select_parser
+from records import (
+    ERROR, JSON, PLAIN, STRUCTURED, BatchContext, LogRecord, SerializedEvents,
+    materialize, serialize_records
+)
+from routing import Route, resolve_route
+from timestamps import event_time
+from health_check import lambda_handler as health_check_handler
+
+# AWS clients are created on first use; importing boto3 dominates cold start
+# and is not needed at all when DD_API_KEY comes from the environment
+secrets_client = None
+
+# API key fetched from Secrets Manager, reused across warm invocations until
+# it expires so that key rotation is still picked up
+API_KEY_CACHE_TTL = int(os.environ.get('DD_API_KEY_CACHE_TTL', '3600'))
+_api_key_cache: Optional[str] = None
+_api_key_expires_at = 0.0
+
+# Optional init-phase warmup; see warm_up()
+WARMUP_ENABLED = os.environ.get('DD_FORWARDER_WARMUP', 'false').lower() in ('true', '1', 'yes', 'on')
+WARMUP_TIMEOUT = float(os.environ.get('DD_FORWARDER_WARMUP_TIMEOUT', '2'))
+
+# Processes used to parse large batches; see parallel.py
+PARSE_WORKERS = worker_count()
+
+# Tries per intake request; 429, 5xx and connection errors are retried with
+# doubling backoff, or after the Retry-After the intake asks for when that is
+# no longer than DD_FORWARDER_MAX_RETRY_AFTER seconds
+SEND_ATTEMPTS = int(os.environ.get('DD_FORWARDER_SEND_ATTEMPTS', '3'))
+SEND_RETRY_BACKOFF = 0.2
+MAX_RETRY_AFTER = float(os.environ.get('DD_FORWARDER_MAX_RETRY_AFTER', '10'))
+
+if SEND_ATTEMPTS < 1:
+    raise ValueError("DD_FORWARDER_SEND_ATTEMPTS must be at least 1")
+
+def get_secrets_client():
+    """Get the Secrets Manager client, creating it on first use"""
+    global secrets_client
+    if secrets_client is None:
+        import boto3
+        secrets_client = boto3.client('secretsmanager', region_name='us-east-1')
+    return secrets_client
 
 def get_secret() -> Dict[str, str]:
     """Get secret from AWS Secrets Manager"""
@@ -18,7 +72,7 @@ def get_secret() -> Dict[str, str]:
         raise ValueError("DD_API_KEY_SECRET_ARN environment variable is not set")
 
     try:
-        response = secrets_client.get_secret_value(SecretId=secret_arn)
+        response = get_secrets_client().get_secret_value(SecretId=secret_arn)
         if 'SecretString' in response:
             return json.loads(response['SecretString'])
         raise ValueError("Secret not found")
@@ -26,12 +80,19 @@ def get_secret() -> Dict[str, str]:
         print(f"Error retrieving secret: {str(e)}")
         raise ValueError(f"Failed to retrieve secret: {str(e)}")
 
-def get_api_key() -> str:
+def get_api_key(metrics: Optional[InvocationMetrics] = None) -> str:
     """Get the Datadog API key from AWS Secrets Manager"""
+    global _api_key_cache, _api_key_expires_at
+
     # First try environment variable for local development/testing
     api_key = os.environ.get('DD_API_KEY')
     if api_key:
         return api_key
+
+    if _api_key_cache and time.monotonic() < _api_key_expires_at:
+        if metrics:
+            metrics.increment('SecretCacheHits')
+        return _api_key_cache
     
     # If not in environment, get from Secrets Manager
     try:
@@ -39,90 +100,220 @@ def get_api_key() -> str:
         api_key = secrets.get('DD_API_KEY')
         if not api_key:
             raise ValueError("DD_API_KEY not found in secret")
+        _api_key_cache = api_key
+        _api_key_expires_at = time.monotonic() + API_KEY_CACHE_TTL
         return api_key
     except Exception as e:
         raise ValueError(f"DD_API_KEY not available: {str(e)}")
 
-def get_dd_url() -> str:
-    """Get the Datadog URL based on site configuration"""
-    dd_site = os.environ.get('DD_SITE', 'datadoghq.com')
-    return f"https://http-intake.logs.{dd_site}/v1/input"
+def get_dd_url(destination: Optional[str] = None) -> str:
+    """Get the Datadog logs intake URL for a route destination or DD_SITE"""
+    return intake.logs_url(destination)
+
+def get_metrics_url(destination: Optional[str] = None) -> str:
+    """Get the Datadog metrics intake URL for aggregated series"""
+    # Only a site destination says where metrics go; a full URL is a logs intake
+    site = destination if destination and '://' not in destination else None
+    # DD_METRICS_URL points aggregated metrics at a local stand-in
+    metrics_url = os.environ.get('DD_METRICS_URL')
+    if metrics_url and not site:
+        return metrics_url
+    dd_site = site or os.environ.get('DD_SITE', 'datadoghq.com')
+    return f"https://api.{dd_site}/api/v2/series"
+
+def parse_record(message: str, parser: Optional[LogParser] = None) -> Tuple[int, Optional[Dict[str, Any]]]:
+    """Parse a message into a record kind and its own attributes"""
+    if parser is not None:
+        attributes = parser.parse(message)
+        if attributes is not None:
+            return STRUCTURED, attributes
 
-def parse_message(message: str) -> Dict[str, Any]:
-    """Parse the log message and extract relevant fields."""
     try:
         data = json.loads(message)
-        # Add additional context that might be useful in Datadog
-        data['ddsource'] = 'cloudwatch'
-        data['ddtags'] = 'env:prod,source:cloudwatch,app_id:fastapi-demo,app_name:fastapi-demo-app'
-        data['service'] = 'cloudwatch-logs'
-        data['app_id'] = 'fastapi-demo'
-        data['app_name'] = 'fastapi-demo-app'
-        data['host'] = 'simulator'
-        data['aws'] = {
-            'logger': data.get('logger', 'fastapi'),
-            'log_group': data.get('log_group', ''),
-            'log_stream': data.get('log_stream', ''),
-        }
-        return data
     except json.JSONDecodeError:
-        # If message is not JSON, wrap it in a standard format
-        return {
-            "message": message,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "status": "info",
-            "logger": "cloudwatch",
-            "ddsource": "cloudwatch",
-            "ddtags": "env:prod,source:cloudwatch,app_id:fastapi-demo,app_name:fastapi-demo-app",
-            "service": "cloudwatch-logs",
-            "app_id": "fastapi-demo",
-            "app_name": "fastapi-demo-app",
-            "host": "simulator"
-        }
+        return PLAIN, None
+    if not isinstance(data, dict):
+        raise ValueError(f"JSON message is a {type(data).__name__}, not an object")
+    return JSON, data
 
-def process_log_events(log_events: List[Dict[str, Any]], context: Dict[str, str]) -> List[Dict[str, Any]]:
+def process_log_events(log_events: List[Dict[str, Any]], context: Dict[str, str],
+                       route: Optional[Route] = None) -> List[Dict[str, Any]]:
     """Process CloudWatch log events and format them for Datadog."""
-    processed_events = []
-    
+    return [record.to_dict() for record in process_log_records(log_events, context, route)]
+
+def process_log_records(log_events: List[Dict[str, Any]], context: Dict[str, str],
+                        route: Optional[Route] = None) -> List[LogRecord]:
+    """Process CloudWatch log events into compact records.
+
+    Records share one BatchContext for the CloudWatch metadata and the
+    route's service and tags; the full event dicts are only built while
+    serializing.
+    """
+    log_events, batch, parser = prepare_batch(log_events, context, route)
+    return build_batch(log_events, batch, parser)
+
+def process_log_batch(log_events: List[Dict[str, Any]], context: Dict[str, str], route: Optional[Route] = None,
+                      workers: int = 1, stream_chunk: int = 0, metrics: Optional[InvocationMetrics] = None,
+                      remaining_ms: Optional[int] = None) -> Union[List[LogRecord], SerializedEvents]:
+    """Process a batch, across `workers` processes when it is large enough.
+
+    Below PARALLEL_THRESHOLD events (after sampling and dedup) this is
+    process_log_records; above it the events come back already serialized.
+    Workers get WORKER_TIME_SHARE of `remaining_ms`, the invocation's time
+    left, before their chunks are built in-process instead.
+    With `stream_chunk` the batch is streamed instead; see stream_batch().
+    """
+    log_events, batch, parser = prepare_batch(log_events, context, route, metrics)
+    if stream_chunk:
+        return stream_batch(log_events, batch, parser, stream_chunk)
+    if workers < 2 or len(log_events) < PARALLEL_THRESHOLD:
+        return build_batch(log_events, batch, parser)
+    timeout = remaining_ms / 1000 * WORKER_TIME_SHARE if remaining_ms is not None else None
+    return process_in_parallel(log_events, lambda chunk: build_batch(chunk, batch, parser), workers, timeout)
+
+def prepare_batch(log_events: List[Dict[str, Any]], context: Dict[str, str], route: Optional[Route],
+                  metrics: Optional[InvocationMetrics] = None) -> Tuple[List[Dict[str, Any]], BatchContext, Optional[LogParser]]:
+    """Sample and collapse a batch, then pick its parser and shared context"""
+    if route is not None and route.sample_rate < 1.0:
+        rate = route.sample_rate
+        sampled = [event for event in log_events if random.random() < rate]
+        if metrics:
+            metrics.increment('EventsDropped', len(log_events) - len(sampled))
+        log_events = sampled
+
+    # Collapse repeated lines before paying to parse them
+    if dedup.deduplicator is not None:
+        log_events = dedup.deduplicator.collapse(log_events, context.get('log_group_name', ''))
+
+    batch, parser = batch_setup(log_events, context, route)
+    return log_events, batch, parser
+
+def batch_setup(log_events: List[Dict[str, Any]], context: Dict[str, str],
+                route: Optional[Route]) -> Tuple[BatchContext, Optional[LogParser]]:
+    """The parser and shared context of a batch"""
+    # Pick the format parser once per batch, not per event
+    if route is not None and route.parser_name is not None:
+        parser = route.parser
+    else:
+        parser = select_parser(
+            context.get('log_group_name', ''),
+            [event.get('message', '') for event in log_events[:DETECTION_SAMPLE_SIZE]]
+        )
+
+    batch = BatchContext(context, route.service if route else None, route.tags if route else None)
+    return batch, parser
+
+def build_batch(log_events: List[Dict[str, Any]], batch: BatchContext,
+                parser: Optional[LogParser]) -> List[LogRecord]:
+    """Parse prepared events into records and scrub them"""
+    if isinstance(parser, FixedFieldParser):
+        records = build_fixed_field_records(log_events, batch, parser)
+    else:
+        records = build_records(log_events, batch, parser)
+
+    # Redact before anything can leave the account, error events included
+    if scrubbing.scrubber is not None:
+        scrub_record = scrubbing.scrubber.scrub_record
+        for record in records:
+            scrub_record(record)
+    return records
+
+def stream_batch(log_events: List[Dict[str, Any]], batch: BatchContext, parser: Optional[LogParser],
+                 chunk_size: int) -> SerializedEvents:
+    """Build and serialize a prepared batch `chunk_size` events at a time.
+
+    Only one chunk of records is alive at once, and each event is released
+    from `log_events` once it is serialized, so peak memory is about the
+    serialized batch rather than the parsed one. Consumes `log_events`.
+    """
+    chunks = []
+    count = 0
+    sample = None
+    for start in range(0, len(log_events), chunk_size):
+        end = min(start + chunk_size, len(log_events))
+        records = build_batch(log_events[start:end], batch, parser)
+        if sample is None and records:
+            sample = records[0]
+        data, lines = serialize_records(records)
+        chunks.append(data)
+        count += lines
+        log_events[start:end] = [None] * (end - start)
+    return SerializedEvents(chunks, count, sample)
+
+def repeat_fields(event: Dict[str, Any]) -> Dict[str, Any]:
+    """The dedup stage's repeat count, carried onto the processed event"""
+    return {
+        'repeat_count': event['repeat_count'],
+        'first_timestamp': event['first_timestamp'],
+        'last_timestamp': event['last_timestamp']
+    }
+
+def build_fixed_field_records(log_events: List[Dict[str, Any]], batch: BatchContext,
+                              parser: FixedFieldParser) -> List[LogRecord]:
+    """Bulk path for fixed-field formats such as VPC flow logs.
+
+    The whole batch is parsed in one call and every record is built the same
+    way, with no per-event exception handling. Lines that are not valid
+    records go through the generic path.
+    """
+    messages = [event.get('message', '') for event in log_events]
+    parsed = parser.parse_batch(messages)
+
+    records = []
+    for event, message, attributes in zip(log_events, messages, parsed):
+        if attributes is None:
+            records.extend(build_records([event], batch, None))
+            continue
+        extra = repeat_fields(event) if 'repeat_count' in event else None
+        records.append(LogRecord(STRUCTURED, event.get('timestamp', ''), message, attributes, batch, extra))
+    return records
+
+def build_records(log_events: List[Dict[str, Any]], batch: BatchContext,
+                  parser: Optional[LogParser]) -> List[LogRecord]:
+    """Generic per-event path: parse each message on its own"""
+    records = []
+    # The forwarder's own EMF documents are never forwarded; other functions' EMF logs are
+    own_group = own_log_group()
+    skip_emf = bool(own_group) and batch.cloudwatch['log_group'] == own_group
+
     for event in log_events:
+        message = event.get('message', '')
+        timestamp = event.get('timestamp', '')
         try:
-            # Decode and parse the message
-            message = event.get('message', '')
-            parsed_data = parse_message(message)
-            
-            # Add CloudWatch metadata
-            parsed_data.update({
-                'timestamp': event.get('timestamp', ''),
-                'cloudwatch': {
-                    'log_group': context.get('log_group_name', ''),
-                    'log_stream': context.get('log_stream_name', ''),
-                    'aws_region': context.get('aws_region', '')
-                }
-            })
-            
-            processed_events.append(parsed_data)
-            
+            if skip_emf and is_emf_line(message):
+                continue
+            kind, attributes = parse_record(message, parser)
+            # The message's own time, not when CloudWatch ingested it
+            if attributes:
+                timestamp = event_time(attributes, timestamp)
+            extra = repeat_fields(event) if 'repeat_count' in event else None
+            # A JSON message is its attributes; "message" is only kept for other kinds
+            records.append(LogRecord(kind, timestamp, None if kind == JSON else message, attributes, batch, extra))
+
         except Exception as e:
             # If parsing fails, send the raw event with error context
-            processed_events.append({
-                'message': event.get('message', ''),
-                'timestamp': event.get('timestamp', ''),
-                'status': 'error',
-                'error': str(e),
-                'ddsource': 'cloudwatch',
-                'service': 'cloudwatch-logs',
-                'ddtags': 'env:prod,source:cloudwatch,error:parse_failure'
-            })
-    
-    return processed_events
+            records.append(LogRecord(ERROR, timestamp, message, {'error': str(e)}, batch))
+
+    return records
+
+def send_to_datadog(logs: Union[List[Union[Dict[str, Any], LogRecord]], SerializedEvents], metrics: Optional[InvocationMetrics] = None,
+                    dd_url: Optional[str] = None, log_group: str = '') -> Dict[str, Any]:
+    """Send logs to Datadog HTTP API using urllib.
 
-def send_to_datadog(logs: List[Dict[str, Any]]) -> Dict[str, Any]:
-    """Send logs to Datadog HTTP API using urllib."""
+    The batch goes out in requests sized for its log group by
+    batching.sizers, which learns from each request's latency and status.
+    A failed request is retried on its own; the ones already accepted are
+    not sent again. When one still fails after some were accepted, the
+    events not yet delivered go to the spill store, if there is one, so a
+    replay resumes from them rather than the whole batch being retried.
+    """
     api_key = get_api_key()
-    dd_url = get_dd_url()
+    dd_url = dd_url or get_dd_url()
 
     print(f"Sending {len(logs)} logs to Datadog at {dd_url}")
-    print(f"Sample log entry: {json.dumps(logs[0], indent=2)}")
+    sample = logs.sample if isinstance(logs, SerializedEvents) else logs[0]
+    if sample is not None:
+        print(f"Sample log entry: {json.dumps(sample, indent=2, default=materialize)}")
 
     try:
         headers = {
@@ -130,18 +321,36 @@ def send_to_datadog(logs: List[Dict[str, Any]]) -> Dict[str, Any]:
             'DD-API-KEY': api_key
         }
         
-        request = urllib.request.Request(
-            dd_url,
-            data=json.dumps(logs).encode('utf-8'),
-            headers=headers,
-            method='POST'
-        )
-        
-        with urllib.request.urlopen(request) as response:
-            return {
-                'statusCode': 200,
-                'body': json.dumps('Logs sent successfully')
-            }
+        with profiling.stage('serialize'):
+            if isinstance(logs, SerializedEvents):
+                events = logs
+            else:
+                # Records become dicts one at a time, each checked against the per-event limit
+                data, count = serialize_records(logs)
+                events = SerializedEvents([data], count)
+
+        delivered = 0
+        for count, body in batching.split_body(events, *batching.sizers.limits(log_group)):
+            try:
+                response = post_logs(dd_url, body, headers, count, log_group, metrics)
+            except urllib.error.URLError:
+                if delivered and spill_undelivered(events, delivered, log_group, metrics):
+                    return {
+                        'statusCode': 200,
+                        'body': json.dumps(f"Sent {delivered} logs, spilled {len(events) - delivered} for replay")
+                    }
+                raise
+            delivered += count
+            if metrics:
+                metrics.increment('Chunks')
+                metrics.increment('BytesOut', len(body))
+                metrics.increment('EventsOut', count)
+                if response.reused:
+                    metrics.increment('ConnectionReuse')
+        return {
+            'statusCode': 200,
+            'body': json.dumps('Logs sent successfully')
+        }
             
     except urllib.error.HTTPError as e:
         error_msg = f"HTTP Error sending logs to Datadog: {e.code} - {e.reason}"
@@ -169,26 +378,286 @@ def send_to_datadog(logs: List[Dict[str, Any]]) -> Dict[str, Any]:
             'body': json.dumps({'error': error_msg})
         }
 
-def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
-    """Main Lambda handler function."""
-    print(f"Received event: {json.dumps(event)}")
-    
-    # Handle health check
-    if event.get('healthCheck'):
-        from health_check import lambda_handler as health_check_handler
-        return health_check_handler(event, context)
+def post_logs(dd_url: str, body: bytes, headers: Dict[str, str], count: int, log_group: str,
+              metrics: Optional[InvocationMetrics] = None) -> intake.IntakeResponse:
+    """POST one request body, retrying it while the intake's answer allows; raises the last error"""
+    attempt = 0
+    while True:
+        started = time.perf_counter()
+        try:
+            with profiling.stage('network'):
+                response = intake.get_client(dd_url).post(body, headers)
+            observe_request(log_group, count, len(body), started, response.status, metrics)
+            return response
+        except urllib.error.HTTPError as e:
+            observe_request(log_group, count, len(body), started, e.code, metrics)
+            error = e
+        except urllib.error.URLError as e:
+            # A timeout is the slowest answer there is; socket.timeout is TimeoutError from Python 3.10
+            if isinstance(e.reason, socket.timeout):
+                observe_request(log_group, count, len(body), started, batching.TIMED_OUT, metrics)
+            error = e
+        delay = retry_delay(error, attempt)
+        attempt += 1
+        if delay is None or attempt == SEND_ATTEMPTS:
+            raise error
+        print(f"Retrying a request of {count} logs in {delay:.1f}s: {str(error)}")
+        if metrics:
+            metrics.increment('Retries')
+        time.sleep(delay)
 
-    # Process CloudWatch Logs
-    if 'awslogs' not in event:
+def retry_delay(error: urllib.error.URLError, attempt: int) -> Optional[float]:
+    """Seconds to wait before retrying a failed request, or None when it should not be retried"""
+    if isinstance(error, urllib.error.HTTPError):
+        # Rejected payloads and bad keys fail the same way every time
+        if error.code != 429 and error.code < 500:
+            return None
+        retry_after = error.headers.get('Retry-After') if error.headers else None
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time()
+                except (TypeError, ValueError):
+                    delay = None
+            if delay is not None:
+                return max(delay, 0.0) if delay <= MAX_RETRY_AFTER else None
+    return SEND_RETRY_BACKOFF * 2 ** attempt
+
+def spill_undelivered(events: SerializedEvents, delivered: int, log_group: str,
+                      metrics: Optional[InvocationMetrics] = None) -> bool:
+    """Keep the events after the first `delivered` in the spill store for replaySpill; False without one"""
+    store = quotas.quota_manager.spill_store
+    if store is None:
+        return False
+    try:
+        name = quotas.spill_lines(store, b'\n'.join(events.lines()[delivered:]), log_group)
+    except Exception as e:
+        print(f"Error spilling undelivered events from {log_group}: {str(e)}")
+        return False
+    print(f"Spilled {len(events) - delivered} undelivered events from {log_group} to {name}")
+    if metrics:
+        metrics.increment('EventsSpilled', len(events) - delivered)
+    return True
+
+def observe_request(log_group: str, count: int, size: int, started: float, status: int,
+                    metrics: Optional[InvocationMetrics] = None) -> None:
+    """Feed one intake request's outcome to the log group's batch sizer and report its new target"""
+    latency = (time.perf_counter() - started) * 1000
+    batching.sizers.observe(log_group, count, size, latency, status)
+    if metrics:
+        if status < 400:
+            metrics.record_latency(latency)
+        if status == 429:
+            metrics.increment('ThrottledRequests')
+        max_events, max_bytes = batching.sizers.limits(log_group)
+        metrics.set('TargetBatchEvents', max_events)
+        metrics.set('TargetBatchBytes', max_bytes)
+
+def send_metrics(series: List[Dict[str, Any]], metrics: Optional[InvocationMetrics] = None,
+                 metrics_url: Optional[str] = None) -> Dict[str, Any]:
+    """Send aggregated series to the Datadog metrics API."""
+    api_key = get_api_key()
+    metrics_url = metrics_url or get_metrics_url()
+
+    print(f"Sending {len(series)} metric series to Datadog at {metrics_url}")
+
+    try:
+        headers = {
+            'Content-Type': 'application/json',
+            'DD-API-KEY': api_key
+        }
+        body = json.dumps({'series': series}).encode('utf-8')
+        with profiling.stage('network'):
+            intake.get_client(metrics_url).post(body, headers)
+        if metrics:
+            metrics.increment('SeriesOut', len(series))
+        return {
+            'statusCode': 200,
+            'body': json.dumps('Metrics sent successfully')
+        }
+
+    except urllib.error.HTTPError as e:
+        error_msg = f"HTTP Error sending metrics to Datadog: {e.code} - {e.reason}"
+        print(error_msg)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': error_msg})
+        }
+
+    except Exception as e:
+        error_msg = f"Error sending metrics to Datadog: {str(e)}"
+        print(error_msg)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': error_msg})
+        }
+
+def deliver(logs: Union[List[Union[Dict[str, Any], LogRecord]], SerializedEvents],
+            metrics: Optional[InvocationMetrics] = None, dd_url: Optional[str] = None,
+            log_group: str = '') -> Dict[str, Any]:
+    """Send processed events to every configured sink, or to Datadog alone by default.
+
+    The batch is serialized once and shared by the sinks. The invocation
+    fails only when a required sink could not take every event; optional
+    sinks may still be sending when it returns.
+    """
+    if sinks.fan_out is None:
+        return send_to_datadog(logs, metrics, dd_url, log_group)
+
+    if isinstance(logs, SerializedEvents):
+        events = logs
+    else:
+        with profiling.stage('serialize'):
+            data, count = serialize_records(logs)
+            events = SerializedEvents([data], count, logs[0] if logs else None)
+    with profiling.stage('network'):
+        results = sinks.fan_out.deliver(events, log_group, dd_url or get_dd_url(), get_api_key)
+
+    failed = []
+    primary = next((sink.name for sink in sinks.fan_out.sinks if sink.kind == 'datadog'), None)
+    for sink, result in zip(sinks.fan_out.sinks, results):
+        if metrics:
+            # The first Datadog sink fills the standard delivery metrics
+            if sink.name == primary:
+                metrics.increment('Chunks', result.requests)
+                metrics.increment('BytesOut', result.bytes)
+                metrics.increment('EventsOut', result.events)
+                metrics.increment('Retries', result.retries)
+                metrics.increment('ConnectionReuse', result.reused)
+                for latency in result.latencies:
+                    metrics.record_latency(latency)
+                max_events, max_bytes = batching.sizers.limits(sink.sizer_key(log_group))
+                metrics.set('TargetBatchEvents', min(max_events, sink.max_events))
+                metrics.set('TargetBatchBytes', min(max_bytes, sink.max_bytes))
+            metrics.increment('SinkFailures', result.failed)
+            metrics.add_metric(f"Sink.{sink.name}.EventsOut", 'Count', result.events)
+            if result.pending:
+                metrics.add_metric(f"Sink.{sink.name}.Pending", 'Count', result.pending)
+        if result.failed and sink.required:
+            failed.append(f"{sink.name}: {result.error}")
+
+    if failed:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': f"Delivery failed for {'; '.join(failed)}"})
+        }
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"Logs delivered to {len(results)} sinks")
+    }
+
+def send_buffered(url: str, events: SerializedEvents, metrics: Optional[InvocationMetrics] = None) -> bool:
+    """Send one request's worth of buffered events; True when they were delivered"""
+    return deliver(events, metrics, url)['statusCode'] == 200
+
+def buffer_events(events: Union[List[Union[Dict[str, Any], LogRecord]], SerializedEvents],
+                  metrics: InvocationMetrics, dd_url: str, context: Any) -> Dict[str, Any]:
+    """Add a batch to the cross-invocation buffer and flush it when due.
+
+    Whatever the flush did not send is in the spill store before this
+    returns, so the invocation succeeds even when the flush fails; those
+    events go out with a later flush.
+    """
+    buffer = buffering.event_buffer
+    if isinstance(events, SerializedEvents):
+        data, count = b'\n'.join(chunk for chunk in events.chunks if chunk), len(events)
+    else:
+        data, count = serialize_records(events)
+    buffer.add(dd_url, data, count)
+
+    remaining_ms = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else None
+    reason = buffer.due(remaining_ms)
+    sent = 0
+    if reason is not None:
+        sent, _ = buffer.flush(lambda url, batch: send_buffered(url, batch, metrics))
+    try:
+        buffer.persist()
+    except Exception as e:
+        # Without the spill the events must not be held; send them now
+        print(f"Error spilling events to the buffer, sending directly: {str(e)}")
+        metrics.set('EventsBuffered', buffer.events)
+        return deliver(events, metrics, dd_url, metrics.log_group) if events else {
+            'statusCode': 200,
+            'body': json.dumps('No logs to forward')
+        }
+
+    if reason is None:
+        metrics.set('EventsBuffered', buffer.events)
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"Buffered {len(events)} events, {buffer.events} held")
+        }
+
+    kept = buffer.events
+    metrics.set('EventsBuffered', kept)
+    if kept:
+        print(f"{kept} buffered events could not be sent and stay in the spill store")
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"Flushed {sent} buffered events ({reason}), {kept} held")
+    }
+
+def replay_spill(request: Any, context: Any) -> Dict[str, Any]:
+    """Send a log group's spilled over-quota events, oldest spill file first.
+
+    A file is deleted once its events were delivered; the first failure
+    stops the replay and leaves that file and the later ones for the next
+    replay. Replayed events are not counted against the quota again.
+    """
+    log_group = request.get('logGroup') if isinstance(request, dict) else None
+    store = quotas.quota_manager.spill_store
+    if not log_group or store is None:
         return {
             'statusCode': 400,
-            'body': json.dumps('Invalid event format')
+            'body': json.dumps('replaySpill needs a logGroup, and DD_FORWARDER_SPILL_DEST must be set')
+        }
+
+    metrics = InvocationMetrics()
+    metrics.log_group = log_group
+    route = resolve_route(log_group)
+    dd_url = get_dd_url(route.destination) if route and route.destination else None
+    replayed = 0
+    try:
+        for name in quotas.spilled_files(store, log_group):
+            remaining_ms = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else None
+            if remaining_ms is not None and remaining_ms < buffering.BUFFER_DEADLINE_MARGIN:
+                break
+            data = gzip.decompress(store.read(name))
+            count = data.count(b'\n') + 1 if data else 0
+            if count:
+                response = deliver(SerializedEvents([data], count), metrics, dd_url, log_group)
+                if response['statusCode'] != 200:
+                    print(f"Replay of {name} failed after {replayed} events; it stays in the spill store")
+                    return response
+            store.delete(name)
+            replayed += count
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"Replayed {replayed} spilled events from {log_group}")
+        }
+    except Exception as e:
+        error_msg = f"Error replaying spilled events from {log_group}: {str(e)}"
+        print(error_msg)
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': error_msg})
         }
+    finally:
+        metrics.emit()
+
+def decode_log_data(data: str) -> Tuple[Dict[str, Any], int, int]:
+    """Decode a subscription payload: the log data, and its compressed and raw sizes"""
+    decoded_data = base64.b64decode(data)
+    decompressed_data = gzip.decompress(decoded_data)
+    return json.loads(decompressed_data), len(decoded_data), len(decompressed_data)
 
+def forward_logs(event: Dict[str, Any], context: Any, metrics: InvocationMetrics) -> Dict[str, Any]:
+    """Decode, process and send one awslogs payload; lambda_handler emits `metrics` whatever happens"""
     # Get API key
     try:
-        from health_check import get_api_key, get_dd_url
-        api_key = get_api_key()
+        api_key = get_api_key(metrics)
     except ValueError as e:
         print(f"Error getting API key: {str(e)}")
         return {
@@ -198,9 +667,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
     # Decode and decompress CloudWatch logs
     try:
-        decoded_data = base64.b64decode(event['awslogs']['data'])
-        decompressed_data = gzip.decompress(decoded_data)
-        log_data = json.loads(decompressed_data)
+        with profiling.stage('decode'):
+            log_data, compressed_size, raw_size = decode_log_data(event['awslogs']['data'])
     except Exception as e:
         error_msg = f"Error processing CloudWatch logs data: {str(e)}"
         print(error_msg)
@@ -214,17 +682,77 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     log_stream = log_data.get('logStream', '')
     aws_region = context.invoked_function_arn.split(':')[3] if context else ''
 
+    metrics.log_group = log_group
+    metrics.record_payload(compressed_size, raw_size)
+
+    # Resolved once per invocation; every event of a batch shares its log group
+    route = resolve_route(log_group)
+
     # Process log events
     try:
         log_events = log_data.get('logEvents', [])
-        processed_events = process_log_events(log_events, {
-            'log_group_name': log_group,
-            'log_stream_name': log_stream,
-            'aws_region': aws_region
-        })
+        metrics.set('EventsIn', len(log_events))
+        aggregation = route.aggregation if route else None
+        # Aggregation and quota sampling need the records, not serialized events
+        quota_policy = (route.quota if route else None) or quotas.quota_manager.default_policy
+        workers = PARSE_WORKERS if aggregation is None and quota_policy is None else 1
+        # Payloads projected to take the function past its memory budget are streamed
+        projected = memory.projected_mb(raw_size)
+        metrics.set('ProjectedMemory', round(projected, 1))
+        stream_chunk = 0
+        if memory.over_budget(projected):
+            if aggregation is None and quota_policy is None:
+                stream_chunk = memory.STREAM_CHUNK_EVENTS
+                metrics.set('StreamedBatches', 1)
+                print(f"Payload of {raw_size} bytes is projected to need {projected:.0f} MB, over the "
+                      f"{memory.MEMORY_BUDGET_MB:.0f} MB budget; streaming it")
+            else:
+                print(f"Payload of {raw_size} bytes is projected to need {projected:.0f} MB, over the "
+                      f"{memory.MEMORY_BUDGET_MB:.0f} MB budget, but aggregation and quotas need it in memory")
+        remaining_ms = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else None
+        with profiling.stage('parse'):
+            processed_events = process_log_batch(log_events, {
+                'log_group_name': log_group,
+                'log_stream_name': log_stream,
+                'aws_region': aws_region
+            }, route, workers, stream_chunk, metrics, remaining_ms)
+
+        if aggregation is not None and processed_events:
+            with profiling.stage('aggregate'):
+                series = aggregation.aggregate(processed_events, log_group)
+            metrics_response = send_metrics(series, metrics, get_metrics_url(route.destination))
+            # With raw events dropped the series are all that is left of the batch
+            if aggregation.drop_raw:
+                if metrics_response['statusCode'] != 200:
+                    return metrics_response
+                return {
+                    'statusCode': 200,
+                    'body': json.dumps(f"Aggregated {len(processed_events)} events into {len(series)} metric series")
+                }
+
+        # Keep a noisy log group from using up the intake rate limit for everyone
+        processed = len(processed_events)
+        processed_events, over_quota, spilled, spill_failures = quotas.quota_manager.admit(
+            log_group, processed_events, route.quota if route else None
+        )
+        metrics.set('EventsOverQuota', over_quota)
+        metrics.set('EventsSpilled', spilled)
+        metrics.set('SpillFailures', spill_failures)
+        # Over quota and neither sampled in nor spilled
+        metrics.increment('EventsDropped', processed - len(processed_events) - spilled)
+
+        dd_url = get_dd_url(route.destination) if route and route.destination else None
+        if buffering.event_buffer is not None:
+            return buffer_events(processed_events, metrics, dd_url or get_dd_url(), context)
+
+        if not processed_events:
+            return {
+                'statusCode': 200,
+                'body': json.dumps('No logs to forward')
+            }
         
-        # Send logs to Datadog
-        response = send_to_datadog(processed_events)
+        # Send logs to Datadog and any other sinks
+        response = deliver(processed_events, metrics, dd_url, log_group)
         return response
         
     except Exception as e:
@@ -234,3 +762,96 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 500,
             'body': json.dumps({'error': error_msg})
         }
+
+def forward_held_repeats(context: Any, metrics: InvocationMetrics) -> None:
+    """Send repeat counts dedup released for other log groups, each as a batch of its own group.
+
+    A failure is only logged: the counts summarize lines that were already
+    suppressed, and the invocation's own batch decides its status.
+    """
+    aws_region = context.invoked_function_arn.split(':')[3] if context else ''
+    for log_group, events in dedup.deduplicator.take_held(int(time.time() * 1000)).items():
+        try:
+            route = resolve_route(log_group)
+            # Already sampled and collapsed: straight to parsing
+            batch, parser = batch_setup(events, {'log_group_name': log_group, 'log_stream_name': '',
+                                                 'aws_region': aws_region}, route)
+            records = build_batch(events, batch, parser)
+            dd_url = get_dd_url(route.destination) if route and route.destination else None
+            response = deliver(records, metrics, dd_url, log_group)
+            if response['statusCode'] != 200:
+                print(f"Failed to send {len(events)} held repeat counts of {log_group}: {response['body']}")
+        except Exception as e:
+            print(f"Error sending held repeat counts of {log_group}: {str(e)}")
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Main Lambda handler function."""
+    print(f"Received event: {json.dumps(event)}")
+    
+    # Handle health check
+    if event.get('healthCheck'):
+        return health_check_handler(event, context)
+
+    # Send back events a quota spilled, e.g. once the log group is quiet again
+    if event.get('replaySpill'):
+        return replay_spill(event['replaySpill'], context)
+
+    # Process CloudWatch Logs
+    if 'awslogs' not in event:
+        return {
+            'statusCode': 400,
+            'body': json.dumps('Invalid event format')
+        }
+
+    metrics = InvocationMetrics()
+    profile = profiling.begin_invocation()
+    try:
+        response = forward_logs(event, context, metrics)
+        if dedup.deduplicator is not None and dedup.deduplicator.window_ms:
+            forward_held_repeats(context, metrics)
+        if response['statusCode'] >= 500:
+            metrics.increment('Errors')
+        return response
+
+    finally:
+        if profile:
+            result = profiling.end_invocation(getattr(context, 'aws_request_id', ''))
+            for name, milliseconds in result['stages_ms'].items():
+                metrics.add_metric(f"Stage{name.capitalize()}Time", 'Milliseconds', milliseconds)
+            for name, megabytes in result['stages_rss_mb'].items():
+                metrics.add_metric(f"Stage{name.capitalize()}MaxRss", 'Megabytes', megabytes)
+            for name, kilobytes in result.get('stages_peak_kb', {}).items():
+                metrics.add_metric(f"Stage{name.capitalize()}PeakMemory", 'Kilobytes', kilobytes)
+            if 'profile' in result:
+                print(f"Profile written to {result['profile']}")
+        metrics.set('MaxRss', round(memory.max_rss_mb(), 1))
+        metrics.emit()
+
+def warm_up(timeout: float = WARMUP_TIMEOUT) -> bool:
+    """Fetch the API key and open the intake connection before the first invocation.
+
+    Runs during the init phase, which has boosted CPU, so the first
+    invocation does not pay for the secret fetch, DNS lookup and TLS
+    handshake. Work happens on a daemon thread and init waits at most
+    `timeout` seconds for it; anything unfinished is simply redone on first use.
+    """
+    def run():
+        try:
+            get_api_key()
+            intake.get_client(get_dd_url()).connect(timeout=timeout)
+        except Exception as e:
+            print(f"Warmup failed: {str(e)}")
+
+    thread = threading.Thread(target=run, name='forwarder-warmup', daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        print(f"Warmup did not finish within {timeout}s; continuing init")
+        return False
+    return True
+
+if WARMUP_ENABLED:
+    warm_up()
+
+if buffering.event_buffer is not None:
+    buffering.flush_on_shutdown(buffering.event_buffer, send_buffered)
@@ -0,0 +1,45 @@
+import os
+import resource
+from typing import Optional
+
+# A subscription payload is processed by streaming when the memory it is
+# projected to need would take the function past its budget: events are
+# parsed and serialized a chunk at a time, so only one chunk of parsed
+# records is alive at once. The budget defaults to 80% of the function's
+# memory size; 0 turns the guardrail off.
+_FUNCTION_MEMORY_MB = int(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '0') or 0)
+MEMORY_BUDGET_MB = float(os.environ.get('DD_FORWARDER_MEMORY_BUDGET', '') or _FUNCTION_MEMORY_MB * 0.8)
+# Peak bytes allocated per byte of decompressed payload on the in-memory
+# path: measured with tracemalloc at about 12 for JSON and 18 for plain text
+# messages (see benchmarks/bench_memory.py)
+MEMORY_PER_BYTE = float(os.environ.get('DD_FORWARDER_MEMORY_PER_BYTE', '16'))
+# Events parsed and serialized at a time on the streaming path
+STREAM_CHUNK_EVENTS = int(os.environ.get('DD_FORWARDER_STREAM_CHUNK', '1000'))
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def max_rss_mb() -> float:
+    """Highest resident memory of this process so far, in MB"""
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb() -> float:
+    """Resident memory of this process now, in MB; the high-water mark where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, ValueError, IndexError):
+        return max_rss_mb()
+
+
+def projected_mb(raw_bytes: int, per_byte: float = MEMORY_PER_BYTE) -> float:
+    """Memory the process is expected to reach processing `raw_bytes` of decompressed payload in memory"""
+    return current_rss_mb() + raw_bytes * per_byte / 2**20
+
+
+def over_budget(projected: float, budget: Optional[float] = None) -> bool:
+    """Whether a payload projected to need `projected` MB should take the streaming path"""
+    budget = MEMORY_BUDGET_MB if budget is None else budget
+    return budget > 0 and projected > budget
@@ -0,0 +1,118 @@
+import math
+import multiprocessing
+import multiprocessing.connection
+import os
+import time
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from records import LogRecord, SerializedEvents, serialize_records
+
+# Large batches can be split across worker processes so parsing uses every
+# vCPU of a large function (Lambda gives one vCPU per 1,769 MB). Off unless
+# DD_FORWARDER_PARALLEL_WORKERS is a count or "auto"; batches smaller than the
+# threshold are always processed in-process, where forking costs more than it saves.
+PARALLEL_WORKERS = os.environ.get('DD_FORWARDER_PARALLEL_WORKERS', '0')
+PARALLEL_THRESHOLD = int(os.environ.get('DD_FORWARDER_PARALLEL_THRESHOLD', '5000'))
+
+# Lambda memory per vCPU
+MB_PER_VCPU = 1769
+
+# Share of the invocation's remaining time that workers get before they are
+# terminated; the rest is left to build their chunks in-process and send them
+WORKER_TIME_SHARE = 0.5
+
+
+def worker_count(setting: str = PARALLEL_WORKERS) -> int:
+    """Processes to use for a large batch, the invoking one included; 1 means in-process only"""
+    if setting.lower() == 'auto':
+        memory = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+        if memory:
+            return max(1, math.ceil(int(memory) / MB_PER_VCPU))
+        return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+    try:
+        return max(1, int(setting))
+    except ValueError:
+        raise ValueError(f"DD_FORWARDER_PARALLEL_WORKERS must be a number or auto, not {setting!r}")
+
+
+def _work(conn: Any, build: Callable[[List[Dict[str, Any]]], List[LogRecord]],
+          events: List[Dict[str, Any]]) -> None:
+    """Worker process body: build one chunk and send it back serialized"""
+    try:
+        data, count = serialize_records(build(events))
+        conn.send_bytes(b'%d\n' % count + data)
+    except BaseException:
+        conn.send_bytes(b'!' + traceback.format_exc().encode('utf-8'))
+    finally:
+        conn.close()
+
+
+def process_in_parallel(events: List[Dict[str, Any]], build: Callable[[List[Dict[str, Any]]], List[LogRecord]],
+                        workers: int, timeout: Optional[float] = None) -> SerializedEvents:
+    """Split `events` into `workers` contiguous chunks and build them concurrently.
+
+    The first chunk is built by the calling process; the others by forked
+    processes that inherit `build` and their chunk, so nothing is pickled on
+    the way in, and that send their output back over a pipe already encoded
+    as JSON lines.
+    multiprocessing.Pool and Queue need /dev/shm, which Lambda lacks; plain
+    Process and Pipe do not. A chunk whose worker cannot be started or fails
+    is built in-process, so the batch is never lost to the parallel path.
+    Workers still running `timeout` seconds after the call started, e.g.
+    one stuck on a lock a thread held when it was forked, are terminated
+    and their chunks built in-process too.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    size = math.ceil(len(events) / workers)
+    parts = [events[i:i + size] for i in range(0, len(events), size)]
+    context = multiprocessing.get_context('fork')
+
+    running = {}
+    for index, part in enumerate(parts[1:], 1):
+        try:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(target=_work, args=(sender, build, part), daemon=True)
+            process.start()
+            sender.close()
+            running[receiver] = (index, process)
+        except OSError as e:
+            print(f"Could not start a parsing worker, building chunk {index} in-process: {str(e)}")
+
+    # The calling process does its share while the workers run
+    first = build(parts[0])
+    chunks: List[Optional[bytes]] = [None] * len(parts)
+    counts = [0] * len(parts)
+    chunks[0], counts[0] = serialize_records(first)
+
+    while running:
+        remaining = max(0.0, deadline - time.monotonic()) if deadline is not None else None
+        ready = multiprocessing.connection.wait(list(running), remaining)
+        if not ready:
+            for receiver, (index, process) in running.items():
+                print(f"Parsing worker for chunk {index} did not finish within {timeout:.1f}s, "
+                      f"building it in-process")
+                process.terminate()
+                process.join()
+                receiver.close()
+            break
+        for receiver in ready:
+            index, process = running.pop(receiver)
+            try:
+                data = receiver.recv_bytes()
+            except EOFError:
+                data = b'!worker exited without a result'
+            receiver.close()
+            process.join()
+            if data.startswith(b'!'):
+                print(f"Parsing worker for chunk {index} failed, building it in-process: "
+                      f"{data[1:].decode('utf-8', 'replace')}")
+                continue
+            count, _, chunks[index] = data.partition(b'\n')
+            counts[index] = int(count)
+
+    for index, chunk in enumerate(chunks):
+        if chunk is None:
+            chunks[index], counts[index] = serialize_records(build(parts[index]))
+
+    return SerializedEvents(chunks, sum(counts), first[0] if first else None)
@@ -0,0 +1,342 @@
+import fnmatch
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+
+class LogParser:
+    """Turns one raw log line into structured attributes, or None if it does not match"""
+
+    def __init__(self, name: str, parse: Callable[[str], Optional[Dict[str, Any]]],
+                 detect: Optional[Callable[[str], bool]] = None):
+        self.name = name
+        self.parse = parse
+        self._detect = detect
+
+    def detect(self, line: str) -> bool:
+        """Check whether `line` looks like this format"""
+        if self._detect is not None:
+            return self._detect(line)
+        return self.parse(line) is not None
+
+    def __repr__(self) -> str:
+        return f"LogParser({self.name!r})"
+
+
+def _status_from_http(status_code: int) -> str:
+    if status_code >= 500:
+        return 'error'
+    if status_code >= 400:
+        return 'warn'
+    return 'info'
+
+
+_INT_RE = re.compile(r'-?\d{1,18}\Z')
+_FLOAT_RE = re.compile(r'-?\d+\.\d+\Z')
+
+
+def _number(value: str) -> Any:
+    if _INT_RE.match(value):
+        return int(value)
+    if _FLOAT_RE.match(value):
+        return float(value)
+    return value
+
+
+# nginx "combined" and Apache common/combined access logs
+_ACCESS_LOG_RE = re.compile(
+    r'(?P<client_ip>\S+) \S+ (?P<user>\S+) \[(?P<time>[^\]]+)\] '
+    r'"(?:(?P<method>[A-Z]+) (?P<url>\S+)(?: (?P<protocol>[^"]*))?|[^"]*)" '
+    r'(?P<status>\d{3}) (?P<bytes>\d+|-)'
+    r'(?: "(?P<referer>[^"]*)" "(?P<agent>[^"]*)")?'
+)
+
+
+def parse_access_log(line: str) -> Optional[Dict[str, Any]]:
+    match = _ACCESS_LOG_RE.match(line)
+    if match is None:
+        return None
+    status_code = int(match.group('status'))
+    http = {
+        'method': match.group('method'),
+        'url': match.group('url'),
+        'version': match.group('protocol'),
+        'status_code': status_code,
+    }
+    if match.group('referer') is not None:
+        http['referer'] = match.group('referer')
+        http['useragent'] = match.group('agent')
+    size = match.group('bytes')
+    attributes = {
+        'status': _status_from_http(status_code),
+        'http': http,
+        'network': {
+            'client': {'ip': match.group('client_ip')},
+            'bytes_written': int(size) if size != '-' else 0,
+        },
+        'access_time': match.group('time'),
+    }
+    user = match.group('user')
+    if user != '-':
+        attributes['usr'] = {'id': user}
+    return attributes
+
+
+# key=value / logfmt lines; values may be double-quoted with escaped quotes
+_KV_RE = re.compile(r'([A-Za-z_][\w.\-]*)=("(?:[^"\\]|\\.)*"|[^\s"]*)')
+_KV_LEVEL_KEYS = ('level', 'lvl', 'severity')
+
+
+def parse_key_value(line: str) -> Optional[Dict[str, Any]]:
+    pairs = _KV_RE.findall(line)
+    if len(pairs) < 2:
+        return None
+    attributes: Dict[str, Any] = {}
+    for key, value in pairs:
+        if value.startswith('"'):
+            attributes[key] = value[1:-1].replace('\\"', '"')
+        else:
+            attributes[key] = _number(value)
+    for key in _KV_LEVEL_KEYS:
+        level = attributes.get(key)
+        if isinstance(level, str):
+            attributes['status'] = level.lower()
+            break
+    return attributes
+
+
+def _detect_key_value(line: str) -> bool:
+    # Require most of the line to be pairs so prose with one "a=b" is not captured
+    pairs = _KV_RE.findall(line)
+    return len(pairs) >= 2 and sum(len(k) + len(v) + 1 for k, v in pairs) >= len(line) * 0.6
+
+
+class FixedFieldParser(LogParser):
+    """Parser for separator-delimited records with a fixed list of fields.
+
+    parse_batch() splits a whole batch up front and converts each numeric
+    column in one pass, which is far cheaper than parsing line by line for
+    high-volume formats such as VPC flow logs. Records keep the field order.
+    """
+
+    def __init__(self, name: str, fields: Tuple[str, ...], numeric_fields: Tuple[str, ...] = (),
+                 attribute: Optional[str] = None, separator: str = ' ', leading: Optional[str] = None,
+                 status_field: Optional[str] = None, status_map: Optional[Dict[str, str]] = None,
+                 detect: Optional[Callable[[str], bool]] = None):
+        super().__init__(name, self.parse_line, detect)
+        self.fields = fields
+        self.numeric = frozenset(numeric_fields)
+        self.attribute = attribute or name
+        self.separator = separator
+        self.leading = leading
+        self.status_field = status_field
+        self.status_map = status_map or {}
+
+    def parse_line(self, line: str) -> Optional[Dict[str, Any]]:
+        return self.parse_batch([line])[0]
+
+    def parse_batch(self, lines: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """Parse every line; entries are None for lines that are not valid records"""
+        width = len(self.fields)
+        leading = self.leading
+        rows = [line.split(self.separator) for line in lines]
+        valid = [i for i, row in enumerate(rows)
+                 if len(row) == width and (leading is None or row[0] == leading)]
+        results: List[Optional[Dict[str, Any]]] = [None] * len(lines)
+        if not valid:
+            return results
+
+        columns = []
+        # Positions in `valid` of rows with a malformed number; they are not records
+        malformed = set()
+        for name, column in zip(self.fields, zip(*[rows[i] for i in valid])):
+            if name in self.numeric:
+                try:
+                    column = tuple(map(int, column))
+                except ValueError:
+                    column = tuple(self._number(value, position, malformed) for position, value in enumerate(column))
+            elif '-' in column:
+                column = tuple(None if value == '-' else value for value in column)
+            columns.append(column)
+
+        if self.status_field is not None:
+            status_map = self.status_map
+            statuses = [status_map.get(value, 'info')
+                        for value in columns[self.fields.index(self.status_field)]]
+        else:
+            statuses = ['info'] * len(valid)
+
+        fields = self.fields
+        attribute = self.attribute
+        for position, (i, status, values) in enumerate(zip(valid, statuses, zip(*columns))):
+            if position not in malformed:
+                results[i] = {'status': status, attribute: dict(zip(fields, values))}
+        return results
+
+    @staticmethod
+    def _number(value: str, position: int, malformed: set) -> Optional[int]:
+        """A numeric column value; "-" is None, and anything else not a number marks its row malformed"""
+        if value == '-':
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            malformed.add(position)
+            return None
+
+
+# VPC Flow Logs, default version 2 format
+VPC_FLOW_FIELDS = (
+    'version', 'account_id', 'interface_id', 'srcaddr', 'dstaddr', 'srcport', 'dstport',
+    'protocol', 'packets', 'bytes', 'start', 'end', 'action', 'log_status',
+)
+VPC_FLOW_NUMERIC_FIELDS = ('version', 'srcport', 'dstport', 'protocol', 'packets', 'bytes', 'start', 'end')
+_VPC_FLOW_RE = re.compile(r'2 (?:\d{12}|unknown|-) (?:eni-[0-9a-f]+|-) ')
+
+VPC_FLOW_PARSER = FixedFieldParser(
+    'vpc_flow', VPC_FLOW_FIELDS, VPC_FLOW_NUMERIC_FIELDS, leading='2',
+    status_field='action', status_map={'REJECT': 'warn'},
+    detect=lambda line: _VPC_FLOW_RE.match(line) is not None and VPC_FLOW_PARSER.parse(line) is not None,
+)
+parse_vpc_flow = VPC_FLOW_PARSER.parse
+
+
+def parse_json(line: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+PARSERS: Dict[str, LogParser] = {}
+
+
+def register_parser(parser: LogParser, *aliases: str) -> LogParser:
+    """Make `parser` selectable by name (and aliases) in configuration and detection"""
+    for name in (parser.name,) + aliases:
+        PARSERS[name] = parser
+    return parser
+
+
+register_parser(LogParser('json', parse_json, detect=lambda line: line.startswith('{') and parse_json(line) is not None))
+register_parser(VPC_FLOW_PARSER)
+register_parser(LogParser('access_log', parse_access_log), 'nginx', 'apache')
+register_parser(LogParser('key_value', parse_key_value, detect=_detect_key_value), 'logfmt')
+
+# Order matters: cheaper and stricter formats are tried first
+DETECTION_ORDER = ('json', 'vpc_flow', 'access_log', 'key_value')
+
+# Lines sampled from a batch when detecting the format of a log group
+DETECTION_SAMPLE_SIZE = 5
+
+# Log groups whose detection result is remembered across warm invocations
+DETECTION_CACHE_SIZE = 1024
+
+# A group is taken for plain/JSON only after this many full samples in a row
+# matched no format, and is sampled again once the answer is this many
+# seconds old, so a few odd batches (a stack trace, a startup banner) do not
+# pin it for the life of the environment
+DETECTION_MISSES = 3
+DETECTION_RETRY_SECONDS = 300
+
+
+def load_parser_config(value: str) -> List[Tuple[str, str]]:
+    """Parse DD_LOG_GROUP_PARSERS, e.g. "/aws/vpc/*=vpc_flow,/nginx/access=nginx" """
+    rules = []
+    for item in value.split(','):
+        pattern, sep, name = item.strip().rpartition('=')
+        if not sep or not pattern:
+            continue
+        if name not in PARSERS and name != 'plain':
+            raise ValueError(f"Unknown parser '{name}' for log group pattern '{pattern}'")
+        rules.append((pattern, name))
+    return rules
+
+
+class ParserSelector:
+    """Picks the parser for a log group from configuration or a cached detection result"""
+
+    def __init__(self, rules: List[Tuple[str, str]], cache_size: int = DETECTION_CACHE_SIZE):
+        self.exact: Dict[str, str] = {}
+        globs = []
+        for pattern, name in rules:
+            if any(c in pattern for c in '*?['):
+                globs.append((re.compile(fnmatch.translate(pattern)), name))
+            else:
+                self.exact[pattern] = name
+        self.globs = globs
+        self.cache_size = cache_size
+        # Log group -> (detected format or None, when to detect again)
+        self._detected: 'OrderedDict[str, Tuple[Optional[str], float]]' = OrderedDict()
+        # Consecutive full samples of a group that matched no format
+        self._misses: Dict[str, int] = {}
+
+    def configured(self, log_group: str) -> Optional[str]:
+        name = self.exact.get(log_group)
+        if name is not None:
+            return name
+        for regex, name in self.globs:
+            if regex.match(log_group):
+                return name
+        return None
+
+    def select(self, log_group: str, sample: List[str]) -> Optional[LogParser]:
+        """Return the parser for `log_group`, or None for JSON-or-plain handling"""
+        name = self.configured(log_group)
+        if name is None:
+            cached = self._detected.get(log_group)
+            if cached is not None and cached[1] > time.monotonic():
+                self._detected.move_to_end(log_group)
+                name = cached[0]
+            else:
+                name = detect_format(sample)
+                self._remember(log_group, name, len(sample) >= DETECTION_SAMPLE_SIZE)
+        if name is None or name in ('plain', 'json'):
+            return None
+        return PARSERS[name]
+
+    def _remember(self, log_group: str, name: Optional[str], full_sample: bool) -> None:
+        """Cache a detected format for good, and "no format" only after repeated full misses, for a while"""
+        if name is not None:
+            self._misses.pop(log_group, None)
+            expires = float('inf')
+        else:
+            self._detected.pop(log_group, None)
+            if not full_sample:
+                return
+            misses = self._misses.pop(log_group, 0) + 1
+            if misses < DETECTION_MISSES:
+                if len(self._misses) >= self.cache_size:
+                    self._misses.pop(next(iter(self._misses)))
+                self._misses[log_group] = misses
+                return
+            expires = time.monotonic() + DETECTION_RETRY_SECONDS
+        self._detected[log_group] = (name, expires)
+        self._detected.move_to_end(log_group)
+        if len(self._detected) > self.cache_size:
+            self._detected.popitem(last=False)
+
+
+def detect_format(sample: List[str]) -> Optional[str]:
+    """Name of the first format matching most sampled lines, or None"""
+    lines = [line for line in sample[:DETECTION_SAMPLE_SIZE] if line]
+    if not lines:
+        return None
+    for name in DETECTION_ORDER:
+        parser = PARSERS[name]
+        matches = sum(1 for line in lines if parser.detect(line))
+        if matches * 2 > len(lines):
+            return name
+    return None
+
+
+selector = ParserSelector(load_parser_config(os.environ.get('DD_LOG_GROUP_PARSERS', '')))
+
+
+def select_parser(log_group: str, sample: List[str]) -> Optional[LogParser]:
+    """Parser for a batch from `log_group`; None means the default JSON-or-plain handling"""
+    return selector.select(log_group, sample)
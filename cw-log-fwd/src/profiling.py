@@ -0,0 +1,157 @@
+import gzip
+import os
+import random
+import time
+import tracemalloc
+from typing import Dict, Any, Optional
+
+from memory import max_rss_mb
+
+# DD_FORWARDER_PROFILE=true records per-stage wall-clock timings for every
+# invocation; DD_FORWARDER_PROFILE_SAMPLE_RATE additionally runs cProfile on
+# that fraction of invocations and writes the stats to DD_FORWARDER_PROFILE_DEST
+# (a directory, default /tmp, or an s3://bucket/prefix URI)
+PROFILE_ENABLED = os.environ.get('DD_FORWARDER_PROFILE', 'false').lower() in ('true', '1', 'yes', 'on')
+PROFILE_SAMPLE_RATE = float(os.environ.get('DD_FORWARDER_PROFILE_SAMPLE_RATE', '0') or 0)
+PROFILE_DEST = os.environ.get('DD_FORWARDER_PROFILE_DEST', '/tmp')
+# Fraction of invocations whose stages are traced with tracemalloc for their
+# peak allocations; tracing slows the invocation down, so it is sampled.
+# Every profiled stage also records the process's peak RSS when it ends.
+MEMORY_SAMPLE_RATE = float(os.environ.get('DD_FORWARDER_MEMORY_SAMPLE_RATE', '0') or 0)
+
+
+class _NullStage:
+    """Context manager used when profiling is off; does nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, profile: 'InvocationProfile', name: str):
+        self.profile = profile
+        self.name = name
+        self.started = 0.0
+        self.traced = 0
+
+    def __enter__(self):
+        if self.profile.trace_memory:
+            # Peak of this stage alone, over what was already allocated
+            self.traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        profile = self.profile
+        timings = profile.timings
+        timings[self.name] = timings.get(self.name, 0.0) + (time.perf_counter() - self.started) * 1000
+        profile.max_rss[self.name] = max_rss_mb()
+        if profile.trace_memory:
+            peak = (tracemalloc.get_traced_memory()[1] - self.traced) / 1024
+            profile.peaks[self.name] = max(profile.peaks.get(self.name, 0.0), peak)
+        return False
+
+
+class InvocationProfile:
+    """Stage timings and memory, and optionally a cProfile run, for one invocation"""
+
+    def __init__(self, sampled: bool = False, trace_memory: bool = False):
+        self.timings: Dict[str, float] = {}
+        # Process peak RSS (MB) as each stage ended, and with trace_memory the
+        # peak KB each stage allocated
+        self.max_rss: Dict[str, float] = {}
+        self.peaks: Dict[str, float] = {}
+        # Left alone if something else is already tracing
+        self.trace_memory = trace_memory and not tracemalloc.is_tracing()
+        if self.trace_memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        self.profiler = None
+        if sampled:
+            # Imported here so that cProfile stays off the cold-start path
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def stage(self, name: str) -> _Stage:
+        return _Stage(self, name)
+
+    def finish(self, request_id: str = '') -> Dict[str, Any]:
+        """Stop profiling and write the cProfile stats if this invocation was sampled"""
+        result: Dict[str, Any] = {
+            'total_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'stages_ms': {name: round(ms, 3) for name, ms in self.timings.items()},
+            'stages_rss_mb': {name: round(mb, 1) for name, mb in self.max_rss.items()},
+        }
+        if self.trace_memory:
+            tracemalloc.stop()
+            result['stages_peak_kb'] = {name: round(kb, 1) for name, kb in self.peaks.items()}
+        if self.profiler:
+            self.profiler.disable()
+            try:
+                result['profile'] = write_profile(self.profiler, request_id or str(int(time.time() * 1000)))
+            except Exception as e:
+                print(f"Error writing profile: {str(e)}")
+        return result
+
+
+_active: Optional[InvocationProfile] = None
+
+
+def begin_invocation() -> Optional[InvocationProfile]:
+    """Start profiling an invocation; returns None when it is neither profiled nor memory-traced"""
+    global _active
+    trace_memory = MEMORY_SAMPLE_RATE > 0 and random.random() < MEMORY_SAMPLE_RATE
+    if not PROFILE_ENABLED and not trace_memory:
+        _active = None
+        return None
+    _active = InvocationProfile(
+        sampled=PROFILE_ENABLED and PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE,
+        trace_memory=trace_memory
+    )
+    return _active
+
+
+def stage(name: str):
+    """Time a block under `name` for the current invocation"""
+    if _active is None:
+        return _NULL_STAGE
+    return _active.stage(name)
+
+
+def end_invocation(request_id: str = '') -> Optional[Dict[str, Any]]:
+    """Finish the current invocation's profile and return its timings"""
+    global _active
+    if _active is None:
+        return None
+    profile, _active = _active, None
+    return profile.finish(request_id)
+
+
+def write_profile(profiler: Any, name: str) -> str:
+    """Write gzipped pstats data to PROFILE_DEST and return its location"""
+    import marshal
+    import pstats
+
+    stats = pstats.Stats(profiler)
+    data = gzip.compress(marshal.dumps(stats.stats))
+    filename = f"forwarder-{name}.pstats.gz"
+
+    if PROFILE_DEST.startswith('s3://'):
+        import boto3
+        bucket, _, prefix = PROFILE_DEST[len('s3://'):].partition('/')
+        key = f"{prefix.rstrip('/')}/{filename}" if prefix else filename
+        boto3.client('s3').put_object(Bucket=bucket, Key=key, Body=data)
+        return f"s3://{bucket}/{key}"
+
+    path = os.path.join(PROFILE_DEST, filename)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
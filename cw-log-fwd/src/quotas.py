@@ -0,0 +1,250 @@
+import gzip
+import json
+import os
+import random
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote
+
+from buffering import S3SpillStore
+from records import serialize_records
+
+# Per-log-group token buckets, in events per second. A log group without a
+# route quota gets the default from DD_FORWARDER_QUOTA_RATE/_BURST; quotas are
+# off when neither is set. Buckets live in the execution environment and
+# survive warm invocations; with DD_FORWARDER_QUOTA_TABLE they are kept in a
+# DynamoDB table shared by every concurrent instance instead.
+QUOTA_RATE = os.environ.get('DD_FORWARDER_QUOTA_RATE')
+QUOTA_BURST = os.environ.get('DD_FORWARDER_QUOTA_BURST')
+QUOTA_OVERFLOW = os.environ.get('DD_FORWARDER_QUOTA_OVERFLOW', 'sample')
+QUOTA_SAMPLE_RATE = float(os.environ.get('DD_FORWARDER_QUOTA_SAMPLE_RATE', '0.1'))
+QUOTA_TABLE = os.environ.get('DD_FORWARDER_QUOTA_TABLE')
+# DynamoDB-compatible endpoint, e.g. DynamoDB Local
+QUOTA_ENDPOINT = os.environ.get('DD_FORWARDER_QUOTA_ENDPOINT')
+# s3://bucket/prefix that "spill" overflow writes to; required by that action,
+# since /tmp would not outlive the execution environment. Spilled events are
+# sent later by a replay invocation ({"replaySpill": {"logGroup": ...}}).
+SPILL_DEST = os.environ.get('DD_FORWARDER_SPILL_DEST', '')
+
+OVERFLOW_ACTIONS = ('sample', 'spill', 'drop')
+
+# Optimistic-concurrency attempts against the shared table before falling
+# back to this instance's own bucket
+SHARED_ATTEMPTS = 3
+
+
+class QuotaPolicy:
+    """Rate limit for one log group and what happens to events over it"""
+
+    __slots__ = ('rate', 'burst', 'overflow', 'sample_rate')
+
+    def __init__(self, rate: float, burst: Optional[float] = None, overflow: str = QUOTA_OVERFLOW,
+                 sample_rate: float = QUOTA_SAMPLE_RATE):
+        rate = float(rate)
+        burst = float(burst) if burst is not None else rate
+        sample_rate = float(sample_rate)
+        if rate <= 0 or burst <= 0:
+            raise ValueError("Quota rate and burst must be positive")
+        if overflow not in OVERFLOW_ACTIONS:
+            raise ValueError(f"Quota overflow must be one of {', '.join(OVERFLOW_ACTIONS)}")
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("Quota sample_rate must be between 0 and 1")
+        if overflow == 'spill' and not SPILL_DEST.startswith('s3://'):
+            raise ValueError("Quota overflow 'spill' needs DD_FORWARDER_SPILL_DEST set to s3://bucket/prefix")
+        self.rate = rate
+        self.burst = burst
+        self.overflow = overflow
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any], match: str = '') -> 'QuotaPolicy':
+        """Build from a route's "quota" object"""
+        if not isinstance(config, dict) or 'rate' not in config:
+            raise ValueError(f"quota must be an object with a rate in route '{match}'")
+        try:
+            return cls(**config)
+        except TypeError as e:
+            raise ValueError(f"Invalid quota in route '{match}': {str(e)}")
+
+
+class TokenBucket:
+    __slots__ = ('tokens', 'updated_at')
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+    def take(self, count: int, policy: QuotaPolicy, now: float) -> int:
+        """Take up to `count` tokens and return how many were granted"""
+        self.tokens = min(policy.burst, self.tokens + (now - self.updated_at) * policy.rate)
+        self.updated_at = now
+        granted = min(count, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+
+class LocalQuotaStore:
+    """Buckets held in memory, shared by warm invocations of one instance"""
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def take(self, key: str, count: int, policy: QuotaPolicy, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(policy.burst, now)
+        return bucket.take(count, policy, now)
+
+
+class DynamoDBQuotaStore:
+    """Buckets in a DynamoDB table (partition key "log_group"), shared across instances.
+
+    Each take is one read and one conditional write guarded by a version
+    number; a lost race is retried. When the table cannot be used the
+    instance falls back to its own in-memory bucket rather than blocking
+    delivery.
+    """
+
+    def __init__(self, table: str, client: Any = None, endpoint_url: Optional[str] = QUOTA_ENDPOINT):
+        self.table = table
+        self.endpoint_url = endpoint_url
+        self._client = client
+        self.fallback = LocalQuotaStore()
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('dynamodb', endpoint_url=self.endpoint_url)
+        return self._client
+
+    def take(self, key: str, count: int, policy: QuotaPolicy, now: Optional[float] = None) -> int:
+        now = time.time() if now is None else now
+        try:
+            for _ in range(SHARED_ATTEMPTS):
+                granted = self._try_take(key, count, policy, now)
+                if granted is not None:
+                    return granted
+            print(f"Quota table {self.table} is contended; using the local bucket for {key}")
+        except Exception as e:
+            print(f"Quota table {self.table} unavailable, using the local bucket for {key}: {str(e)}")
+        return self.fallback.take(key, count, policy, now)
+
+    def _try_take(self, key: str, count: int, policy: QuotaPolicy, now: float) -> Optional[int]:
+        item = self.client.get_item(
+            TableName=self.table, Key={'log_group': {'S': key}}, ConsistentRead=True
+        ).get('Item')
+        if item:
+            bucket = TokenBucket(float(item['tokens']['N']), float(item['updated_at']['N']))
+            version = int(item['version']['N'])
+        else:
+            bucket = TokenBucket(policy.burst, now)
+            version = 0
+        granted = bucket.take(count, policy, now)
+
+        request = {
+            'TableName': self.table,
+            'Item': {
+                'log_group': {'S': key},
+                'tokens': {'N': repr(bucket.tokens)},
+                'updated_at': {'N': repr(bucket.updated_at)},
+                'version': {'N': str(version + 1)},
+            },
+        }
+        if item:
+            request['ConditionExpression'] = 'version = :version'
+            request['ExpressionAttributeValues'] = {':version': {'N': str(version)}}
+        else:
+            request['ConditionExpression'] = 'attribute_not_exists(log_group)'
+        try:
+            self.client.put_item(**request)
+        except Exception as e:
+            error = getattr(e, 'response', {}).get('Error', {})
+            if error.get('Code') == 'ConditionalCheckFailedException':
+                return None
+            raise
+        return granted
+
+
+def spill_prefix(log_group: str) -> str:
+    """Name prefix of a log group's spill files, unambiguous for any log group name"""
+    return f"spill-{quote(log_group, safe='').replace('-', '%2D')}-"
+
+
+def spill_events(store: Any, events: List[Dict[str, Any]], log_group: str) -> str:
+    """Write events as gzipped JSON lines to the spill store and return the file name"""
+    data, _ = serialize_records(events)
+    return spill_lines(store, data, log_group)
+
+
+def spill_lines(store: Any, data: bytes, log_group: str) -> str:
+    """Write already encoded JSON lines to the spill store and return the file name"""
+    # Nanosecond timestamps keep names in the order the files were written
+    name = f"{spill_prefix(log_group)}{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+    store.write(name, gzip.compress(data))
+    return name
+
+
+def spilled_files(store: Any, log_group: str) -> List[str]:
+    """A log group's spill files, oldest first"""
+    prefix = spill_prefix(log_group)
+    return sorted(name for name, _ in store.list() if name.startswith(prefix))
+
+
+class QuotaManager:
+    """Applies per-log-group quotas to processed events"""
+
+    def __init__(self, store: Any, default_policy: Optional[QuotaPolicy] = None, spill_store: Any = None):
+        self.store = store
+        self.default_policy = default_policy
+        self.spill_store = spill_store
+
+    def admit(self, log_group: str, events: List[Dict[str, Any]],
+              policy: Optional[QuotaPolicy] = None) -> Tuple[List[Dict[str, Any]], int, int, int]:
+        """Split events into those to send now and handle the rest.
+
+        Returns (events to send, events over quota, events spilled, failed
+        spill writes). Over quota events are kept at the policy's sample rate
+        (marked with "quota_sample_rate"), spilled, or dropped. Events a spill
+        cannot write are sampled instead of being lost unseen.
+        """
+        policy = policy or self.default_policy
+        if policy is None or not events:
+            return events, 0, 0, 0
+
+        granted = self.store.take(log_group, len(events), policy)
+        if granted >= len(events):
+            return events, 0, 0, 0
+
+        admitted, over = events[:granted], events[granted:]
+        spilled = spill_failures = 0
+        if policy.overflow == 'spill':
+            try:
+                name = spill_events(self.spill_store, over, log_group)
+                spilled = len(over)
+                print(f"Spilled {spilled} over-quota events from {log_group} to {name}")
+            except Exception as e:
+                print(f"Error spilling over-quota events from {log_group}, sampling them instead: {str(e)}")
+                spill_failures = 1
+        if policy.overflow == 'sample' or spill_failures:
+            rate = policy.sample_rate
+            for data in over:
+                if random.random() < rate:
+                    data['quota_sample_rate'] = rate
+                    admitted.append(data)
+        return admitted, len(over), spilled, spill_failures
+
+
+def create_quota_manager() -> QuotaManager:
+    """Build the quota manager from the environment"""
+    default_policy = None
+    if QUOTA_RATE or QUOTA_BURST:
+        default_policy = QuotaPolicy(QUOTA_RATE or QUOTA_BURST, QUOTA_BURST)
+    store = DynamoDBQuotaStore(QUOTA_TABLE) if QUOTA_TABLE else LocalQuotaStore()
+    spill_store = S3SpillStore(SPILL_DEST) if SPILL_DEST.startswith('s3://') else None
+    return QuotaManager(store, default_policy, spill_store)
+
+
+quota_manager = create_quota_manager()
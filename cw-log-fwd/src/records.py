@@ -0,0 +1,342 @@
+import json
+import os
+import uuid
+from json.encoder import encode_basestring_ascii
+from typing import Dict, Any, List, Optional, Tuple
+
+# Largest encoded event, in bytes, that is sent as is; the intake limits
+# each log to 1 MB. Bigger events are cut at their largest string field
+# and either truncated (marked "truncated": true) or, with "split", sent as
+# numbered parts sharing an id under "split".
+MAX_EVENT_BYTES = int(os.environ.get('DD_FORWARDER_MAX_EVENT_BYTES', '1000000'))
+OVERSIZE_MODE = os.environ.get('DD_FORWARDER_OVERSIZE', 'truncate').lower()
+OVERSIZE_MODES = ('truncate', 'split')
+if OVERSIZE_MODE not in OVERSIZE_MODES:
+    raise ValueError(f"DD_FORWARDER_OVERSIZE must be one of {', '.join(OVERSIZE_MODES)}, not {OVERSIZE_MODE!r}")
+
+# Fields added to every forwarded event, per kind of message. Kept once per
+# process and merged in only when an event is serialized.
+
+# Lines structured by a format parser; "message" comes first
+STRUCTURED_LOG_FIELDS = {
+    "status": "info",
+    "logger": "cloudwatch",
+    "ddsource": "cloudwatch",
+    "ddtags": "env:prod,source:cloudwatch,app_id:fastapi-demo,app_name:fastapi-demo-app",
+    "service": "cloudwatch-logs",
+    "app_id": "fastapi-demo",
+    "app_name": "fastapi-demo-app",
+    "host": "simulator"
+}
+
+# JSON messages, added after the message's own keys
+JSON_LOG_FIELDS = {
+    "ddsource": "cloudwatch",
+    "ddtags": "env:prod,source:cloudwatch,app_id:fastapi-demo,app_name:fastapi-demo-app",
+    "service": "cloudwatch-logs",
+    "app_id": "fastapi-demo",
+    "app_name": "fastapi-demo-app",
+    "host": "simulator"
+}
+
+# Lines that are neither parsed nor JSON, after "message" and "timestamp"
+PLAIN_LOG_FIELDS = STRUCTURED_LOG_FIELDS
+
+# Events whose processing failed
+ERROR_LOG_FIELDS = {
+    "ddsource": "cloudwatch",
+    "service": "cloudwatch-logs",
+    "ddtags": "env:prod,source:cloudwatch,error:parse_failure"
+}
+
+# Record kinds
+STRUCTURED = 0
+JSON = 1
+PLAIN = 2
+ERROR = 3
+
+# Keys the route can override; LogRecord.get builds the event for these
+_ROUTED_KEYS = frozenset({'service', 'ddtags', 'aws'})
+
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+
+def datadog_id(value: Any) -> Any:
+    """A trace or span id as Datadog correlates it: a decimal 64-bit id.
+
+    OpenTelemetry ids are hex (32 digits for traces, 16 for spans); Datadog
+    uses their lower 64 bits. Other values are passed through unchanged.
+    """
+    if isinstance(value, str) and len(value) in (16, 32) and not value.isdigit() and _HEX_DIGITS.issuperset(value):
+        return str(int(value[-16:], 16))
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def add_correlation(data: Dict[str, Any]) -> None:
+    """Map a message's own trace_id, span_id and request_id to Datadog's attributes.
+
+    trace_id and span_id become dd.trace_id and dd.span_id, which link the log
+    to its APM trace; request_id becomes http.request_id. Ids the message
+    already sets under "dd" or "http" (e.g. from ddtrace log injection) win,
+    and the original keys are kept.
+    """
+    trace_id = data.get('trace_id')
+    span_id = data.get('span_id')
+    if trace_id is not None or span_id is not None:
+        dd = data.get('dd')
+        dd = dict(dd) if isinstance(dd, dict) else {}
+        if trace_id is not None:
+            dd.setdefault('trace_id', datadog_id(trace_id))
+        if span_id is not None:
+            dd.setdefault('span_id', datadog_id(span_id))
+        data['dd'] = dd
+    request_id = data.get('request_id')
+    if request_id is not None:
+        http = data.get('http')
+        # Copied: the parsed attributes stay as they were for the next stage
+        http = dict(http) if isinstance(http, dict) else {}
+        http.setdefault('request_id', request_id)
+        data['http'] = http
+
+
+class BatchContext:
+    """Fields shared by every event of one batch: CloudWatch metadata and route overrides"""
+
+    __slots__ = ('cloudwatch', 'service', 'tags')
+
+    def __init__(self, context: Dict[str, str], service: Optional[str] = None, tags: Optional[str] = None):
+        self.cloudwatch = {
+            'log_group': context.get('log_group_name', ''),
+            'log_stream': context.get('log_stream_name', ''),
+            'aws_region': context.get('aws_region', '')
+        }
+        self.service = service
+        self.tags = tags
+
+
+class LogRecord:
+    """One processed event, holding only what differs from its neighbours.
+
+    The forwarded dict (message, parsed attributes, the standard Datadog
+    fields, CloudWatch metadata and route overrides) is only built by
+    to_dict(), at serialization time. `extra` holds fields added by later
+    stages, such as dedup's repeat_count.
+    """
+
+    __slots__ = ('kind', 'timestamp', 'message', 'attributes', 'batch', 'extra')
+
+    def __init__(self, kind: int, timestamp: Any, message: Optional[str], attributes: Optional[Dict[str, Any]],
+                 batch: BatchContext, extra: Optional[Dict[str, Any]] = None):
+        self.kind = kind
+        self.timestamp = timestamp
+        self.message = message
+        self.attributes = attributes
+        self.batch = batch
+        self.extra = extra
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if self.extra is None:
+            self.extra = {}
+        self.extra[key] = value
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Value of one top-level field of the forwarded event, without building it"""
+        extra = self.extra
+        if extra and key in extra:
+            return extra[key]
+        if key in _ROUTED_KEYS:
+            return self.to_dict().get(key, default)
+        if key == 'timestamp':
+            return self.timestamp
+        if key == 'cloudwatch' and self.kind != ERROR:
+            return self.batch.cloudwatch
+
+        kind = self.kind
+        attributes = self.attributes
+        if kind == JSON:
+            return JSON_LOG_FIELDS[key] if key in JSON_LOG_FIELDS else attributes.get(key, default)
+        if attributes and key in attributes:
+            return attributes[key]
+        if key == 'message':
+            return self.message
+        if kind == ERROR:
+            return 'error' if key == 'status' else ERROR_LOG_FIELDS.get(key, default)
+        return STRUCTURED_LOG_FIELDS.get(key, default)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Build the event as forwarded to Datadog"""
+        kind = self.kind
+        if kind == JSON:
+            # A copy, so the record keeps only the parsed message while the
+            # full event lives no longer than its serialization
+            attributes = self.attributes
+            data = {**attributes, **JSON_LOG_FIELDS}
+            data['aws'] = {
+                'logger': attributes.get('logger', 'fastapi'),
+                'log_group': attributes.get('log_group', ''),
+                'log_stream': attributes.get('log_stream', ''),
+            }
+        elif kind == STRUCTURED:
+            data = {"message": self.message, **STRUCTURED_LOG_FIELDS}
+            data.update(self.attributes)
+        elif kind == PLAIN:
+            data = {"message": self.message, "timestamp": None, **PLAIN_LOG_FIELDS}
+        else:
+            data = {
+                'message': self.message,
+                'timestamp': self.timestamp,
+                'status': 'error',
+                'error': self.attributes['error'],
+                **ERROR_LOG_FIELDS
+            }
+
+        data['timestamp'] = self.timestamp
+        if kind != ERROR:
+            data['cloudwatch'] = self.batch.cloudwatch
+            if kind != PLAIN:
+                add_correlation(data)
+        if self.extra:
+            data.update(self.extra)
+
+        batch = self.batch
+        if batch.service:
+            data['service'] = batch.service
+        if batch.tags:
+            existing = data.get('ddtags')
+            data['ddtags'] = f"{existing},{batch.tags}" if existing else batch.tags
+        return data
+
+
+def materialize(value: Any) -> Dict[str, Any]:
+    """json.dumps default hook: turns each record into its dict while encoding"""
+    if isinstance(value, LogRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# ASCII output (non-ASCII characters are escaped), so the length of an
+# encoded event is exactly its size in bytes
+_encode = json.JSONEncoder(default=materialize).encode
+
+# Fields of an oversized event kept when even its other fields are too big
+_ENVELOPE_KEYS = ('timestamp', 'status', 'ddsource', 'ddtags', 'service', 'host')
+# Smallest piece of a cut field worth sending, in bytes
+_MIN_PIECE = 256
+
+
+def _fit(value: str, start: int, budget: int) -> Tuple[str, int]:
+    """The longest piece of `value` from `start` whose JSON string is at most `budget` bytes.
+
+    Returns the encoded piece (with its quotes) and where the next piece
+    starts. Slicing the str never cuts a character, so every piece is valid
+    UTF-8. Only the piece is encoded, plus again for pieces heavy in escapes.
+    """
+    end = min(start + budget, len(value))
+    while True:
+        encoded = encode_basestring_ascii(value[start:end])
+        size = len(encoded) - 2
+        if size <= budget:
+            return encoded, end
+        # Every character takes at least one byte; shrink in proportion
+        end = start + max(1, (end - start) * budget // size)
+
+
+def fit_event(data: Dict[str, Any], line: str, limit: int, mode: str = 'truncate') -> List[str]:
+    """Encoded lines for an event whose encoding, `line`, is over `limit` bytes.
+
+    The event's largest string field is cut to fit. The full value is never
+    encoded again: every piece is encoded on its own and spliced into the
+    encoding of the rest of the event.
+    """
+    field = max((key for key, value in data.items() if isinstance(value, str)),
+                key=lambda key: len(data[key]), default=None)
+    part_id = uuid.uuid4().hex
+    placeholder = f"\x00{part_id}"
+    marker = {'split': {'id': part_id, 'part': 0, 'parts': 0}} if mode == 'split' else {'truncated': True}
+    rest = _encode({**data, field: placeholder, **marker}) if field is not None else line
+    # Room for the field's encoded value, leaving digits for the part numbers
+    budget = limit - (len(rest) - len(encode_basestring_ascii(placeholder)) + 2) - 16
+    if field is None or budget < _MIN_PIECE:
+        if data.get('message') is line:
+            print(f"Dropping event of {len(line)} bytes: the {limit} byte limit leaves no room for its text")
+            return []
+        # Too big even without its largest string: forward the whole event as text
+        envelope = {key: data[key] for key in _ENVELOPE_KEYS if key in data and len(str(data[key])) < _MIN_PIECE}
+        envelope['message'] = line
+        return fit_event(envelope, line, limit, mode)
+
+    value = data[field]
+    print(f"Event of {len(line)} bytes is over the {limit} byte limit; "
+          f"{'splitting' if mode == 'split' else 'truncating'} its {field!r} field")
+    pieces = []
+    start = 0
+    while start < len(value):
+        piece, start = _fit(value, start, budget)
+        pieces.append(piece)
+        if mode != 'split':
+            break
+
+    encoded_placeholder = encode_basestring_ascii(placeholder)
+    lines = []
+    for index, piece in enumerate(pieces, 1):
+        if mode == 'split':
+            marker = {'split': {'id': part_id, 'part': index, 'parts': len(pieces)}}
+        head, _, tail = _encode({**data, field: placeholder, **marker}).partition(encoded_placeholder)
+        lines.append(head + piece + tail)
+    return lines
+
+
+def serialize_records(records: List[Any], limit: Optional[int] = None,
+                      mode: Optional[str] = None) -> Tuple[bytes, int]:
+    """Records (or event dicts) as JSON lines: one object per line, no enclosing brackets.
+
+    Returns the lines and how many there are, which differs from the number
+    of records when oversized events were split.
+    """
+    limit = limit or MAX_EVENT_BYTES
+    mode = mode or OVERSIZE_MODE
+    lines = []
+    append = lines.append
+    for record in records:
+        data = record.to_dict() if isinstance(record, LogRecord) else record
+        line = _encode(data)
+        if len(line) > limit:
+            lines.extend(fit_event(data, line, limit, mode))
+        else:
+            append(line)
+    return '\n'.join(lines).encode('utf-8'), len(lines)
+
+
+class SerializedEvents:
+    """Processed events already encoded, as chunks of JSON lines.
+
+    Stands in for a list of records once a batch has been serialized, e.g.
+    by parallel workers or the buffer. Encoded JSON never contains a raw
+    newline, so events can be split apart or joined into a JSON array body
+    without decoding them. `sample` is the first event, for logging.
+    """
+
+    __slots__ = ('chunks', 'count', 'sample')
+
+    def __init__(self, chunks: List[bytes], count: int, sample: Optional[LogRecord] = None):
+        self.chunks = chunks
+        self.count = count
+        self.sample = sample
+
+    def __len__(self) -> int:
+        return self.count
+
+    def lines(self) -> List[bytes]:
+        """One encoded event per item"""
+        return [line for chunk in self.chunks if chunk for line in chunk.split(b'\n')]
+
+    def body_size(self) -> int:
+        """Length of body(), without building it"""
+        chunks = [len(chunk) for chunk in self.chunks if chunk]
+        return sum(chunks) + max(len(chunks) - 1, 0) + 2
+
+    def body(self) -> bytes:
+        """The events as a JSON array"""
+        return b'[' + b','.join(chunk.replace(b'\n', b',') for chunk in self.chunks if chunk) + b']'
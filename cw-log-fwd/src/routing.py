@@ -0,0 +1,175 @@
+import fnmatch
+import json
+import os
+import re
+from typing import Dict, Any, List, Optional
+
+from aggregation import Aggregation
+from parsers import PARSERS, LogParser
+from quotas import QuotaPolicy
+
+# Routing rules map log group names to per-tenant enrichment and destinations.
+# They come from DD_FORWARDER_ROUTES (a JSON list) or DD_FORWARDER_ROUTES_FILE
+# (path to a JSON file shipped with the function), e.g.
+#
+#   [{"match": "/aws/lambda/payments-*", "service": "payments",
+#     "tags": "team:payments", "parser": "json", "sample_rate": 0.5,
+#     "destination": "datadoghq.eu",
+#     "aggregate": {"counters": ["status_code"], "histograms": ["response_time"],
+#                   "group_by": ["method"], "drop_raw": true},
+#     "quota": {"rate": 500, "burst": 2000, "overflow": "spill"}}]
+#
+# "match" is an exact log group name, a prefix ending in "*", or any glob.
+# The most specific rule wins: exact names, then the longest literal prefix,
+# then declaration order.
+
+_GLOB_CHARS = '*?['
+
+# Resolved log groups remembered across warm invocations
+RESOLVE_CACHE_SIZE = 4096
+
+
+class Route:
+    """Enrichment and delivery settings for the log groups matching one rule"""
+
+    __slots__ = ('match', 'service', 'tags', 'parser_name', 'parser', 'sample_rate', 'destination', 'aggregation',
+                 'quota', '_regex')
+
+    def __init__(self, match: str, service: Optional[str] = None, tags: Optional[str] = None,
+                 parser: Optional[str] = None, sample_rate: float = 1.0, destination: Optional[str] = None,
+                 aggregate: Optional[Dict[str, Any]] = None, quota: Optional[Dict[str, Any]] = None):
+        if not match:
+            raise ValueError("Route is missing 'match'")
+        if parser is not None and parser not in PARSERS and parser != 'plain':
+            raise ValueError(f"Unknown parser '{parser}' in route '{match}'")
+        sample_rate = float(sample_rate)
+        if not 0.0 <= sample_rate <= 1.0:
+            raise ValueError(f"sample_rate must be between 0 and 1 in route '{match}'")
+
+        self.match = match
+        self.service = service
+        self.tags = ','.join(tags) if isinstance(tags, list) else tags
+        self.parser_name = parser
+        self.parser: Optional[LogParser] = None if parser in (None, 'plain', 'json') else PARSERS[parser]
+        self.sample_rate = sample_rate
+        self.destination = destination
+        self.aggregation = Aggregation.from_config(aggregate, match) if aggregate is not None else None
+        self.quota = QuotaPolicy.from_config(quota, match) if quota is not None else None
+
+        literal = literal_prefix(match)
+        if literal == match:
+            self._regex = None  # exact name
+        elif literal == match[:-1] and match.endswith('*'):
+            self._regex = None  # plain prefix: reaching the trie node is a match
+        else:
+            self._regex = re.compile(fnmatch.translate(match))
+
+    def matches(self, log_group: str) -> bool:
+        return self._regex is None or self._regex.match(log_group) is not None
+
+    def __repr__(self) -> str:
+        return f"Route({self.match!r})"
+
+
+def literal_prefix(pattern: str) -> str:
+    """Part of a glob before its first wildcard"""
+    for i, char in enumerate(pattern):
+        if char in _GLOB_CHARS:
+            return pattern[:i]
+    return pattern
+
+
+class _TrieNode:
+    __slots__ = ('children', 'routes')
+
+    def __init__(self):
+        self.children: Dict[str, '_TrieNode'] = {}
+        self.routes: List[Route] = []
+
+
+class RoutingTable:
+    """Routing rules compiled into a prefix trie over log group names.
+
+    A lookup walks the trie once along the log group name, so its cost
+    depends on the name's length, not on the number of rules.
+    """
+
+    def __init__(self, routes: List[Route]):
+        self.routes = routes
+        self._exact: Dict[str, Route] = {}
+        self._root = _TrieNode()
+        self._cache: Dict[str, Optional[Route]] = {}
+        for route in routes:
+            literal = literal_prefix(route.match)
+            if literal == route.match:
+                self._exact.setdefault(literal, route)
+                continue
+            node = self._root
+            for char in literal:
+                node = node.children.setdefault(char, _TrieNode())
+            node.routes.append(route)
+
+    def __len__(self) -> int:
+        return len(self.routes)
+
+    def resolve(self, log_group: str) -> Optional[Route]:
+        """Find the route for `log_group`, or None if no rule matches"""
+        try:
+            return self._cache[log_group]
+        except KeyError:
+            pass
+
+        route = self._exact.get(log_group)
+        if route is None:
+            route = self._lookup(log_group)
+        if len(self._cache) >= RESOLVE_CACHE_SIZE:
+            self._cache.clear()
+        self._cache[log_group] = route
+        return route
+
+    def _lookup(self, log_group: str) -> Optional[Route]:
+        # Collect nodes with rules along the path, then try the longest prefix first
+        candidates = []
+        node = self._root
+        for char in log_group:
+            if node.routes:
+                candidates.append(node.routes)
+            node = node.children.get(char)
+            if node is None:
+                break
+        else:
+            if node.routes:
+                candidates.append(node.routes)
+
+        for routes in reversed(candidates):
+            for route in routes:
+                if route.matches(log_group):
+                    return route
+        return None
+
+
+def load_routes(value: str) -> List[Route]:
+    """Build routes from a JSON list of rule objects"""
+    if not value.strip():
+        return []
+    rules = json.loads(value)
+    if not isinstance(rules, list):
+        raise ValueError("Routing rules must be a JSON list")
+    return [Route(**rule) for rule in rules]
+
+
+def load_routing_table() -> RoutingTable:
+    """Compile the routing table from the environment"""
+    path = os.environ.get('DD_FORWARDER_ROUTES_FILE')
+    if path:
+        with open(path) as f:
+            return RoutingTable(load_routes(f.read()))
+    return RoutingTable(load_routes(os.environ.get('DD_FORWARDER_ROUTES', '')))
+
+
+routing_table = load_routing_table()
+
+
+def resolve_route(log_group: str) -> Optional[Route]:
+    """Route for a log group under the table compiled at init"""
+    return routing_table.resolve(log_group)
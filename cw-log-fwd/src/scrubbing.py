@@ -0,0 +1,206 @@
+import os
+import re
+from typing import Dict, Any, FrozenSet, List, Optional
+
+_HEX = r'[0-9a-fA-F]{1,4}'
+_IPV4 = r'(?:\d{1,3}\.){3}\d{1,3}'
+# Full, "::"-compressed and IPv4-embedded forms (2001:db8::1, ::1,
+# ::ffff:10.1.2.3). Longer forms come first, and the lookarounds make a
+# shorter alternative give way to a longer one rather than match a prefix.
+_IPV6 = (
+    r'(?<![\w:])(?:'
+    rf'(?:{_HEX}:){{6}}{_IPV4}'
+    rf'|::(?:[fF]{{4}}(?::0{{1,4}})?:)?{_IPV4}'
+    rf'|(?:{_HEX}:){{1,4}}:{_IPV4}'
+    rf'|(?:{_HEX}:){{7}}{_HEX}'
+    rf'|(?:{_HEX}:){{1,7}}:'
+    rf'|(?:{_HEX}:){{1,6}}:{_HEX}'
+    rf'|(?:{_HEX}:){{1,5}}(?::{_HEX}){{1,2}}'
+    rf'|(?:{_HEX}:){{1,4}}(?::{_HEX}){{1,3}}'
+    rf'|(?:{_HEX}:){{1,3}}(?::{_HEX}){{1,4}}'
+    rf'|(?:{_HEX}:){{1,2}}(?::{_HEX}){{1,5}}'
+    rf'|{_HEX}:(?::{_HEX}){{1,6}}'
+    rf'|:(?::{_HEX}){{1,7}}'
+    r')(?![\w:]|\.\d)'
+)
+
+# Redaction rules, all compiled into one alternation so each string is
+# scanned once whatever the number of rules. Order matters where patterns
+# could overlap: the first alternative that matches at a position wins.
+RULES = {
+    'jwt': r'\beyJ[\w-]+\.[\w-]+\.[\w-]+',
+    'aws_key': r'\b(?:AKIA|ASIA)[0-9A-Z]{16}\b',
+    'bearer': r'(?i:\bbearer)\s+[\w.~+/-]+=*',
+    'secret': r'(?P<secret_key>(?i:\b(?:api[_-]?key|access[_-]?token|token|secret|password|passwd))["\']?\s*[:=]\s*["\']?)[^\s"\',;&]+',
+    'email': r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+',
+    'card': r'\b(?:\d[ -]?){12,18}\d\b',
+    'ipv4': r'\b(?:\d{1,3}\.){3}\d{1,3}\b',
+    'ipv6': _IPV6,
+}
+
+# Cheap pattern each rule's matches must contain. The triggers of the enabled
+# rules form a prefilter: most attribute values contain none of them and
+# never reach the full pattern.
+TRIGGERS = {
+    'jwt': r'eyJ',
+    'aws_key': r'A[KS]IA',
+    'bearer': r'(?i:bearer)',
+    'secret': r'(?i:api[_-]?key|token|secret|passw)',
+    'email': r'@',
+    'card': r'\d' + r'[ -]?\d' * 12,
+    'ipv4': r'\d\.\d',
+    # A compressed address has "::"; a full one has six or seven groups
+    'ipv6': r'::|(?:[0-9a-fA-F]{1,4}:){6}',
+}
+
+# Rule groups accepted in configuration
+RULE_GROUPS = {
+    'token': ('jwt', 'aws_key', 'bearer', 'secret'),
+    'ip': ('ipv4', 'ipv6'),
+}
+
+# Strings shorter than the shortest possible match ("::1") are skipped
+MIN_LENGTH = 3
+
+
+def expand_rules(names: List[str]) -> List[str]:
+    """Resolve rule and group names to rule names, in RULES order"""
+    selected = set()
+    for name in names:
+        name = name.strip()
+        if not name:
+            continue
+        if name == 'all':
+            selected.update(RULES)
+        elif name in RULE_GROUPS:
+            selected.update(RULE_GROUPS[name])
+        elif name in RULES:
+            selected.add(name)
+        else:
+            raise ValueError(f"Unknown scrubbing rule '{name}'")
+    return [name for name in RULES if name in selected]
+
+
+def luhn_valid(digits: str) -> bool:
+    total = 0
+    for i, char in enumerate(reversed(digits)):
+        value = ord(char) - 48
+        if i % 2:
+            value *= 2
+            if value > 9:
+                value -= 9
+        total += value
+    return total % 10 == 0
+
+
+def load_allowlist(value: str) -> Dict[str, FrozenSet[str]]:
+    """Parse "attribute=rule|rule,attribute=*" into allowed rules per attribute"""
+    allowlist = {}
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        attribute, _, rules = item.partition('=')
+        attribute = attribute.strip()
+        if not attribute or not rules.strip():
+            raise ValueError(f"Invalid scrubbing allowlist entry '{item}'")
+        names = ['all' if rule.strip() == '*' else rule for rule in rules.split('|')]
+        allowlist[attribute] = frozenset(expand_rules(names))
+    return allowlist
+
+
+class Scrubber:
+    """Redacts emails, IP addresses, tokens and card numbers in processed events.
+
+    Every enabled rule is part of one compiled pattern, so each string
+    attribute is scanned once, and only if a cheaper prefilter built from
+    the rules' trigger characters finds a candidate. The allowlist maps
+    dotted attribute paths (e.g. "network.client.ip") to rules that are
+    not redacted there.
+    """
+
+    def __init__(self, rules: List[str], allowlist: Optional[Dict[str, FrozenSet[str]]] = None):
+        if not rules:
+            raise ValueError("Scrubber needs at least one rule")
+        self.rules = rules
+        self.allowlist = allowlist or {}
+        self.pattern = re.compile('|'.join(f'(?P<{name}>{RULES[name]})' for name in rules))
+        self.prefilter = re.compile('|'.join(dict.fromkeys(TRIGGERS[name] for name in rules)))
+        self._replacers = {}
+
+    def _replacer(self, allowed: FrozenSet[str]):
+        replacer = self._replacers.get(allowed)
+        if replacer is not None:
+            return replacer
+
+        def replace(match: 're.Match') -> str:
+            rule = match.lastgroup
+            if rule == 'secret_key':
+                rule = 'secret'
+            if rule in allowed:
+                return match.group(0)
+            if rule == 'card':
+                digits = match.group(0).replace(' ', '').replace('-', '')
+                if not luhn_valid(digits):
+                    return match.group(0)
+            if rule == 'secret':
+                return f"{match.group('secret_key')}[REDACTED:secret]"
+            return f"[REDACTED:{rule}]"
+
+        self._replacers[allowed] = replace
+        return replace
+
+    def scrub_text(self, text: str, allowed: FrozenSet[str] = frozenset()) -> str:
+        if len(text) < MIN_LENGTH or self.prefilter.search(text) is None:
+            return text
+        return self.pattern.sub(self._replacer(allowed), text)
+
+    def scrub_event(self, data: Dict[str, Any]) -> None:
+        """Redact every string attribute parsed from a message in place.
+
+        Takes the parsed attributes, before the forwarder's own fields are
+        merged in, so every key the message carried is scrubbed, "host" and
+        "status" included.
+        """
+        prefilter = self.prefilter.search
+        for key, value in data.items():
+            # Top-level strings inline: most attributes are short or clean
+            if isinstance(value, str):
+                if len(value) >= MIN_LENGTH and prefilter(value) is not None:
+                    data[key] = self.pattern.sub(self._replacer(self.allowlist.get(key, frozenset())), value)
+            elif isinstance(value, (dict, list)):
+                self._scrub_value(data, key, value, key)
+
+    def scrub_record(self, record: Any) -> None:
+        """Redact a LogRecord's message and attributes in place"""
+        message = record.message
+        if message is not None and len(message) >= MIN_LENGTH and self.prefilter.search(message) is not None:
+            record.message = self.pattern.sub(self._replacer(self.allowlist.get('message', frozenset())), message)
+        if record.attributes:
+            self.scrub_event(record.attributes)
+
+    def _scrub_value(self, container: Any, key: Any, value: Any, path: str) -> None:
+        if isinstance(value, str):
+            if len(value) >= MIN_LENGTH and self.prefilter.search(value) is not None:
+                container[key] = self.pattern.sub(self._replacer(self.allowlist.get(path, frozenset())), value)
+        elif isinstance(value, dict):
+            for child_key, child in value.items():
+                self._scrub_value(value, child_key, child, f"{path}.{child_key}")
+        elif isinstance(value, list):
+            for i, child in enumerate(value):
+                self._scrub_value(value, i, child, path)
+
+
+def create_scrubber() -> Optional[Scrubber]:
+    """Build the scrubber configured by DD_FORWARDER_SCRUB, or None when off.
+
+    DD_FORWARDER_SCRUB lists rules or groups ("all", "email", "ip", "token",
+    "card", ...); DD_FORWARDER_SCRUB_ALLOW lists per-attribute exceptions,
+    e.g. "client_ip=ip,trace_id=token".
+    """
+    value = os.environ.get('DD_FORWARDER_SCRUB', 'off').strip().lower()
+    if value in ('', 'off', 'false', 'none'):
+        return None
+    return Scrubber(expand_rules(value.split(',')), load_allowlist(os.environ.get('DD_FORWARDER_SCRUB_ALLOW', '')))
+
+
+scrubber = create_scrubber()
@@ -0,0 +1,421 @@
+import abc
+import concurrent.futures
+import functools
+import gzip
+import json
+import os
+import re
+import socket
+import sys
+import threading
+import time
+import urllib.error
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import batching
+import intake
+from records import SerializedEvents
+
+# Every processed batch can be delivered to several sinks at once, e.g. the
+# Datadog org, an S3 archive and, during a migration, a second Datadog site.
+# Off (Datadog only, through send_to_datadog) unless DD_FORWARDER_SINKS is a
+# JSON list of sink objects:
+#
+#   [{"type": "datadog"},
+#    {"type": "datadog", "name": "eu", "site": "datadoghq.eu",
+#     "api_key_secret_arn": "arn:aws:secretsmanager:...:secret:dd-eu"},
+#    {"type": "file", "name": "archive", "dest": "s3://log-archive/cloudwatch",
+#     "required": false, "timeout": 10}]
+#
+# A "datadog" sink without "site" or "url" sends where the log group's route
+# sends. Each sink batches, retries and times out on its own, on its own
+# thread, so a slow or failing sink never holds up another. The invocation
+# waits for required sinks only; optional ones finish in the background.
+
+SINK_TYPES = ('datadog', 'file', 'stdout')
+
+_NAME_RE = re.compile(r'[^A-Za-z0-9_]')
+
+# Seconds before the first retry; doubled for each further attempt
+RETRY_BACKOFF = 0.2
+
+
+class SinkResult:
+    """Outcome of delivering one batch to one sink"""
+
+    __slots__ = ('name', 'events', 'failed', 'pending', 'requests', 'bytes', 'retries', 'latencies', 'reused',
+                 'error')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.events = 0
+        self.failed = 0
+        # Events an optional sink was still delivering when the invocation returned
+        self.pending = 0
+        self.requests = 0
+        self.bytes = 0
+        self.retries = 0
+        self.latencies: List[float] = []
+        self.reused = 0
+        self.error: Optional[str] = None
+
+
+class Sink(abc.ABC):
+    """One destination: splits a batch into requests and sends each with retries.
+
+    Subclasses implement write(), which raises on failure, and may narrow
+    retryable() or size their requests with requests() and observe().
+    """
+
+    kind = ''
+
+    def __init__(self, name: str, max_events: int, max_bytes: int, attempts: int = 3,
+                 timeout: float = 30.0, required: bool = True):
+        if attempts < 1:
+            raise ValueError(f"Sink '{name}' needs at least one attempt")
+        self.name = name
+        self.max_events = int(max_events)
+        self.max_bytes = int(max_bytes)
+        self.attempts = int(attempts)
+        self.timeout = float(timeout)
+        self.required = bool(required)
+
+    def split(self, lines: List[bytes]) -> List[List[bytes]]:
+        """Group encoded events into requests within this sink's limits"""
+        requests: List[List[bytes]] = []
+        current: List[bytes] = []
+        size = 0
+        for line in lines:
+            if current and (len(current) >= self.max_events or size + len(line) + 1 > self.max_bytes):
+                requests.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current:
+            requests.append(current)
+        return requests
+
+    def requests(self, events: SerializedEvents, log_group: str) -> Iterator[Tuple[int, Any]]:
+        """(event count, payload for write()) of each request"""
+        for lines in self.split(events.lines()):
+            yield len(lines), lines
+
+    def deliver(self, events: SerializedEvents, log_group: str = '', dd_url: Optional[str] = None,
+                api_key: Optional[Callable[[], str]] = None) -> SinkResult:
+        result = SinkResult(self.name)
+        for count, payload in self.requests(events, log_group):
+            for attempt in range(self.attempts):
+                started = time.perf_counter()
+                try:
+                    written, reused = self.write(payload, log_group, dd_url, api_key)
+                except Exception as e:
+                    self.observe(log_group, count, payload, (time.perf_counter() - started) * 1000, e)
+                    if attempt + 1 == self.attempts or not self.retryable(e):
+                        result.failed += count
+                        result.error = f"{type(e).__name__}: {str(e)}"
+                        print(f"Sink {self.name} failed to deliver {count} events: {result.error}")
+                        break
+                    result.retries += 1
+                    time.sleep(RETRY_BACKOFF * 2 ** attempt)
+                    continue
+                latency = (time.perf_counter() - started) * 1000
+                self.observe(log_group, count, payload, latency, None)
+                result.latencies.append(latency)
+                result.requests += 1
+                result.events += count
+                result.bytes += written
+                result.reused += int(reused)
+                break
+        return result
+
+    @abc.abstractmethod
+    def write(self, payload: Any, log_group: str, dd_url: Optional[str],
+              api_key: Optional[Callable[[], str]]) -> Tuple[int, bool]:
+        """Send one request; returns (bytes written, whether a connection was reused)"""
+
+    def observe(self, log_group: str, count: int, payload: Any, latency_ms: float,
+                error: Optional[Exception]) -> None:
+        """Outcome of one request, for sinks that size their requests from it"""
+
+    def retryable(self, error: Exception) -> bool:
+        return True
+
+
+class DatadogSink(Sink):
+    """The Datadog logs intake of one org and site.
+
+    Requests are cut by batching.split_body and sized by batching.sizers,
+    like send_to_datadog's, within this sink's own limits. A sink sending
+    where the route sends shares the log group's sizer with send_to_datadog;
+    one with its own site or URL learns separately.
+    """
+
+    kind = 'datadog'
+
+    def __init__(self, name: str = 'datadog', url: Optional[str] = None, site: Optional[str] = None,
+                 api_key_secret_arn: Optional[str] = None, api_key_env: Optional[str] = None,
+                 max_events: int = 1000, max_bytes: int = 5000000, **options: Any):
+        super().__init__(name, max_events, max_bytes, **options)
+        self.url = url or (intake.logs_url(site) if site else None)
+        self.api_key_secret_arn = api_key_secret_arn
+        self.api_key_env = api_key_env
+        self._api_key: Optional[str] = None
+
+    def key(self, default: Optional[Callable[[], str]]) -> str:
+        """This sink's own API key if it has one, else the forwarder's"""
+        if self.api_key_env:
+            return os.environ[self.api_key_env]
+        if self.api_key_secret_arn:
+            if self._api_key is None:
+                import boto3
+                region = self.api_key_secret_arn.split(':')[3]
+                response = boto3.client('secretsmanager', region_name=region).get_secret_value(
+                    SecretId=self.api_key_secret_arn)
+                self._api_key = json.loads(response['SecretString'])['DD_API_KEY']
+            return self._api_key
+        if default is None:
+            raise ValueError(f"No API key for sink '{self.name}'")
+        return default()
+
+    def sizer_key(self, log_group: str) -> str:
+        return log_group if self.url is None else f"{self.name}:{log_group}"
+
+    def requests(self, events, log_group):
+        max_events, max_bytes = batching.sizers.limits(self.sizer_key(log_group))
+        return batching.split_body(events, min(max_events, self.max_events), min(max_bytes, self.max_bytes))
+
+    def write(self, body, log_group, dd_url, api_key):
+        url = self.url or dd_url
+        if not url:
+            raise ValueError(f"No intake URL for sink '{self.name}'")
+        headers = {'Content-Type': 'application/json', 'DD-API-KEY': self.key(api_key)}
+        response = intake.get_client(url).post(body, headers)
+        return len(body), response.reused
+
+    def observe(self, log_group, count, body, latency_ms, error):
+        if error is None:
+            status = 202
+        elif isinstance(error, urllib.error.HTTPError):
+            status = error.code
+        elif isinstance(error, urllib.error.URLError) and isinstance(error.reason, socket.timeout):
+            status = batching.TIMED_OUT
+        else:
+            return
+        batching.sizers.observe(self.sizer_key(log_group), count, len(body), latency_ms, status)
+
+    def retryable(self, error: Exception) -> bool:
+        # Rejected payloads and bad keys fail the same way every time
+        if isinstance(error, urllib.error.HTTPError):
+            return error.code == 429 or error.code >= 500
+        return isinstance(error, urllib.error.URLError)
+
+
+class FileSink(Sink):
+    """Gzipped JSON lines in a directory or under an S3 prefix, one object per request.
+
+    Objects are keyed by hour and log group, e.g.
+    cloudwatch/2025/02/21/10/aws_lambda_app-1708509600000-1a2b3c4d.jsonl.gz,
+    which suits Athena or a later replay.
+    """
+
+    kind = 'file'
+
+    def __init__(self, name: str = 'file', dest: str = '/tmp/dd-forwarder-archive',
+                 max_events: int = 100000, max_bytes: int = 64000000, client: Any = None, **options: Any):
+        super().__init__(name, max_events, max_bytes, **options)
+        self.dest = dest
+        self._client = client
+
+    @property
+    def client(self) -> Any:
+        if self._client is None:
+            import boto3
+            self._client = boto3.client('s3')
+        return self._client
+
+    def object_name(self, log_group: str) -> str:
+        now = datetime.now(timezone.utc)
+        safe_group = log_group.strip('/').replace('/', '_') or 'buffered'
+        return (f"{now:%Y/%m/%d/%H}/{safe_group}-{int(now.timestamp() * 1000)}-"
+                f"{uuid.uuid4().hex[:8]}.jsonl.gz")
+
+    def write(self, lines, log_group, dd_url, api_key):
+        data = gzip.compress(b'\n'.join(lines) + b'\n')
+        name = self.object_name(log_group)
+        if self.dest.startswith('s3://'):
+            bucket, _, prefix = self.dest[len('s3://'):].partition('/')
+            key = f"{prefix.rstrip('/')}/{name}" if prefix else name
+            self.client.put_object(Bucket=bucket, Key=key, Body=data)
+        else:
+            path = os.path.join(self.dest, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+        return len(data), False
+
+
+class StdoutSink(Sink):
+    """JSON lines on standard output, i.e. the forwarder's own log group in Lambda.
+
+    Meant for debugging; never subscribe the forwarder to its own log group
+    while this sink is on.
+    """
+
+    kind = 'stdout'
+
+    def __init__(self, name: str = 'stdout', max_events: int = 1000, max_bytes: int = 200000,
+                 stream: Any = None, **options: Any):
+        super().__init__(name, max_events, max_bytes, **options)
+        self.stream = stream
+
+    def write(self, lines, log_group, dd_url, api_key):
+        text = b'\n'.join(lines).decode('utf-8') + '\n'
+        (self.stream or sys.stdout).write(text)
+        return len(text.encode('utf-8')), False
+
+
+_SINK_CLASSES = {'datadog': DatadogSink, 'file': FileSink, 'stdout': StdoutSink}
+
+
+class FanOut:
+    """Delivers each batch to every sink concurrently, from one serialization.
+
+    Every sink has a single-thread executor of its own, kept across warm
+    invocations, so a sink still busy with an earlier batch only delays itself.
+    deliver() waits for the required sinks, each up to its timeout, and
+    returns as soon as they are done. Optional sinks still running carry on
+    in the background (in Lambda, while the environment is thawed), and the
+    events they then fail to deliver are reported with their next batch. An
+    optional sink still on an earlier batch after its timeout is skipped
+    until it catches up.
+    """
+
+    def __init__(self, sinks: List[Sink]):
+        if not sinks:
+            raise ValueError("At least one sink is required")
+        names = [sink.name for sink in sinks]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Sink names must be unique: {names}")
+        self.sinks = sinks
+        self._executors = {
+            sink.name: concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sink-{sink.name}")
+            for sink in sinks
+        }
+        # Optional sinks' unfinished deliveries, by sink: when each was submitted
+        self._running: Dict[str, List[float]] = {sink.name: [] for sink in sinks}
+        # Optional deliveries an invocation returned without, and the events
+        # they failed once finished, carried into the sink's next result
+        self._pending: set = set()
+        self._late_failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def deliver(self, events: SerializedEvents, log_group: str = '', dd_url: Optional[str] = None,
+                api_key: Optional[Callable[[], str]] = None) -> List[SinkResult]:
+        """Deliver to every sink; returns once the required sinks are done or timed out"""
+        started = time.monotonic()
+        futures = []
+        for sink in self.sinks:
+            if not sink.required and self._backlogged(sink, started):
+                futures.append((sink, None))
+                continue
+            future = self._executors[sink.name].submit(sink.deliver, events, log_group, dd_url, api_key)
+            if not sink.required:
+                with self._lock:
+                    self._running[sink.name].append(started)
+                future.add_done_callback(functools.partial(self._finished, sink, started, len(events)))
+            futures.append((sink, future))
+
+        results: Dict[str, SinkResult] = {}
+        for sink, future in futures:
+            if sink.required:
+                results[sink.name] = self._wait(sink, future, events, started)
+        # Required sinks are done: take whatever optional sinks finished meanwhile
+        for sink, future in futures:
+            if sink.required:
+                continue
+            if future is None:
+                print(f"Sink {sink.name} is still delivering an earlier batch after {sink.timeout}s")
+                result = self._failed(sink, len(events), f"Timed out on an earlier batch after {sink.timeout}s")
+            else:
+                with self._lock:
+                    pending = not future.done()
+                    if pending:
+                        self._pending.add(future)
+                if pending:
+                    result = SinkResult(sink.name)
+                    result.pending = len(events)
+                else:
+                    result = self._wait(sink, future, events, started)
+            with self._lock:
+                result.failed += self._late_failures.pop(sink.name, 0)
+            results[sink.name] = result
+        return [results[sink.name] for sink in self.sinks]
+
+    def _wait(self, sink: Sink, future: 'concurrent.futures.Future', events: SerializedEvents,
+              started: float) -> SinkResult:
+        try:
+            return future.result(timeout=max(started + sink.timeout - time.monotonic(), 0))
+        except concurrent.futures.TimeoutError:
+            print(f"Sink {sink.name} did not finish within {sink.timeout}s")
+            return self._failed(sink, len(events), f"Timed out after {sink.timeout}s")
+        except Exception as e:
+            return self._failed(sink, len(events), str(e))
+
+    @staticmethod
+    def _failed(sink: Sink, count: int, error: str) -> SinkResult:
+        result = SinkResult(sink.name)
+        result.failed = count
+        result.error = error
+        return result
+
+    def _backlogged(self, sink: Sink, now: float) -> bool:
+        """Whether an optional sink's oldest unfinished batch is past its timeout"""
+        with self._lock:
+            running = self._running[sink.name]
+            return bool(running) and now - running[0] > sink.timeout
+
+    def _finished(self, sink: Sink, submitted: float, count: int, future: 'concurrent.futures.Future') -> None:
+        """Done callback of an optional delivery; records failures no invocation has reported"""
+        with self._lock:
+            self._running[sink.name].remove(submitted)
+            if future not in self._pending:
+                return
+            self._pending.discard(future)
+            try:
+                failed, error = future.result().failed, future.result().error
+            except Exception as e:
+                failed, error = count, str(e)
+            if failed:
+                self._late_failures[sink.name] = self._late_failures.get(sink.name, 0) + failed
+        if failed:
+            print(f"Sink {sink.name} failed to deliver {failed} events after the invocation returned: {error}")
+
+
+def create_sink(config: Dict[str, Any]) -> Sink:
+    """Build one sink from its JSON object"""
+    if not isinstance(config, dict) or config.get('type') not in SINK_TYPES:
+        raise ValueError(f"Sink type must be one of {', '.join(SINK_TYPES)}: {config!r}")
+    options = dict(config)
+    kind = options.pop('type')
+    options.setdefault('name', kind)
+    if _NAME_RE.search(options['name']):
+        raise ValueError(f"Sink name may only contain letters, digits and underscores: {options['name']!r}")
+    try:
+        return _SINK_CLASSES[kind](**options)
+    except TypeError as e:
+        raise ValueError(f"Invalid settings for sink '{options['name']}': {str(e)}")
+
+
+def load_sinks(value: str) -> Optional[FanOut]:
+    """Build the fan-out from a JSON list of sink objects; None for an empty setting"""
+    if not value.strip():
+        return None
+    configs = json.loads(value)
+    if not isinstance(configs, list):
+        raise ValueError("Sinks must be a JSON list")
+    return FanOut([create_sink(config) for config in configs])
+
+
+fan_out = load_sinks(os.environ.get('DD_FORWARDER_SINKS', ''))
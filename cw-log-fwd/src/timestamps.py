@@ -0,0 +1,135 @@
+import calendar
+import re
+from typing import Any, Dict, Optional
+
+# A message's own time is forwarded as the event's "timestamp" (epoch
+# milliseconds); CloudWatch's timestamp is only the fallback. Keys are tried
+# in order; access_time is what the access_log parser extracts.
+TIME_KEYS = ('timestamp', '@timestamp', 'time', 'ts', 'access_time')
+
+# Epoch values above this are milliseconds, below it seconds (~1973 in ms)
+_MILLIS_THRESHOLD = 100_000_000_000
+# Earliest time taken as a message's own (2000-01-01), so that a duration such
+# as "time": 0.123 is not read as 123 ms after the epoch
+_MIN_MILLIS = 946_684_800_000
+# How far a message's time may be from CloudWatch's: CloudWatch itself refuses
+# events more than 14 days older or 2 hours newer than when they are put
+_MAX_PAST_MILLIS = 14 * 24 * 3600 * 1000
+_MAX_FUTURE_MILLIS = 2 * 3600 * 1000
+# Past year 5000 in milliseconds; also keeps Infinity out of int()
+_MAX_MILLIS = 100_000_000_000_000
+
+# Seconds since the epoch of a "YYYY-MM-DDTHH:MM:SS" prefix, in UTC. Events of
+# one batch mostly share a handful of seconds, so the calendar arithmetic runs
+# once per second rather than once per event.
+_CACHE_SIZE = 4096
+_second_cache: Dict[str, Optional[int]] = {}
+
+_ISO_SECOND_RE = re.compile(r'(\d{4})-(\d{2})-(\d{2})[T ](\d{2}):(\d{2}):(\d{2})')
+_ISO_TAIL_RE = re.compile(r'(?:[.,](\d{1,9}))?(Z|z|[+-]\d{2}(?::?\d{2})?)?')
+
+# Access log time, e.g. "21/Feb/2025:10:00:00 +0000"
+_CLF_RE = re.compile(r'(\d{2})/([A-Z][a-z]{2})/(\d{4}):(\d{2}):(\d{2}):(\d{2}) ([+-]\d{4})')
+_MONTHS = {name: number for number, name in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'), 1)}
+
+
+def _epoch_seconds(year: int, month: int, day: int, hour: int, minute: int, second: int) -> Optional[int]:
+    if not (1 <= month <= 12 and 1 <= day <= 31 and hour <= 23 and minute <= 59 and second <= 60):
+        return None
+    return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0))
+
+
+def _offset_seconds(zone: Optional[str]) -> int:
+    """Seconds east of UTC of "Z", "+02:00", "+0200" or "+02"; no zone means UTC"""
+    if not zone or zone in ('Z', 'z'):
+        return 0
+    digits = zone[1:].replace(':', '')
+    offset = int(digits[:2]) * 3600 + int(digits[2:4] or 0) * 60
+    return -offset if zone[0] == '-' else offset
+
+
+def _cached_seconds(key: str, compute: Any) -> Optional[int]:
+    seconds = _second_cache.get(key, -1)
+    if seconds == -1:
+        if len(_second_cache) >= _CACHE_SIZE:
+            _second_cache.clear()
+        seconds = _second_cache[key] = compute(key)
+    return seconds
+
+
+def _iso_prefix_seconds(prefix: str) -> Optional[int]:
+    match = _ISO_SECOND_RE.fullmatch(prefix)
+    return _epoch_seconds(*map(int, match.groups())) if match else None
+
+
+def parse_iso8601(value: str) -> Optional[int]:
+    """Epoch milliseconds of an ISO-8601 date-time such as 2025-02-21T10:00:00.123456Z, or None"""
+    prefix = value[:19]
+    seconds = _second_cache.get(prefix, -1)
+    if seconds == -1:
+        seconds = _cached_seconds(prefix, _iso_prefix_seconds)
+    if seconds is None:
+        return None
+    tail = value[19:]
+    # Fast path for UTC with milli- or microseconds, what almost every logger writes
+    if len(tail) in (5, 8) and tail[0] == '.' and tail[-1] == 'Z' and tail[1:-1].isdigit():
+        return seconds * 1000 + int(tail[1:4])
+    if not tail or tail == 'Z':
+        return seconds * 1000
+    match = _ISO_TAIL_RE.fullmatch(tail)
+    if match is None:
+        return None
+    fraction, zone = match.groups()
+    millis = int(fraction[:3].ljust(3, '0')) if fraction else 0
+    return (seconds - _offset_seconds(zone)) * 1000 + millis
+
+
+def _clf_seconds(value: str) -> Optional[int]:
+    match = _CLF_RE.fullmatch(value)
+    if match is None:
+        return None
+    day, month, year, hour, minute, second, zone = match.groups()
+    if month not in _MONTHS:
+        return None
+    seconds = _epoch_seconds(int(year), _MONTHS[month], int(day), int(hour), int(minute), int(second))
+    return None if seconds is None else seconds - _offset_seconds(zone)
+
+
+def to_millis(value: Any) -> Optional[int]:
+    """Epoch milliseconds of an ISO-8601 or access log string, or of epoch seconds/milliseconds.
+
+    Numbers before year 2000, in either unit, are not taken for times.
+    """
+    if isinstance(value, str):
+        if len(value) >= 19 and value[4] == '-':
+            return parse_iso8601(value)
+        if len(value) == 26 and value[2] == '/':
+            seconds = _cached_seconds(value, _clf_seconds)
+            return None if seconds is None else seconds * 1000
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 < value < _MAX_MILLIS:
+        millis = int(value) if value >= _MILLIS_THRESHOLD else int(value * 1000)
+        return millis if millis >= _MIN_MILLIS else None
+    return None
+
+
+def event_time(attributes: Optional[Dict[str, Any]], fallback: Any) -> Any:
+    """The message's own time in epoch milliseconds, else `fallback` (CloudWatch's timestamp).
+
+    A time outside the window CloudWatch accepts around `fallback`, or before
+    year 2000, is taken for some other value and skipped.
+    """
+    if not attributes:
+        return fallback
+    if isinstance(fallback, int) and fallback >= _MIN_MILLIS:
+        earliest, latest = fallback - _MAX_PAST_MILLIS, fallback + _MAX_FUTURE_MILLIS
+    else:
+        earliest, latest = _MIN_MILLIS, _MAX_MILLIS
+    for key in TIME_KEYS:
+        value = attributes.get(key)
+        if value is not None:
+            millis = to_millis(value)
+            if millis is not None and earliest <= millis <= latest:
+                return millis
+    return fallback
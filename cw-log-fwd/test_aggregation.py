@@ -0,0 +1,126 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+from src.aggregation import COUNT, DEFAULT_BUCKETS, Aggregation, get_field
+from src.routing import Route, RoutingTable, load_routes
+from src.lambda_function import lambda_handler, get_metrics_url
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def access_events():
+    return [
+        {'method': 'GET', 'status_code': 200, 'response_time': 10},
+        {'method': 'GET', 'status_code': 200, 'response_time': 20},
+        {'method': 'GET', 'status_code': 500, 'response_time': 900},
+        {'method': 'POST', 'status_code': 201, 'response_time': 40, 'repeat_count': 3},
+    ]
+
+def by_name(series, name, tag=None):
+    return [s for s in series if s['metric'] == name and (tag is None or tag in s['tags'])]
+
+def test_get_field():
+    """Test dotted paths reach nested attributes"""
+    assert get_field({'http': {'status_code': 200}}, 'http.status_code') == 200
+    assert get_field({'http': 'x'}, 'http.status_code') is None
+
+def test_counters_and_histograms():
+    """Test counts per value and latency summaries per group"""
+    series = Aggregation(counters=['status_code'], histograms=['response_time'],
+                         group_by=['method']).aggregate(access_events(), '/app', timestamp=100)
+
+    get = by_name(series, 'cloudwatch.logs.events', 'method:GET')[0]
+    assert get['points'] == [{'timestamp': 100, 'value': 3}]
+    assert 'log_group:/app' in get['tags']
+    assert by_name(series, 'cloudwatch.logs.status_code.count', 'status_code:200')[0]['points'][0]['value'] == 2
+
+    assert by_name(series, 'cloudwatch.logs.response_time.samples', 'method:GET')[0]['points'][0]['value'] == 3
+    assert by_name(series, 'cloudwatch.logs.response_time.sum', 'method:GET')[0]['points'][0]['value'] == 930
+    # Only counts are sent, so series from separate invocations add up
+    assert {s['type'] for s in series} == {COUNT}
+
+    # A collapsed event counts repeat_count times
+    post = 'method:POST'
+    assert by_name(series, 'cloudwatch.logs.events', post)[0]['points'][0]['value'] == 3
+    assert by_name(series, 'cloudwatch.logs.response_time.samples', post)[0]['points'][0]['value'] == 3
+
+def test_histogram_buckets():
+    """Test histograms send cumulative bucket counts, apart from a counter on the same field"""
+    series = Aggregation(counters=['response_time'], histograms=['response_time'], buckets=[10, 100],
+                         group_by=['method']).aggregate(access_events(), '/app', timestamp=100)
+
+    buckets = {tag: s['points'][0]['value'] for s in by_name(series, 'cloudwatch.logs.response_time.bucket',
+                                                               'method:GET')
+               for tag in s['tags'] if tag.startswith('le:')}
+    assert buckets == {'le:10': 1, 'le:100': 2, 'le:inf': 3}
+    # The counter keeps its own name: one series per value, not the histogram's total
+    counted = by_name(series, 'cloudwatch.logs.response_time.count', 'method:GET')
+    assert sorted(s['points'][0]['value'] for s in counted) == [1, 1, 1]
+    assert by_name(series, 'cloudwatch.logs.response_time.samples', 'method:GET')[0]['points'][0]['value'] == 3
+
+def test_route_aggregate_config():
+    """Test aggregation settings load from a routing rule and are validated"""
+    routes = load_routes(json.dumps([
+        {'match': '/app/*', 'aggregate': {'counters': ['status_code'], 'drop_raw': True}},
+    ]))
+    assert routes[0].aggregation.drop_raw
+
+    with pytest.raises(ValueError):
+        Route('/a', aggregate={'counters': 'status_code'})
+    with pytest.raises(ValueError):
+        Route('/a', aggregate={'percentiles': [99]})
+    with pytest.raises(ValueError):
+        Route('/a', aggregate={'histograms': ['response_time'], 'buckets': [100, 10]})
+    assert Route('/a', aggregate={'histograms': ['response_time'], 'buckets': [1, 2.5]}).aggregation.buckets == [1, 2.5]
+    with pytest.raises(ValueError):
+        Route('/a', aggregate={})
+
+def test_get_metrics_url():
+    """Test metrics go to the API host of the route's site or a stand-in"""
+    assert get_metrics_url() == 'https://api.datadoghq.com/api/v2/series'
+    assert get_metrics_url('datadoghq.eu') == 'https://api.datadoghq.eu/api/v2/series'
+    with patch.dict(os.environ, {'DD_METRICS_URL': 'http://127.0.0.1:9/series'}):
+        assert get_metrics_url() == 'http://127.0.0.1:9/series'
+
+@patch('intake.get_client')
+def test_lambda_handler_drops_raw_events(mock_get_client, mock_env):
+    """Test an aggregating route ships series instead of the raw events"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    table = RoutingTable([Route('/aws/lambda/*', aggregate={
+        'counters': ['status_code'], 'histograms': ['response_time'], 'drop_raw': True,
+    })])
+    messages = [json.dumps({'status_code': 200, 'response_time': i}) for i in range(20)]
+    event = create_cloudwatch_event([{'id': str(i), 'timestamp': i, 'message': m} for i, m in enumerate(messages)])
+
+    with patch('routing.routing_table', table):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    assert mock_get_client.call_count == 1
+    assert mock_get_client.call_args[0][0].endswith('/api/v2/series')
+    body = json.loads(mock_get_client.return_value.post.call_args[0][0])
+    assert len(body['series']) == 1 + 1 + 2 + len(DEFAULT_BUCKETS) + 1
+
+@patch('intake.get_client')
+def test_lambda_handler_keeps_raw_events(mock_get_client, mock_env):
+    """Test raw events are still forwarded unless drop_raw is set"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    table = RoutingTable([Route('/aws/lambda/*', aggregate={'counters': ['status_code']})])
+    event = create_cloudwatch_event([{'id': '1', 'timestamp': 1, 'message': '{"status_code": 404}'}])
+
+    with patch('routing.routing_table', table):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    urls = [call[0][0] for call in mock_get_client.call_args_list]
+    assert urls[0].endswith('/api/v2/series')
+    assert urls[1].endswith('/api/v2/logs')
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,187 @@
+import gzip
+import io
+import json
+import os
+import socket
+import urllib.error
+import pytest
+from unittest.mock import patch
+from src.batching import (
+    MAX_BATCH_BYTES, MAX_BATCH_EVENTS, MIN_BATCH_BYTES, TIMED_OUT, BatchSizer, BatchSizers, split_body
+)
+from src.buffering import LocalSpillStore
+from src.records import SerializedEvents
+from src.quotas import LocalQuotaStore, QuotaManager, spilled_files
+from src.lambda_function import lambda_handler, send_to_datadog
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+URL = 'https://http-intake.logs.datadoghq.com/api/v2/logs'
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+@pytest.fixture
+def sizers():
+    sizers = BatchSizers(adaptive=True)
+    with patch('batching.sizers', sizers):
+        yield sizers
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch('src.lambda_function.SEND_RETRY_BACKOFF', 0):
+        yield
+
+def http_error(code, headers=None):
+    return urllib.error.HTTPError(URL, code, 'error', headers or {}, io.BytesIO(b''))
+
+def numbered(count):
+    return [{'n': i} for i in range(count)]
+
+def serialized(*chunk_sizes):
+    """Events numbered in order, encoded in chunks of the given sizes"""
+    chunks, number = [], 0
+    for size in chunk_sizes:
+        chunks.append(b'\n'.join(json.dumps({'n': number + i}).encode() for i in range(size)))
+        number += size
+    return SerializedEvents(chunks, number)
+
+def test_split_body_respects_limits():
+    """Test requests stay within both limits and keep every event in order, across chunk boundaries"""
+    events = serialized(3, 0, 4, 5)
+    requests = list(split_body(events, 5, 1000))
+    assert [count for count, _ in requests] == [5, 5, 2]
+    assert [event['n'] for _, body in requests for event in json.loads(body)] == list(range(12))
+
+    requests = list(split_body(events, 100, 40))
+    assert all(len(body) <= 40 for _, body in requests)
+    assert [count for count, _ in requests] == [len(json.loads(body)) for _, body in requests]
+    assert sum(count for count, _ in requests) == 12
+
+    # A batch within the limits is sent as the one body it already is
+    assert list(split_body(events, 12, 1000)) == [(12, events.body())]
+
+def test_sizer_shrinks_while_slow_and_grows_while_fast():
+    sizer = BatchSizer()
+    for _ in range(20):
+        sizer.observe(1000, sizer.target_bytes, 4000, 202)
+    assert sizer.target_bytes == MIN_BATCH_BYTES
+    assert sizer.target_events() == int(MIN_BATCH_BYTES / sizer.bytes_per_event)
+
+    for _ in range(40):
+        sizer.observe(1000, sizer.target_bytes, 50, 202)
+    assert sizer.target_bytes == MAX_BATCH_BYTES
+    assert sizer.target_events() == MAX_BATCH_EVENTS
+
+def test_sizer_on_intake_errors():
+    """Test a 413 halves the request below what was refused, and 429s make requests larger, not smaller"""
+    sizer = BatchSizer()
+    sizer.observe(500, 2000000, 100, 413)
+    assert sizer.target_bytes == 1000000
+
+    sizer.observe(500, 1000000, 100, 429)
+    assert sizer.target_bytes == 1250000
+    # Slow responses while throttled do not shrink requests either
+    sizer.observe(500, 1000000, 5000, 202)
+    assert sizer.target_bytes > 1250000
+
+    target = sizer.target_bytes
+    sizer.observe(500, 1000000, 100, 500)
+    assert sizer.target_bytes == target
+
+def test_sizers_per_log_group():
+    sizers = BatchSizers(adaptive=True, max_log_groups=2)
+    sizers.observe('/a', 10, 1000000, 100, 413)
+    sizers.observe('/b', 10, 1000, 100, 202)
+    assert sizers.limits('/a')[1] == 500000
+    # '/b' is now the least recently used and makes way for '/c'
+    sizers.observe('/c', 10, 1000, 100, 202)
+    assert list(sizers.sizers) == ['/a', '/c']
+
+    fixed = BatchSizers(adaptive=False)
+    fixed.observe('/a', 10, 1000000, 100, 413)
+    assert fixed.limits('/a') == (MAX_BATCH_EVENTS, MAX_BATCH_BYTES)
+
+@patch('intake.get_client')
+def test_lambda_handler_splits_large_batches(mock_get_client, mock_env, sizers, capsys):
+    """Test a batch over the event limit goes out in several requests, and the targets are reported"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    event = create_cloudwatch_event([{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(2500)])
+
+    assert lambda_handler(event, MockContext())['statusCode'] == 200
+
+    bodies = [json.loads(call[0][0]) for call in mock_get_client.return_value.post.call_args_list]
+    assert [len(body) for body in bodies] == [1000, 1000, 500]
+    assert [event['message'] for body in bodies for event in body] == [f'line {i}' for i in range(2500)]
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws":')]
+    assert (emf[-1]['Chunks'], emf[-1]['EventsOut']) == (3, 2500)
+    assert emf[-1]['TargetBatchEvents'] == MAX_BATCH_EVENTS
+    assert emf[-1]['TargetBatchBytes'] == MAX_BATCH_BYTES
+
+@patch('intake.get_client')
+def test_lambda_handler_throttled(mock_get_client, mock_env, sizers, capsys):
+    """Test a 429 fails the invocation, is counted and is remembered for the log group"""
+    mock_get_client.return_value.post.side_effect = urllib.error.HTTPError(URL, 429, 'Too Many Requests', {},
+                                                                           io.BytesIO(b''))
+    event = create_cloudwatch_event([{'id': '1', 'timestamp': 1, 'message': 'line'}])
+
+    assert lambda_handler(event, MockContext())['statusCode'] == 500
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws":')]
+    # Every attempt was throttled
+    assert (emf[-1]['ThrottledRequests'], emf[-1]['Retries']) == (3, 2)
+    assert sizers.sizers[emf[-1]['LogGroup']].throttle_rate > 0
+
+@patch('time.sleep')
+@patch('intake.get_client')
+def test_send_retries_only_the_failed_request(mock_get_client, mock_sleep, mock_env, sizers):
+    """Test a throttled request is retried after its Retry-After and the accepted ones are not resent"""
+    post = mock_get_client.return_value.post
+    post.side_effect = [mock_intake_response(), http_error(429, {'Retry-After': '2'}), mock_intake_response(),
+                        mock_intake_response()]
+    with patch.object(sizers, 'limits', return_value=(2, MAX_BATCH_BYTES)):
+        assert send_to_datadog(numbered(5), log_group='/app')['statusCode'] == 200
+    bodies = [[event['n'] for event in json.loads(call[0][0])] for call in post.call_args_list]
+    assert bodies == [[0, 1], [2, 3], [2, 3], [4]]
+    mock_sleep.assert_called_once_with(2.0)
+
+    # A wait longer than allowed is not sat out, and 4xx rejections are not retried
+    post.reset_mock(side_effect=True)
+    post.side_effect = http_error(429, {'Retry-After': '3600'})
+    assert send_to_datadog(numbered(1), log_group='/app')['statusCode'] == 500
+    post.side_effect = http_error(400)
+    assert send_to_datadog(numbered(1), log_group='/app')['statusCode'] == 500
+    assert post.call_count == 2
+
+@patch('intake.get_client')
+def test_send_spills_undelivered_requests(mock_get_client, mock_env, sizers, tmp_path):
+    """Test events after an accepted request that still fails go to the spill store, not back to Lambda"""
+    mock_get_client.return_value.post.side_effect = [mock_intake_response()] + [http_error(503)] * 3
+    store = LocalSpillStore(str(tmp_path))
+    with patch('quotas.quota_manager', QuotaManager(LocalQuotaStore(), None, store)), \
+            patch.object(sizers, 'limits', return_value=(2, MAX_BATCH_BYTES)):
+        assert send_to_datadog(numbered(5), log_group='/app')['statusCode'] == 200
+    [name] = spilled_files(store, '/app')
+    assert [json.loads(line)['n'] for line in gzip.decompress(store.read(name)).splitlines()] == [2, 3, 4]
+
+    # Nothing was accepted yet: the invocation fails and is retried whole
+    mock_get_client.return_value.post.side_effect = http_error(503)
+    with patch('quotas.quota_manager', QuotaManager(LocalQuotaStore(), None, store)):
+        assert send_to_datadog(numbered(1), log_group='/app')['statusCode'] == 500
+
+@patch('intake.get_client')
+def test_send_timeout_shrinks_requests(mock_get_client, mock_env, sizers):
+    """Test a request that timed out counts as a slow answer for the log group's sizer"""
+    mock_get_client.return_value.post.side_effect = urllib.error.URLError(socket.timeout('timed out'))
+    with patch.object(sizers, 'observe') as observe:
+        assert send_to_datadog(numbered(1), log_group='/app')['statusCode'] == 500
+    assert [call[0][4] for call in observe.call_args_list] == [TIMED_OUT] * 3
+
+    sizer = BatchSizer()
+    sizer.observe(10, MAX_BATCH_BYTES, 30000, TIMED_OUT)
+    assert sizer.target_bytes == MAX_BATCH_BYTES // 2
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,253 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+from src.buffering import EventBuffer, LocalSpillStore, S3SpillStore, create_event_buffer
+from src.lambda_function import lambda_handler
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+URL = 'https://http-intake.logs.datadoghq.com/api/v2/logs'
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class MemorySpillStore:
+    """Stand-in for the S3 spill store: shared by every instance"""
+
+    shared = True
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.files = {}
+        self.requests = 0
+
+    def write(self, name, data):
+        self.requests += 1
+        self.files[name] = (data, self.clock())
+
+    def read(self, name):
+        return self.files[name][0]
+
+    def exists(self, name):
+        return name in self.files
+
+    def delete(self, name):
+        self.files.pop(name, None)
+
+    def delete_many(self, names):
+        self.requests += 1
+        for name in names:
+            self.files.pop(name, None)
+
+    def list(self):
+        return [(name, modified) for name, (_, modified) in self.files.items()]
+
+class Intake:
+    def __init__(self, accept=True):
+        self.accept = accept
+        self.requests = []
+
+    def __call__(self, url, events):
+        if self.accept:
+            self.requests.append((url, json.loads(events.body())))
+        return self.accept
+
+def events(*messages):
+    return '\n'.join(json.dumps({'message': m}) for m in messages).encode(), len(messages)
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def test_buffering_needs_s3():
+    """Test buffering refuses to start without a durable spill store"""
+    with patch('src.buffering.BUFFER_ENABLED', True):
+        for dest in ('', '/tmp/dd-forwarder-buffer'):
+            with patch('src.buffering.BUFFER_SPILL', dest), pytest.raises(ValueError):
+                create_event_buffer()
+        with patch('src.buffering.BUFFER_SPILL', 's3://spill-bucket/buffer'):
+            assert isinstance(create_event_buffer().store, S3SpillStore)
+
+def test_persist_spills_held_events(tmp_path):
+    """Test buffered events are in the spill store once persisted, and written once"""
+    store = LocalSpillStore(str(tmp_path))
+    buffer = EventBuffer(store)
+    buffer.add(URL, *events('a', 'b'))
+    assert store.list() == []
+    assert buffer.persist() == 2
+    assert buffer.persist() == 0
+    assert len(store.list()) == 1
+    assert buffer.events == 2
+
+def test_events_flushed_when_added_are_never_spilled():
+    """Test a flush in the invocation that added the events costs no spill write, and one delete for the rest"""
+    clock = Clock()
+    store = MemorySpillStore(clock)
+    buffer = EventBuffer(store, max_events=3, clock=clock)
+    buffer.add(URL, *events('a'))
+    buffer.persist()
+    buffer.add(URL, *events('b'))
+    buffer.persist()
+    buffer.add(URL, *events('c'))
+    assert buffer.flush(Intake()) == (3, 0)
+    assert buffer.persist() == 0
+    # Two writes, one for each invocation that held events, and one delete request
+    assert (store.requests, store.files) == (3, {})
+
+def test_failed_persist_gives_events_back(tmp_path):
+    """Test chunks that could not be spilled leave the buffer for the caller to send"""
+    store = LocalSpillStore(str(tmp_path))
+    buffer = EventBuffer(store)
+    buffer.add(URL, *events('a'))
+    buffer.persist()
+    buffer.add(URL, *events('b'))
+    with patch.object(store, 'write', side_effect=OSError('AccessDenied')), pytest.raises(OSError):
+        buffer.persist()
+    assert buffer.events == 1
+
+def test_flush_thresholds():
+    clock = Clock()
+    buffer = EventBuffer(MemorySpillStore(clock), max_events=3, max_bytes=10000, max_age=10,
+                         deadline_margin=2000, clock=clock)
+    assert buffer.due() is None
+    buffer.add(URL, *events('a', 'b'))
+    assert buffer.due(remaining_ms=60000) is None
+    assert buffer.due(remaining_ms=500) == 'deadline'
+    clock.now += 10
+    assert buffer.due() == 'age'
+    buffer.add(URL, *events('c'))
+    assert buffer.due() == 'events'
+
+def test_freeze_thaw_flushes_in_order(tmp_path):
+    """Test events held while frozen go out in one request on the next invocation"""
+    clock = Clock()
+    buffer = EventBuffer(LocalSpillStore(str(tmp_path)), max_age=10, clock=clock)
+    intake = Intake()
+
+    buffer.add(URL, *events('first', 'second'))
+    assert buffer.due() is None
+    buffer.persist()
+    clock.now += 300  # frozen between invocations
+    buffer.add(URL, *events('third'))
+    assert buffer.due() == 'age'
+
+    assert buffer.flush(intake) == (3, 0)
+    assert [e['message'] for e in intake.requests[0][1]] == ['first', 'second', 'third']
+    assert os.listdir(tmp_path) == []
+
+def test_recycled_environment_is_recovered(tmp_path):
+    """Test a new runtime process sends what the previous one left buffered"""
+    buffer = EventBuffer(LocalSpillStore(str(tmp_path)))
+    buffer.add(URL, *events('held'))
+    buffer.persist()
+    # The environment is recycled; the next runtime process starts a new buffer
+    intake = Intake()
+    assert EventBuffer(LocalSpillStore(str(tmp_path))).flush(intake) == (1, 0)
+    assert intake.requests == [(URL, [{'message': 'held'}])]
+
+def test_failed_flush_keeps_events(tmp_path):
+    buffer = EventBuffer(LocalSpillStore(str(tmp_path)))
+    buffer.add(URL, *events('a'))
+    assert buffer.flush(Intake(accept=False)) == (0, 1)
+    buffer.persist()
+    assert len(os.listdir(tmp_path)) == 1
+    intake = Intake()
+    assert buffer.flush(intake) == (1, 0)
+    assert os.listdir(tmp_path) == []
+
+def test_shared_store_takes_over_orphans_only():
+    """Test another instance waits out the orphan age, and the thawed owner does not resend"""
+    clock = Clock()
+    store = MemorySpillStore(clock)
+    frozen = EventBuffer(store, orphan_age=900, clock=clock)
+    frozen.add(URL, *events('a'))
+    frozen.persist()
+
+    other = EventBuffer(store, orphan_age=900, clock=clock)
+    assert other.flush(Intake()) == (0, 0)
+
+    clock.now += 1000
+    late = EventBuffer(store, orphan_age=900, clock=clock)
+    intake = Intake()
+    assert late.flush(intake) == (1, 0)
+    assert len(intake.requests) == 1
+
+    thawed = Intake()
+    assert frozen.flush(thawed) == (0, 0)
+    assert thawed.requests == []
+
+def test_orphans_are_taken_over_after_the_first_scan():
+    """Test a running buffer lists the store again and takes over files that became orphans since"""
+    clock = Clock()
+    store = MemorySpillStore(clock)
+    running = EventBuffer(store, orphan_age=900, clock=clock)
+    running.add(URL, *events('own'))
+    running.persist()
+
+    recycled = EventBuffer(store, orphan_age=900, clock=clock)
+    recycled.add(URL, *events('orphan'))
+    recycled.persist()
+    intake = Intake()
+    assert running.flush(intake) == (1, 0)
+
+    # The other instance is recycled; once its file is old enough, the next flush picks it up
+    clock.now += 1000
+    assert running.flush(intake) == (1, 0)
+    assert [body[0]['message'] for _, body in intake.requests] == ['own', 'orphan']
+    assert store.files == {}
+
+def test_requests_respect_limits():
+    clock = Clock()
+    buffer = EventBuffer(MemorySpillStore(clock), max_events=2, clock=clock)
+    for message in 'abc':
+        buffer.add(URL, *events(message))
+    buffer.add('https://other/api/v2/logs', *events('d'))
+    intake = Intake()
+    assert buffer.flush(intake) == (4, 0)
+    assert [(url, len(body)) for url, body in intake.requests] == [
+        (URL, 2), (URL, 1), ('https://other/api/v2/logs', 1)
+    ]
+
+@patch('intake.get_client')
+def test_lambda_handler_buffers_until_due(mock_get_client, mock_env, tmp_path):
+    """Test small payloads are held and sent together once the buffer is full"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    buffer = EventBuffer(LocalSpillStore(str(tmp_path)), max_events=4)
+
+    with patch('buffering.event_buffer', buffer):
+        first = lambda_handler(create_cloudwatch_event(
+            [{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(2)]), MockContext())
+        assert mock_get_client.return_value.post.call_count == 0
+        second = lambda_handler(create_cloudwatch_event(
+            [{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(2, 4)]), MockContext())
+
+    assert first['statusCode'] == second['statusCode'] == 200
+    assert 'Flushed 4' in json.loads(second['body'])
+    body = json.loads(mock_get_client.return_value.post.call_args[0][0])
+    assert [event['message'] for event in body] == ['line 0', 'line 1', 'line 2', 'line 3']
+    assert os.listdir(tmp_path) == []
+
+@patch('intake.get_client')
+def test_lambda_handler_sends_events_it_cannot_spill(mock_get_client, mock_env, tmp_path):
+    """Test events are sent directly when the spill write fails, rather than held unspilled"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    store = LocalSpillStore(str(tmp_path))
+    buffer = EventBuffer(store)
+
+    with patch('buffering.event_buffer', buffer), patch.object(store, 'write', side_effect=OSError('AccessDenied')):
+        result = lambda_handler(create_cloudwatch_event([{'id': '1', 'timestamp': 1, 'message': 'line'}]),
+                                MockContext())
+
+    assert result['statusCode'] == 200
+    assert mock_get_client.return_value.post.call_count == 1
+    assert buffer.events == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,156 @@
+import json
+import os
+import time
+import pytest
+from unittest.mock import patch
+from src.dedup import Deduplicator, normalize, create_deduplicator
+from src.lambda_function import lambda_handler, process_log_events
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+def events(*messages, start=1000, step=1):
+    return [{'id': str(i), 'timestamp': start + i * step, 'message': m} for i, m in enumerate(messages)]
+
+def test_normalize():
+    """Test numbers, ids and addresses are replaced before fingerprinting"""
+    assert normalize('retry 3 of 5 to 10.0.1.7:5432') == 'retry # of # to #:#'
+    assert normalize('req 6f1c2a4e-1b2c-4d5e-8f90-123456789abc failed') == 'req # failed'
+    assert normalize('{"status_code": 500}') == '{"status_code": 500}'
+
+def test_collapse_consecutive_in_batch():
+    """Test runs of identical lines become one event with a repeat count"""
+    result = Deduplicator().collapse(events('refused', 'refused', 'refused', 'ok', 'refused'))
+
+    assert [e['message'] for e in result] == ['refused', 'ok', 'refused']
+    assert result[0]['repeat_count'] == 3
+    assert result[0]['first_timestamp'] == 1000
+    assert result[0]['last_timestamp'] == 1002
+    assert 'repeat_count' not in result[1]
+    assert 'repeat_count' not in result[2]
+
+def test_collapse_normalized():
+    """Test near-identical lines collapse unless normalization is off"""
+    batch = events('retry 1 failed', 'retry 2 failed', 'retry 3 failed')
+    assert len(Deduplicator(normalize_messages=True).collapse(batch)) == 1
+    assert len(Deduplicator(normalize_messages=False).collapse(batch)) == 3
+    assert len(Deduplicator().collapse(batch)) == 3
+
+def test_json_lines_are_never_normalized():
+    """Test JSON lines differing only in a number are kept apart, even with normalization on"""
+    batch = events('{"status_code": 200}', '{"status_code": 200}', '{"status_code": 500}')
+    result = Deduplicator(normalize_messages=True).collapse(batch)
+
+    assert [e['message'] for e in result] == ['{"status_code": 200}', '{"status_code": 500}']
+    assert result[0]['repeat_count'] == 2
+    assert 'repeat_count' not in result[1]
+
+def test_window_suppresses_across_invocations():
+    """Test repeats inside the window are counted and released once it passes"""
+    dedup = Deduplicator(window_seconds=10)
+    first = dedup.collapse(events('refused', start=0), '/app')
+    assert len(first) == 1
+
+    # Inside the window: nothing is forwarded
+    assert dedup.collapse(events('refused', 'refused', start=2000), '/app') == []
+
+    # A later batch past the window releases the pending count
+    later = dedup.collapse(events('other', start=11000), '/app')
+    summary = [e for e in later if e.get('repeat_count')]
+    assert summary[0]['repeat_count'] == 2
+    assert summary[0]['first_timestamp'] == 2000
+    assert summary[0]['last_timestamp'] == 2001
+
+def test_window_release_on_recurrence():
+    """Test a message seen again after the window carries the pending count first"""
+    dedup = Deduplicator(window_seconds=1)
+    dedup.collapse(events('refused', start=0), '/app')
+    dedup.collapse(events('refused', start=500), '/app')
+    result = dedup.collapse(events('refused', start=5000), '/app')
+
+    assert [e.get('repeat_count') for e in result] == [1, None]
+    assert result[1]['timestamp'] == 5000
+
+def test_window_is_per_log_group():
+    """Test the same message in another log group is not suppressed"""
+    dedup = Deduplicator(window_seconds=10)
+    dedup.collapse(events('refused'), '/app')
+    assert len(dedup.collapse(events('refused'), '/other')) == 1
+
+def test_lru_bounded():
+    """Test the fingerprint cache never exceeds its size and keeps evicted counts"""
+    dedup = Deduplicator(window_seconds=60, max_entries=2)
+    dedup.collapse(events('a', start=0), '/app')
+    assert dedup.collapse(events('a', start=1), '/app') == []
+    result = dedup.collapse(events('b', 'c', 'd', start=2), '/app')
+
+    assert len(dedup._seen) == 2
+    assert any(e.get('repeat_count') == 1 and e['message'] == 'a' for e in result)
+
+def test_counts_evicted_by_another_group_are_kept():
+    """Test a count evicted by another log group's batch is carried by its own group's next batch"""
+    dedup = Deduplicator(window_seconds=60, max_entries=2)
+    dedup.collapse(events('a', start=0), '/app')
+    assert dedup.collapse(events('a', start=1), '/app') == []
+    dedup.collapse(events('b', 'c', start=2), '/other')
+
+    result = dedup.collapse(events('d', start=3), '/app')
+    assert [(e['message'], e.get('repeat_count')) for e in result] == [('a', 1), ('d', None)]
+    assert dedup.take_held(3) == {}
+
+    # Or handed over for the next batch of any group
+    dedup.collapse(events('e', start=4), '/app')
+    dedup.collapse(events('e', start=5), '/app')
+    dedup.collapse(events('f', 'g', start=6), '/other')
+    held = dedup.take_held(7)
+    assert [e['message'] for e in held['/app']] == ['e']
+    assert dedup.collapse(events('h', start=8), '/app')[0]['message'] == 'h'
+
+def test_quiet_group_released_after_window():
+    """Test a group with no further batches gets its suppressed count once the window has passed"""
+    dedup = Deduplicator(window_seconds=10)
+    dedup.collapse(events('refused', start=0), '/app')
+    dedup.collapse(events('refused', 'refused', start=2000), '/app')
+
+    assert dedup.take_held(5000) == {}
+    held = dedup.take_held(10000)
+    assert [(e['message'], e['repeat_count']) for e in held['/app']] == [('refused', 2)]
+    assert dedup.take_held(30000) == {}
+
+@patch('intake.get_client')
+def test_lambda_handler_sends_held_counts(mock_get_client):
+    """Test an invocation for one log group sends the counts released for another, under that group"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    dedup = Deduplicator(window_seconds=10)
+    now = int(time.time() * 1000)
+    dedup.collapse(events('refused', start=now - 60000), '/quiet')
+    dedup.collapse(events('refused', 'refused', start=now - 59000), '/quiet')
+
+    with patch('dedup.deduplicator', dedup), patch.dict(os.environ, {'DD_API_KEY': 'test-api-key'}):
+        event = create_cloudwatch_event([{'id': '1', 'timestamp': now, 'message': 'line'}])
+        assert lambda_handler(event, MockContext())['statusCode'] == 200
+
+    bodies = [json.loads(call[0][0]) for call in mock_get_client.return_value.post.call_args_list]
+    assert [e['message'] for e in bodies[0]] == ['line']
+    assert [(e['cloudwatch']['log_group'], e['repeat_count']) for e in bodies[1]] == [('/quiet', 2)]
+
+def test_create_deduplicator():
+    """Test the mode comes from DD_FORWARDER_DEDUP"""
+    with patch('src.dedup.DEDUP_MODE', 'off'):
+        assert create_deduplicator() is None
+    with patch('src.dedup.DEDUP_MODE', 'window'):
+        assert create_deduplicator().window_ms > 0
+    with patch('src.dedup.DEDUP_MODE', 'sometimes'):
+        with pytest.raises(ValueError):
+            create_deduplicator()
+
+def test_process_log_events_collapses():
+    """Test collapsed events keep their repeat fields after parsing"""
+    batch = events(*['{"level": "ERROR", "message": "connection refused"}'] * 50)
+    with patch('dedup.deduplicator', Deduplicator()):
+        processed = process_log_events(batch, {'log_group_name': '/app'})
+
+    assert len(processed) == 1
+    assert processed[0]['repeat_count'] == 50
+    assert processed[0]['last_timestamp'] == 1049
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
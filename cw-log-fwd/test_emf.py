@@ -0,0 +1,124 @@
+import json
+import os
+import time
+import pytest
+from unittest.mock import patch
+from src.emf import InvocationMetrics, METRIC_UNITS, is_emf_line
+from src.lambda_function import lambda_handler, process_log_events
+from src.routing import Route, RoutingTable
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def emf_lines(output):
+    return [json.loads(line) for line in output.splitlines() if is_emf_line(line)]
+
+def test_document_declares_every_metric():
+    """Test the EMF document carries every metric with a LogGroup dimension"""
+    metrics = InvocationMetrics('/poc/dd-log')
+    metrics.set('EventsIn', 5)
+    metrics.increment('EventsOut', 3)
+    metrics.record_payload(100, 450)
+    metrics.record_latency(12.5)
+
+    document = metrics.to_document(timestamp_ms=1700000000000)
+
+    directive = document['_aws']['CloudWatchMetrics'][0]
+    assert directive['Dimensions'] == [['LogGroup']]
+    assert [m['Name'] for m in directive['Metrics']] == list(METRIC_UNITS)
+    assert document['LogGroup'] == '/poc/dd-log'
+    # Counted where events are dropped, not derived from EventsIn - EventsOut
+    assert document['EventsDropped'] == 0
+    assert document['CompressionRatio'] == 4.5
+    assert document['IntakeLatency'] == [12.5]
+
+def test_emit_skips_own_log_group(capsys):
+    """Test metrics about the forwarder's own log group are never written"""
+    with patch.dict(os.environ, {'AWS_LAMBDA_FUNCTION_NAME': 'forwarder'}):
+        assert InvocationMetrics('/aws/lambda/forwarder').emit() is False
+        assert InvocationMetrics('/poc/dd-log').emit() is True
+
+    assert len(emf_lines(capsys.readouterr().out)) == 1
+
+def test_emit_disabled(capsys):
+    """Test DD_FORWARDER_METRICS=false turns emission off"""
+    with patch.dict(os.environ, {'DD_FORWARDER_METRICS': 'false'}):
+        assert InvocationMetrics('/poc/dd-log').emit() is False
+    assert capsys.readouterr().out == ''
+
+def test_own_emf_lines_are_not_forwarded():
+    """Test the forwarder's EMF documents are dropped from its own log group only"""
+    emf_line = json.dumps(InvocationMetrics('/poc/dd-log').to_document(), separators=(',', ':'))
+    events = [
+        {'timestamp': 1, 'message': emf_line},
+        {'timestamp': 2, 'message': 'Plain text log message'},
+    ]
+    with patch.dict(os.environ, {'AWS_LAMBDA_FUNCTION_NAME': 'forwarder'}):
+        processed = process_log_events(events, {'log_group_name': '/aws/lambda/forwarder'})
+        assert [event['message'] for event in processed] == ['Plain text log message']
+        # Another application's EMF logs are its own data and are forwarded
+        assert len(process_log_events(events, {'log_group_name': '/aws/lambda/app'})) == 2
+
+def test_failed_invocations_emit_errors(capsys):
+    """Test an invocation failing on its API key or payload still writes its EMF line, with Errors"""
+    os.environ.pop('DD_API_KEY', None)
+    with patch.dict(os.environ, {'DD_API_KEY_SECRET_ARN': ''}):
+        assert lambda_handler(create_cloudwatch_event([]), MockContext())['statusCode'] == 500
+    with patch.dict(os.environ, {'DD_API_KEY': 'test-api-key'}):
+        assert lambda_handler({'awslogs': {'data': 'not base64 gzip'}}, MockContext())['statusCode'] == 500
+    assert [line['Errors'] for line in emf_lines(capsys.readouterr().out)] == [1, 1]
+
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_emits_one_line(mock_post, mock_env, capsys):
+    """Test each invocation writes exactly one EMF line"""
+    mock_post.return_value = mock_intake_response()
+    event = create_cloudwatch_event([
+        {'id': '1', 'timestamp': 1, 'message': 'first'},
+        {'id': '2', 'timestamp': 2, 'message': 'second'},
+    ])
+
+    result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    lines = emf_lines(capsys.readouterr().out)
+    assert len(lines) == 1
+    assert lines[0]['LogGroup'] == '/aws/lambda/test'
+    assert lines[0]['EventsIn'] == 2
+    assert lines[0]['EventsOut'] == 2
+    assert lines[0]['Chunks'] == 1
+    assert lines[0]['BytesOut'] > 0
+    assert len(lines[0]['IntakeLatency']) == 1
+    assert lines[0]['EventsDropped'] == 0
+
+@patch('intake.IntakeClient.post')
+def test_sampled_out_events_are_dropped(mock_post, mock_env, capsys):
+    """Test events a route samples out are counted as dropped"""
+    mock_post.return_value = mock_intake_response()
+    event = create_cloudwatch_event([{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(4)])
+
+    with patch('routing.routing_table', RoutingTable([Route('/aws/lambda/*', sample_rate=0.0)])):
+        lambda_handler(event, MockContext())
+
+    lines = emf_lines(capsys.readouterr().out)
+    assert (lines[0]['EventsIn'], lines[0]['EventsOut'], lines[0]['EventsDropped']) == (4, 0, 4)
+
+def test_emission_cost(capsys):
+    """Test building and writing the EMF line stays well under a millisecond"""
+    iterations = 1000
+    started = time.perf_counter()
+    for _ in range(iterations):
+        metrics = InvocationMetrics('/poc/dd-log')
+        metrics.set('EventsIn', 10)
+        metrics.record_latency(5.0)
+        metrics.emit()
+    elapsed_ms = (time.perf_counter() - started) * 1000 / iterations
+    capsys.readouterr()
+    assert elapsed_ms < 1.0
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
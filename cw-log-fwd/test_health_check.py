@@ -2,7 +2,10 @@ import json
 import os
 import pytest
 from unittest.mock import patch, MagicMock
-from src.health_check import lambda_handler, check_dependencies, check_datadog_access
+import importlib.metadata
+from src.health_check import (
+    lambda_handler, check_dependencies, parse_version, run_probes, get_validate_url, validate_api_key
+)
 
 @pytest.fixture
 def mock_env():
@@ -22,56 +25,79 @@ def mock_secrets_manager():
         }
         yield mock_client
 
+@pytest.fixture
+def mock_intake_probe():
+    with patch('src.health_check.check_intake', return_value=(True, 'Resolved in 1.0ms')) as mock_probe:
+        yield mock_probe
+
+def test_parse_version():
+    """Test versions compare numerically, not as strings"""
+    assert parse_version('1.26.18') == (1, 26, 18)
+    assert parse_version('2.0.0rc1') == (2, 0, 0)
+    assert parse_version('1.100.0') > parse_version('1.20.0')
+
 def test_check_dependencies_success():
     """Test successful dependency check"""
     ok, missing = check_dependencies()
     assert ok is True
     assert len(missing) == 0
 
-@patch('importlib.import_module')
-def test_check_dependencies_missing(mock_import):
+@patch('importlib.metadata.version')
+def test_check_dependencies_missing(mock_version):
     """Test dependency check with missing package"""
-    mock_import.side_effect = ImportError("No module named 'missing_package'")
+    mock_version.side_effect = importlib.metadata.PackageNotFoundError('missing_package')
     ok, missing = check_dependencies()
     assert ok is False
     assert len(missing) > 0
     assert "is not installed" in missing[0]
 
-@patch('importlib.import_module')
-def test_check_dependencies_old_version(mock_import):
+@patch('importlib.metadata.version')
+def test_check_dependencies_old_version(mock_version):
     """Test dependency check with old version"""
-    mock_module = MagicMock()
-    mock_module.__version__ = '0.1.0'
-    mock_import.return_value = mock_module
+    mock_version.return_value = '0.1.0'
     ok, missing = check_dependencies()
     assert ok is False
     assert len(missing) > 0
     assert "is lower than required" in missing[0]
 
+@patch('importlib.metadata.version')
+def test_check_dependencies_compares_numerically(mock_version):
+    """Test 1.100.0 satisfies a 1.26.0 minimum"""
+    mock_version.return_value = '1.100.0'
+    ok, missing = check_dependencies()
+    assert ok is True
+
 @patch('urllib.request.urlopen')
-def test_check_datadog_access_success(mock_urlopen, mock_env):
+def test_validate_api_key_success(mock_urlopen, mock_env):
     """Test successful Datadog access check"""
     mock_response = MagicMock()
     mock_response.status = 200
     mock_urlopen.return_value.__enter__.return_value = mock_response
-    
-    ok, message = check_datadog_access()
+
+    ok, message = validate_api_key('test-api-key')
     assert ok is True
     assert "Successfully" in message
+    assert mock_urlopen.call_args[0][0].full_url == 'https://api.datadoghq.com/api/v1/validate'
 
-def test_check_datadog_access_failure(mock_secrets_manager):
-    """Test Datadog access check with missing configuration"""
+def test_get_validate_url():
+    """Test the validation URL is built from the site, not the intake URL"""
+    with patch.dict(os.environ, {'DD_SITE': 'datadoghq.eu'}):
+        assert get_validate_url() == 'https://api.datadoghq.eu/api/v1/validate'
+
+def test_probes_report_missing_secret(mock_secrets_manager, mock_intake_probe):
+    """Test the secret and access probes fail with the missing configuration"""
     if 'DD_API_KEY' in os.environ:
         del os.environ['DD_API_KEY']
     mock_secrets_manager.get_secret_value.return_value = {
         'SecretString': json.dumps({})
     }
-    ok, message = check_datadog_access()
-    assert ok is False
-    assert "DD_API_KEY_SECRET_ARN" in message
+    checks = run_probes()
+    assert checks['secret']['status'] == 'error'
+    assert checks['datadog_access']['status'] == 'error'
+    assert "DD_API_KEY_SECRET_ARN" in checks['secret']['details']
 
 @patch('urllib.request.urlopen')
-def test_lambda_handler_success(mock_urlopen, mock_env):
+def test_lambda_handler_success(mock_urlopen, mock_env, mock_intake_probe):
     """Test successful health check"""
     mock_response = MagicMock()
     mock_response.status = 200
@@ -82,8 +108,54 @@ def test_lambda_handler_success(mock_urlopen, mock_env):
     body = json.loads(result['body'])
     assert body['status'] == 'ok'
     assert all(check['status'] == 'ok' for check in body['checks'].values())
+    assert set(body['checks']) == {'dependencies', 'secret', 'intake', 'datadog_access'}
+    assert all('latency_ms' in check for check in body['checks'].values())
+    assert body['cached'] is False
+
+@patch('urllib.request.urlopen')
+def test_lambda_handler_cached(mock_urlopen, mock_env, mock_intake_probe):
+    """Test a healthy result is reused until its TTL expires or a refresh is asked for"""
+    mock_urlopen.return_value.__enter__.return_value = MagicMock(status=200)
+
+    lambda_handler({}, None)
+    cached = lambda_handler({}, None)
+    assert json.loads(cached['body'])['cached'] is True
+    assert mock_urlopen.call_count == 1
+
+    refreshed = lambda_handler({'refresh': True}, None)
+    assert json.loads(refreshed['body'])['cached'] is False
+    assert mock_urlopen.call_count == 2
+
+def test_probes_run_in_parallel(mock_env):
+    """Test slow probes overlap and a hung probe is cut off at the timeout"""
+    import time
+
+    def slow_intake(timeout):
+        time.sleep(0.2)
+        return True, 'ok'
+
+    def slow_validate(api_key, timeout):
+        time.sleep(0.2)
+        return True, 'ok'
+
+    def hung_dependencies():
+        time.sleep(2)
+        return True, []
+
+    with patch('src.health_check.check_intake', side_effect=slow_intake), \
+         patch('src.health_check.validate_api_key', side_effect=slow_validate), \
+         patch('src.health_check.check_dependencies', side_effect=hung_dependencies):
+        started = time.monotonic()
+        checks = run_probes(timeout=0.5)
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 1.0
+    assert checks['intake']['status'] == 'ok'
+    assert checks['datadog_access']['status'] == 'ok'
+    assert checks['dependencies']['status'] == 'error'
+    assert 'Timed out' in checks['dependencies']['details']
 
-def test_lambda_handler_failure(mock_secrets_manager):
+def test_lambda_handler_failure(mock_secrets_manager, mock_intake_probe):
     """Test health check with failures"""
     if 'DD_API_KEY' in os.environ:
         del os.environ['DD_API_KEY']
@@ -91,8 +163,8 @@ def test_lambda_handler_failure(mock_secrets_manager):
         'SecretString': json.dumps({})
     }
 
-    with patch('importlib.import_module') as mock_import:
-        mock_import.side_effect = ImportError("No module named 'missing_package'")
+    with patch('importlib.metadata.version') as mock_version:
+        mock_version.side_effect = importlib.metadata.PackageNotFoundError('missing_package')
         result = lambda_handler({}, None)
 
     assert result['statusCode'] == 500
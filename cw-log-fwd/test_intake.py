@@ -0,0 +1,114 @@
+import http.server
+import json
+import os
+import threading
+import time
+import urllib.error
+import pytest
+from unittest.mock import patch
+import src.lambda_function as lambda_function
+from src.emf import InvocationMetrics
+from src.intake import IntakeClient
+
+class IntakeHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server.requests.append((self.client_address, body))
+        self.send_response(server.status)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'{}')
+        # Close without telling the client, like an intake dropping an idle connection
+        self.close_connection = server.drop_connections
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def intake_server():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), IntakeHandler)
+    server.requests = []
+    server.status = 202
+    server.drop_connections = False
+    server.url = f"http://127.0.0.1:{server.server_port}/api/v2/logs"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_connection_reused(intake_server):
+    """Test consecutive posts share one connection"""
+    client = IntakeClient(intake_server.url)
+    first = client.post(b'[1]', {'Content-Type': 'application/json'})
+    second = client.post(b'[2]', {'Content-Type': 'application/json'})
+    client.close()
+
+    assert (first.status, first.reused) == (202, False)
+    assert (second.status, second.reused) == (202, True)
+    assert len({address for address, _ in intake_server.requests}) == 1
+
+def test_http_error_raised(intake_server):
+    """Test error statuses surface as urllib HTTPError"""
+    intake_server.status = 403
+    client = IntakeClient(intake_server.url)
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        client.post(b'[]', {})
+    assert excinfo.value.code == 403
+    assert excinfo.value.fp.read() == b'{}'
+
+def test_stale_connection_reopened(intake_server):
+    """Test a connection closed by the intake while idle is replaced transparently"""
+    intake_server.drop_connections = True
+    client = IntakeClient(intake_server.url)
+    client.post(b'[1]', {})
+    time.sleep(0.05)
+    response = client.post(b'[2]', {})
+
+    assert response.status == 202
+    assert [body for _, body in intake_server.requests] == [b'[1]', b'[2]']
+
+def test_connection_refused():
+    """Test connection failures surface as urllib URLError"""
+    client = IntakeClient('http://127.0.0.1:9/api/v2/logs', timeout=1)
+    with pytest.raises(urllib.error.URLError):
+        client.post(b'[]', {})
+
+def test_warm_up_opens_connection(intake_server):
+    """Test the init-time warmup leaves an open connection for the first send"""
+    with patch.dict(os.environ, {'DD_API_KEY': 'test-api-key', 'DD_INTAKE_URL': intake_server.url}):
+        assert lambda_function.warm_up(timeout=2) is True
+        client = lambda_function.intake.get_client(intake_server.url)
+        response = client.post(b'[]', {})
+
+    assert response.reused is True
+
+def test_warm_up_timeout():
+    """Test a slow dependency cannot stall init beyond the warmup timeout"""
+    with patch.dict(os.environ, {'DD_API_KEY': 'test-api-key'}), \
+         patch.object(lambda_function.intake.IntakeClient, 'connect', side_effect=lambda timeout=None: time.sleep(1)):
+        started = time.monotonic()
+        assert lambda_function.warm_up(timeout=0.1) is False
+        assert time.monotonic() - started < 0.5
+
+def test_api_key_cached():
+    """Test the secret is fetched once and counted as a cache hit afterwards"""
+    with patch.dict(os.environ, {'DD_API_KEY_SECRET_ARN': 'arn:aws:secretsmanager:us-east-1:123456789012:secret:dd'}), \
+         patch.object(lambda_function, '_api_key_cache', None), \
+         patch.object(lambda_function, 'secrets_client') as mock_client:
+        os.environ.pop('DD_API_KEY', None)
+        mock_client.get_secret_value.return_value = {
+            'SecretString': json.dumps({'DD_API_KEY': 'test-secret-api-key'})
+        }
+        metrics = InvocationMetrics()
+        assert lambda_function.get_api_key(metrics) == 'test-secret-api-key'
+        assert lambda_function.get_api_key(metrics) == 'test-secret-api-key'
+
+    assert mock_client.get_secret_value.call_count == 1
+    assert metrics.values['SecretCacheHits'] == 1
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -4,8 +4,9 @@ import gzip
 import base64
 import pytest
 from unittest.mock import patch, MagicMock
-from src.lambda_function import lambda_handler, parse_message
+from src.lambda_function import lambda_handler, process_log_events
 from src.health_check import lambda_handler as health_check_handler
+from src.intake import IntakeResponse
 from datetime import datetime, timezone
 import urllib.request
 import urllib.error
@@ -66,8 +67,9 @@ def test_parse_message_json():
         "status_code": 200
     })
     
-    result = parse_message(message)
+    result = process_log_events([{'timestamp': 1, 'message': message}], {'log_group_name': '/test'})[0]
     
+    assert result['status_code'] == 200
     assert result['ddsource'] == 'cloudwatch'
     assert 'app_id:fastapi-demo' in result['ddtags']
     assert 'app_name:fastapi-demo-app' in result['ddtags']
@@ -79,32 +81,21 @@ def test_parse_message_non_json():
     """Test parsing a non-JSON message"""
     message = "Plain text log message"
     
-    result = parse_message(message)
+    result = process_log_events([{'timestamp': 1, 'message': message}], {'log_group_name': '/test'})[0]
     
     assert result['message'] == message
     assert result['ddsource'] == 'cloudwatch'
     assert 'app_id:fastapi-demo' in result['ddtags']
     assert result['host'] == 'simulator'
 
-class MockResponse:
-    def __init__(self, status=200, data=""):
-        self.status = status
-        self._data = data.encode('utf-8')
+def mock_intake_response(status=202, data="{}", reused=False):
+    """Response returned by a mocked IntakeClient.post"""
+    return IntakeResponse(status, data.encode('utf-8'), reused)
 
-    def read(self):
-        return self._data
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
-
-@patch('urllib.request.urlopen')
-def test_lambda_handler_success(mock_urlopen, context, mock_env, mock_secrets_manager):
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_success(mock_post, context, mock_env, mock_secrets_manager):
     """Test successful log forwarding"""
-    mock_response = MockResponse(status=200, data="OK")
-    mock_urlopen.return_value = mock_response
+    mock_post.return_value = mock_intake_response()
     
     log_events = [{
         "id": "event1",
@@ -121,14 +112,34 @@ def test_lambda_handler_success(mock_urlopen, context, mock_env, mock_secrets_ma
     result = lambda_handler(event, context)
     
     assert result['statusCode'] == 200
-    assert mock_urlopen.called
-    assert isinstance(mock_urlopen.call_args[0][0], urllib.request.Request)
+    assert mock_post.called
+    body, headers = mock_post.call_args[0]
+    assert json.loads(body)[0]['app_id'] == 'fastapi-demo'
+    assert headers['DD-API-KEY'] == 'test-api-key'
+
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_oversized_line(mock_post, context, mock_env, mock_secrets_manager):
+    """Test one huge line is split to fit instead of failing the batch"""
+    mock_post.return_value = mock_intake_response()
+    log_events = [
+        {"id": "event1", "timestamp": 1000, "message": "x" * 5000},
+        {"id": "event2", "timestamp": 1001, "message": "Test message"},
+    ]
+
+    with patch('records.MAX_EVENT_BYTES', 2000), patch('records.OVERSIZE_MODE', 'split'):
+        result = lambda_handler(create_cloudwatch_event(log_events), context)
 
-@patch('urllib.request.urlopen')
-def test_lambda_handler_api_error(mock_urlopen, context, mock_env, mock_secrets_manager):
+    assert result['statusCode'] == 200
+    body = json.loads(mock_post.call_args[0][0])
+    assert [event['split']['part'] for event in body[:-1]] == list(range(1, len(body)))
+    assert ''.join(event['message'] for event in body[:-1]) == 'x' * 5000
+    assert body[-1]['message'] == 'Test message'
+
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_api_error(mock_post, context, mock_env, mock_secrets_manager):
     """Test handling of Datadog API error"""
-    mock_urlopen.side_effect = urllib.error.HTTPError(
-        url='https://http-intake.logs.datadoghq.com/v1/input',
+    mock_post.side_effect = urllib.error.HTTPError(
+        url='https://http-intake.logs.datadoghq.com/api/v2/logs',
         code=403,
         msg='Forbidden',
         hdrs={},
@@ -185,10 +196,10 @@ def test_lambda_handler_missing_env_and_secret(context, mock_secrets_manager):
     assert result['statusCode'] == 500
     assert 'error' in json.loads(result['body'])
 
-@patch('urllib.request.urlopen')
-def test_lambda_handler_network_error(mock_urlopen, context, mock_env, mock_secrets_manager):
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_network_error(mock_post, context, mock_env, mock_secrets_manager):
     """Test handling of network errors"""
-    mock_urlopen.side_effect = urllib.error.URLError('Connection refused')
+    mock_post.side_effect = urllib.error.URLError('Connection refused')
     
     log_events = [{
         "id": "event1",
@@ -221,9 +232,10 @@ def test_lambda_handler_secret_manager_error(context, mock_secrets_manager):
     assert result['statusCode'] == 500
     assert 'error' in json.loads(result['body'])
 
+@patch('health_check.check_intake', return_value=(True, 'Resolved in 1.0ms'))
 @patch('urllib.request.urlopen')
 @patch('boto3.session.Session')
-def test_lambda_handler_health_check_success(mock_session, mock_urlopen, context, mock_env, mock_secrets_manager):
+def test_lambda_handler_health_check_success(mock_session, mock_urlopen, mock_intake_probe, context, mock_env, mock_secrets_manager):
     """Test successful health check"""
     # Mock Secrets Manager
     mock_client = MagicMock()
@@ -243,9 +255,10 @@ def test_lambda_handler_health_check_success(mock_session, mock_urlopen, context
     assert body['status'] == 'ok'
     assert all(check['status'] == 'ok' for check in body['checks'].values())
 
+@patch('health_check.check_intake', return_value=(True, 'Resolved in 1.0ms'))
 @patch('urllib.request.urlopen')
 @patch('boto3.session.Session')
-def test_lambda_handler_health_check_api_key_failure(mock_session, mock_urlopen, context, mock_env, mock_secrets_manager):
+def test_lambda_handler_health_check_api_key_failure(mock_session, mock_urlopen, mock_intake_probe, context, mock_env, mock_secrets_manager):
     """Test health check API key failure"""
     # Remove API key
     if "DD_API_KEY" in os.environ:
@@ -265,8 +278,9 @@ def test_lambda_handler_health_check_api_key_failure(mock_session, mock_urlopen,
     assert body['status'] == 'error'
     assert any(check['status'] == 'error' for check in body['checks'].values())
 
+@patch('health_check.check_intake', return_value=(True, 'Resolved in 1.0ms'))
 @patch('boto3.session.Session')
-def test_lambda_handler_health_check_secrets_manager_failure(mock_session, context, mock_env, mock_secrets_manager):
+def test_lambda_handler_health_check_secrets_manager_failure(mock_session, mock_intake_probe, context, mock_env, mock_secrets_manager):
     """Test health check Secrets Manager failure"""
     # Mock Secrets Manager failure
     mock_client = MagicMock()
@@ -282,5 +296,29 @@ def test_lambda_handler_health_check_secrets_manager_failure(mock_session, conte
     assert body['status'] == 'error'
     assert 'error' in body
 
+def test_import_does_not_load_boto3():
+    """Test importing the handler modules leaves boto3 unimported"""
+    import subprocess
+    import sys
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+    code = (
+        f"import sys; sys.path.insert(0, {src_dir!r}); "
+        "import lambda_function, health_check; "
+        "print('boto3' in sys.modules)"
+    )
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == 'False'
+
+def test_secrets_client_created_once():
+    """Test the Secrets Manager client is created lazily and reused"""
+    import src.lambda_function as lambda_function
+    with patch.object(lambda_function, 'secrets_client', None), \
+         patch('boto3.client') as mock_client:
+        first = lambda_function.get_secrets_client()
+        second = lambda_function.get_secrets_client()
+
+    assert first is second
+    mock_client.assert_called_once_with('secretsmanager', region_name='us-east-1')
+
 if __name__ == "__main__":
     pytest.main([__file__, '-v'])
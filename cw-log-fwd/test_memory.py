@@ -0,0 +1,68 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+from src import memory
+# The handler's own modules; src.records is a separate import of the same code
+from src.lambda_function import lambda_handler, prepare_batch, process_log_events, stream_batch
+from src.emf import is_emf_line
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+CONTEXT = {'log_group_name': '/aws/lambda/app', 'log_stream_name': 'stream', 'aws_region': 'us-east-1'}
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def events(count):
+    return [{'id': str(i), 'timestamp': i, 'message': json.dumps({'n': i}) if i % 2 else f'line {i}'}
+            for i in range(count)]
+
+def test_rss_readings():
+    assert 0 < memory.current_rss_mb() <= memory.max_rss_mb() + 1
+
+def test_budget():
+    assert memory.projected_mb(2**20, per_byte=10) >= 10
+    assert memory.over_budget(600, budget=500)
+    assert not memory.over_budget(400, budget=500)
+    assert not memory.over_budget(10000, budget=0)
+
+def test_stream_batch_matches_in_memory_path():
+    """Test streaming produces the same events, in order, and releases the input"""
+    expected = process_log_events(events(25), CONTEXT)
+    log_events, batch, parser = prepare_batch(events(25), CONTEXT, None)
+    streamed = stream_batch(log_events, batch, parser, chunk_size=10)
+
+    assert len(streamed) == 25 and len(streamed.chunks) == 3
+    assert [json.loads(line) for line in streamed.lines()] == expected
+    assert log_events == [None] * 25
+
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_streams_over_budget(mock_post, mock_env, capsys):
+    """Test a payload projected past the budget is streamed and reported"""
+    mock_post.return_value = mock_intake_response()
+    event = create_cloudwatch_event(events(30))
+
+    with patch('memory.MEMORY_BUDGET_MB', 1), patch('memory.STREAM_CHUNK_EVENTS', 7):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    assert len(json.loads(mock_post.call_args[0][0])) == 30
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if is_emf_line(line)][-1]
+    assert emf['StreamedBatches'] == 1
+    assert emf['ProjectedMemory'] > 1
+    assert emf['MaxRss'] > 0
+
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_in_memory_within_budget(mock_post, mock_env, capsys):
+    mock_post.return_value = mock_intake_response()
+    with patch('memory.MEMORY_BUDGET_MB', 0):
+        assert lambda_handler(create_cloudwatch_event(events(3)), MockContext())['statusCode'] == 200
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if is_emf_line(line)][-1]
+    assert emf['StreamedBatches'] == 0
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
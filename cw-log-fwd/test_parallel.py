@@ -0,0 +1,114 @@
+import json
+import os
+import time
+import pytest
+from unittest.mock import patch
+from src.parallel import process_in_parallel, worker_count
+from src.lambda_function import lambda_handler, materialize, process_log_batch, process_log_records
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+CONTEXT = {'log_group_name': '/aws/lambda/app', 'log_stream_name': 'stream', 'aws_region': 'us-east-1'}
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def log_events(count):
+    return [
+        {'id': str(i), 'timestamp': i,
+         'message': json.dumps({'level': 'INFO', 'path': f'/users/{i}'}) if i % 2 else f'plain line {i}'}
+        for i in range(count)
+    ]
+
+def test_worker_count():
+    assert worker_count('0') == 1
+    assert worker_count('4') == 4
+    with patch.dict(os.environ, {'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': '3538'}):
+        assert worker_count('auto') == 2
+    with patch.dict(os.environ, {'AWS_LAMBDA_FUNCTION_MEMORY_SIZE': '10240'}):
+        assert worker_count('AUTO') == 6
+    with pytest.raises(ValueError):
+        worker_count('many')
+
+def test_parallel_output_matches_in_process():
+    """Test chunks built by worker processes serialize to the in-process body"""
+    events = log_events(101)
+    expected = json.loads(json.dumps(process_log_records(events, CONTEXT), default=materialize))
+
+    result = process_in_parallel(events, lambda chunk: process_log_records(chunk, CONTEXT), 3)
+
+    assert len(result) == 101
+    assert len(result.chunks) == 3
+    assert json.loads(result.body()) == expected
+    assert result.sample.message == 'plain line 0'
+
+def test_failed_worker_chunk_is_built_in_process(capsys):
+    """Test a chunk whose worker raises is still forwarded"""
+    parent = os.getpid()
+
+    def build(chunk):
+        if os.getpid() != parent:
+            raise RuntimeError("worker out of memory")
+        return process_log_records(chunk, CONTEXT)
+
+    result = process_in_parallel(log_events(40), build, 2)
+
+    assert len(json.loads(result.body())) == 40
+    assert 'worker out of memory' in capsys.readouterr().out
+
+def test_overrunning_worker_is_terminated(capsys):
+    """Test a worker still running at the timeout is terminated and its chunk built in-process"""
+    parent = os.getpid()
+
+    def build(chunk):
+        if os.getpid() != parent:
+            time.sleep(30)
+        return process_log_records(chunk, CONTEXT)
+
+    started = time.monotonic()
+    result = process_in_parallel(log_events(40), build, 2, timeout=0.5)
+
+    assert time.monotonic() - started < 10
+    assert len(json.loads(result.body())) == 40
+    assert 'did not finish within 0.5s' in capsys.readouterr().out
+
+class TimedContext(MockContext):
+    def get_remaining_time_in_millis(self):
+        return 2000
+
+@patch('src.lambda_function.process_in_parallel')
+def test_worker_timeout_follows_remaining_time(mock_parallel, mock_env):
+    """Test workers get their share of the invocation's remaining time"""
+    mock_parallel.return_value = process_log_records(log_events(1), CONTEXT)
+    with patch('src.lambda_function.PARSE_WORKERS', 2), patch('src.lambda_function.PARALLEL_THRESHOLD', 10), \
+            patch('intake.get_client'):
+        lambda_handler(create_cloudwatch_event(log_events(50)), TimedContext())
+
+    assert mock_parallel.call_args[0][3] == pytest.approx(1.0)
+
+def test_small_batches_stay_in_process():
+    events = log_events(10)
+    assert isinstance(process_log_batch(events, CONTEXT, workers=4), list)
+    with patch('src.lambda_function.PARALLEL_THRESHOLD', 5):
+        assert not isinstance(process_log_batch(events, CONTEXT, workers=4), list)
+        assert isinstance(process_log_batch(events, CONTEXT, workers=1), list)
+
+@patch('intake.get_client')
+def test_lambda_handler_parallel(mock_get_client, mock_env):
+    """Test the handler forwards a batch parsed across worker processes"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    event = create_cloudwatch_event(log_events(50))
+
+    with patch('src.lambda_function.PARSE_WORKERS', 2), patch('src.lambda_function.PARALLEL_THRESHOLD', 10):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    body = json.loads(mock_get_client.return_value.post.call_args[0][0])
+    assert len(body) == 50
+    assert body[1]['path'] == '/users/1'
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,192 @@
+import json
+import pytest
+from unittest.mock import patch
+from src import parsers
+from src.parsers import ParserSelector, detect_format, load_parser_config
+from src.lambda_function import build_fixed_field_records, build_records, process_log_events
+from src.records import BatchContext
+from src.routing import Route
+
+NGINX_LINE = ('203.0.113.7 - alice [21/Feb/2025:10:00:01 +0000] "GET /api/users?page=2 HTTP/1.1" '
+              '404 153 "https://example.com/" "curl/8.4.0"')
+APACHE_LINE = '198.51.100.2 - - [21/Feb/2025:10:00:02 +0000] "POST /login HTTP/1.0" 200 -'
+KV_LINE = 'level=ERROR msg="connection refused: \\"db\\"" retries=3 latency=0.25 host=api-1'
+VPC_LINE = '2 123456789012 eni-0a1b2c3d 10.0.1.5 10.0.2.9 443 49152 6 10 8400 1708509600 1708509660 ACCEPT OK'
+VPC_NODATA_LINE = '2 123456789012 eni-0a1b2c3d - - - - - - - 1708509600 1708509660 - NODATA'
+
+def test_parse_access_log_combined():
+    """Test nginx combined lines map to standard http/network attributes"""
+    attributes = parsers.parse_access_log(NGINX_LINE)
+    assert attributes['http'] == {
+        'method': 'GET',
+        'url': '/api/users?page=2',
+        'version': 'HTTP/1.1',
+        'status_code': 404,
+        'referer': 'https://example.com/',
+        'useragent': 'curl/8.4.0',
+    }
+    assert attributes['network'] == {'client': {'ip': '203.0.113.7'}, 'bytes_written': 153}
+    assert attributes['usr'] == {'id': 'alice'}
+    assert attributes['status'] == 'warn'
+
+def test_parse_access_log_common():
+    """Test Apache common lines without referer or user agent"""
+    attributes = parsers.parse_access_log(APACHE_LINE)
+    assert attributes['http']['method'] == 'POST'
+    assert 'referer' not in attributes['http']
+    assert attributes['network']['bytes_written'] == 0
+    assert 'usr' not in attributes
+
+def test_parse_key_value():
+    """Test quoted values, escapes and numeric conversion"""
+    attributes = parsers.parse_key_value(KV_LINE)
+    assert attributes['msg'] == 'connection refused: "db"'
+    assert attributes['retries'] == 3
+    assert attributes['latency'] == 0.25
+    assert attributes['status'] == 'error'
+
+def test_parse_vpc_flow():
+    """Test VPC flow records, including NODATA placeholders"""
+    flow = parsers.parse_vpc_flow(VPC_LINE)['vpc_flow']
+    assert flow['srcaddr'] == '10.0.1.5'
+    assert flow['dstport'] == 49152
+    assert flow['bytes'] == 8400
+    assert flow['action'] == 'ACCEPT'
+
+    nodata = parsers.parse_vpc_flow(VPC_NODATA_LINE)['vpc_flow']
+    assert nodata['srcaddr'] is None
+    assert nodata['log_status'] == 'NODATA'
+
+def test_parsers_reject_other_formats():
+    """Test each parser returns None for lines it does not understand"""
+    assert parsers.parse_access_log(KV_LINE) is None
+    assert parsers.parse_vpc_flow(NGINX_LINE) is None
+    assert parsers.parse_key_value('Plain text log message') is None
+
+@pytest.mark.parametrize('lines,expected', [
+    ([json.dumps({'a': 1})] * 3, 'json'),
+    ([VPC_LINE, VPC_NODATA_LINE], 'vpc_flow'),
+    ([NGINX_LINE, APACHE_LINE], 'access_log'),
+    ([KV_LINE, 'a=1 b=2'], 'key_value'),
+    (['Plain text log message', 'Another line'], None),
+])
+def test_detect_format(lines, expected):
+    """Test format detection on a sample of lines"""
+    assert detect_format(lines) == expected
+
+def test_selector_prefers_configuration():
+    """Test configured parsers win over detection, with globs"""
+    selector = ParserSelector(load_parser_config('/aws/vpc/*=vpc_flow,/nginx/access=nginx,/legacy=plain'))
+    assert selector.select('/aws/vpc/prod', ['anything']).name == 'vpc_flow'
+    assert selector.select('/nginx/access', []).name == 'access_log'
+    assert selector.select('/legacy', [NGINX_LINE]) is None
+
+def test_selector_caches_detection():
+    """Test detection runs once per log group and is then served from the cache"""
+    selector = ParserSelector([], cache_size=2)
+    assert selector.select('/nginx', [NGINX_LINE]).name == 'access_log'
+    # A later batch that would detect differently keeps the cached answer
+    assert selector.select('/nginx', [KV_LINE]).name == 'access_log'
+
+    selector.select('/b', [KV_LINE])
+    selector.select('/c', [KV_LINE])
+    assert '/nginx' not in selector._detected
+
+def test_selector_does_not_pin_misses():
+    """Test a group is taken for plain only after repeated misses, and is sampled again later"""
+    selector = ParserSelector([])
+    plain = ['Plain text log message'] * parsers.DETECTION_SAMPLE_SIZE
+    assert selector.select('/app', plain) is None
+    # One odd batch is forgotten as soon as the format shows
+    assert selector.select('/app', [NGINX_LINE]).name == 'access_log'
+
+    for _ in range(parsers.DETECTION_MISSES):
+        assert selector.select('/later', plain) is None
+    # Cached as plain for now...
+    assert selector.select('/later', [NGINX_LINE]) is None
+    # ...and detected again once the answer has expired
+    with patch('src.parsers.time.monotonic', return_value=10**9):
+        assert selector.select('/later', [NGINX_LINE]).name == 'access_log'
+
+def test_unknown_parser_rejected():
+    """Test configuration naming an unknown parser fails at init"""
+    with pytest.raises(ValueError):
+        load_parser_config('/app=grok')
+
+def process_with_parser(message, parser):
+    events = [{'timestamp': 1, 'message': message}]
+    return process_log_events(events, {'log_group_name': '/test/parsers'}, Route('/test/*', parser=parser))[0]
+
+def test_process_with_parser():
+    """Test structured attributes are merged over the standard fields"""
+    result = process_with_parser(NGINX_LINE, 'nginx')
+    assert result['message'] == NGINX_LINE
+    assert result['http']['status_code'] == 404
+    assert result['status'] == 'warn'
+    assert result['ddsource'] == 'cloudwatch'
+
+def test_process_falls_back_when_no_match():
+    """Test lines the parser cannot read keep the default handling"""
+    result = process_with_parser('Plain text log message', 'nginx')
+    assert result['message'] == 'Plain text log message'
+    assert 'http' not in result
+
+def test_process_log_events_detects_format():
+    """Test a batch of access log lines is parsed without configuration"""
+    events = [{'timestamp': i, 'message': line} for i, line in enumerate([NGINX_LINE, APACHE_LINE])]
+    processed = process_log_events(events, {'log_group_name': '/test/parsers/access'})
+    assert [e['http']['method'] for e in processed] == ['GET', 'POST']
+    assert processed[0]['cloudwatch']['log_group'] == '/test/parsers/access'
+
+def test_fixed_field_parse_batch():
+    """Test batch parsing converts numeric columns and flags invalid lines"""
+    results = parsers.VPC_FLOW_PARSER.parse_batch([VPC_LINE, 'not a flow record', VPC_NODATA_LINE])
+    assert results[1] is None
+    assert list(results[0]['vpc_flow']) == list(parsers.VPC_FLOW_FIELDS)
+    assert results[0]['vpc_flow']['packets'] == 10
+    assert results[2]['vpc_flow']['packets'] is None
+    assert results[2]['vpc_flow']['start'] == 1708509600
+
+def test_fixed_field_malformed_number():
+    """Test a row with a malformed number is flagged invalid on its own and forwarded as text"""
+    malformed = VPC_LINE.replace(' 8400 ', ' 84x0 ')
+    results = parsers.VPC_FLOW_PARSER.parse_batch([VPC_LINE, malformed, VPC_NODATA_LINE])
+    assert results[1] is None
+    assert results[0]['vpc_flow']['bytes'] == 8400
+    assert results[2]['vpc_flow']['bytes'] is None
+
+    events = [{'timestamp': i, 'message': line} for i, line in enumerate([VPC_LINE] * 9 + [malformed])]
+    processed = process_log_events(events, {'log_group_name': '/test/parsers/vpc-malformed'})
+    assert [event['vpc_flow']['bytes'] for event in processed[:9]] == [8400] * 9
+    assert processed[9]['message'] == malformed and 'vpc_flow' not in processed[9]
+
+def test_fixed_field_status_map():
+    """Test rejected flows are reported as warnings"""
+    rejected = VPC_LINE.replace('ACCEPT', 'REJECT')
+    results = parsers.VPC_FLOW_PARSER.parse_batch([VPC_LINE, rejected])
+    assert [r['status'] for r in results] == ['info', 'warn']
+
+def test_fixed_field_fast_path_matches_generic_path():
+    """Test the bulk path produces the same events as the generic path per line"""
+    lines = [VPC_LINE, VPC_NODATA_LINE, 'Plain text log message', VPC_LINE.replace('ACCEPT', 'REJECT')]
+    events = [{'timestamp': i, 'message': line} for i, line in enumerate(lines)]
+    context = {'log_group_name': '/aws/vpc/flow', 'log_stream_name': 'eni-0a1b2c3d-all', 'aws_region': 'us-east-1'}
+
+    batch = BatchContext(context)
+
+    bulk = build_fixed_field_records(events, batch, parsers.VPC_FLOW_PARSER)
+    generic = build_records(events, batch, parsers.VPC_FLOW_PARSER)
+
+    assert [record.to_dict() for record in bulk] == [record.to_dict() for record in generic]
+    assert bulk[0].to_dict()['cloudwatch']['log_group'] == '/aws/vpc/flow'
+
+def test_process_log_events_uses_fast_path():
+    """Test detected VPC flow batches are routed to the bulk parser"""
+    events = [{'timestamp': i, 'message': VPC_LINE} for i in range(10)]
+    processed = process_log_events(events, {'log_group_name': '/test/parsers/vpc'})
+    assert len(processed) == 10
+    # The bulk path shares one cloudwatch dict across the batch
+    assert processed[0]['cloudwatch'] is processed[9]['cloudwatch']
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,245 @@
+"""Performance regression tests on fixed corpora, standard library only.
+
+Each case is run three ways: timed (best of several runs, relative to a
+fixed calibration workload so the baseline travels between machines),
+under tracemalloc for its peak memory, and under sys.setprofile for the
+number of function calls it makes. The results are compared with
+perf_baseline.json and a case fails when it is slower, bigger or busier
+than its baseline by more than the tolerance. Memory and call counts differ
+between Python versions, so the baseline is kept per version, and the cases
+are skipped on a version it has none for.
+
+After an intended change, regenerate the baseline on each Python version
+it covers and commit it:
+
+    PERF_UPDATE_BASELINE=1 python -m pytest test_performance.py
+
+Skip these tests with `-m "not perf"`.
+"""
+import base64
+import gzip
+import json
+import os
+import sys
+import time
+import tracemalloc
+import pytest
+from unittest.mock import patch
+# Through src.lambda_function, so records and serializer come from the same module
+from src.lambda_function import (
+    decode_log_data, parse_record, process_log_events, process_log_records, send_to_datadog, serialize_records
+)
+from test_lambda import mock_intake_response
+
+pytestmark = pytest.mark.perf
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'perf_baseline.json')
+UPDATE_BASELINE = os.environ.get('PERF_UPDATE_BASELINE', '').lower() in ('true', '1', 'yes')
+
+# Allowed growth over the baseline. Timings vary with the machine and its
+# load, so they only catch gross slowdowns; memory and call counts vary only
+# with the code and the Python version, and are the tight gates.
+TIME_TOLERANCE = float(os.environ.get('PERF_TIME_TOLERANCE', '1.0'))
+MEMORY_TOLERANCE = float(os.environ.get('PERF_MEMORY_TOLERANCE', '0.2'))
+CALLS_TOLERANCE = float(os.environ.get('PERF_CALLS_TOLERANCE', '0.1'))
+
+EVENTS = 2000
+CONTEXT = {'log_group_name': '/perf/app', 'log_stream_name': 'stream', 'aws_region': 'us-east-1'}
+
+
+def json_messages(count):
+    return [json.dumps({
+        'timestamp': f"2025-02-21T10:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000:03d}000Z",
+        'level': 'ERROR' if i % 8 == 7 else 'INFO',
+        'logger': 'fastapi',
+        'path': f"/api/users/{i % 500}",
+        'method': ('GET', 'POST', 'PUT', 'DELETE')[i % 4],
+        'status_code': 500 if i % 8 == 7 else 200,
+        'trace_id': f"trace_{1000 + i}",
+        'request_id': f"req_{10000 + i}",
+        'response_time': 10 + (i * 37) % 990,
+    }) for i in range(count)]
+
+
+def plain_messages(count):
+    return [f"worker {i % 8} finished job {i} in {10 + i % 90}ms" for i in range(count)]
+
+
+def access_messages(count):
+    return [f'10.0.{i % 250}.{i % 200} - - [21/Feb/2025:10:{i // 60 % 60:02d}:{i % 60:02d} +0000] '
+            f'"GET /api/items/{i % 300} HTTP/1.1" {(200, 404)[i % 2]} {512 + i}' for i in range(count)]
+
+
+def log_events(messages):
+    return [{'id': str(i), 'timestamp': 1740132000000 + i, 'message': message} for i, message in enumerate(messages)]
+
+
+def context_for(name):
+    # A log group per corpus, so each keeps its own cached format
+    return {**CONTEXT, 'log_group_name': f"/perf/{name}"}
+
+
+def subscription_data(messages):
+    data = {'messageType': 'DATA_MESSAGE', 'logGroup': '/perf/app', 'logStream': 'stream',
+            'logEvents': log_events(messages)}
+    return base64.b64encode(gzip.compress(json.dumps(data).encode('utf-8'))).decode('ascii')
+
+
+def calibration():
+    """Fixed pure-Python work the timings are measured against"""
+    total = 0
+    for i in range(20000):
+        item = {'index': i, 'name': f"item {i}", 'tags': [i % 7, i % 11]}
+        total += len(json.dumps(item)) + len(str(item['tags']))
+    return total
+
+
+def build_cases():
+    json_events = log_events(json_messages(EVENTS))
+    plain_events = log_events(plain_messages(EVENTS))
+    access_events = log_events(access_messages(EVENTS))
+    mixed = json_messages(EVENTS // 2) + plain_messages(EVENTS // 2)
+    records = process_log_records(json_events, context_for('serialize'))
+    payload = subscription_data(json_messages(EVENTS))
+
+    def send():
+        with patch('intake.get_client') as get_client, patch('builtins.print'), \
+                patch.dict(os.environ, {'DD_API_KEY': 'perf-api-key'}):
+            get_client.return_value.post.return_value = mock_intake_response()
+            send_to_datadog(records, dd_url='https://intake.invalid/api/v2/logs')
+
+    return {
+        'parse_record': lambda: [parse_record(message) for message in mixed],
+        'process_json': lambda: process_log_events(json_events, context_for('json')),
+        'process_plain': lambda: process_log_events(plain_events, context_for('plain')),
+        'process_access_log': lambda: process_log_events(access_events, context_for('access')),
+        'decode_envelope': lambda: decode_log_data(payload),
+        'serialize': lambda: serialize_records(records),
+        'send_to_datadog': send,
+    }
+
+
+def best_time(run, repeat=7):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def peak_kib(run):
+    tracemalloc.start()
+    try:
+        run()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def count_calls(run, names=None):
+    """Function calls made by `run`, Python and built-in; or only those named in `names`"""
+    counts = {}
+
+    def profile(frame, event, arg):
+        if event == 'call':
+            name = frame.f_code.co_name
+        elif event == 'c_call':
+            name = getattr(arg, '__name__', '?')
+        else:
+            return
+        counts[name] = counts.get(name, 0) + 1
+
+    sys.setprofile(profile)
+    try:
+        run()
+    finally:
+        sys.setprofile(None)
+    if names is None:
+        return sum(counts.values())
+    return {name: counts.get(name, 0) for name in names}
+
+
+def measure(run):
+    # One run first so caches (parser detection, imports) are warm
+    run()
+    return {
+        'time_ratio': round(best_time(run) / best_time(calibration, repeat=3), 4),
+        'peak_kib': round(peak_kib(run), 1),
+        'calls': count_calls(run),
+    }
+
+
+CASES = build_cases()
+
+
+PYTHON_VERSION = f"{sys.version_info[0]}.{sys.version_info[1]}"
+
+
+def load_baseline():
+    if not os.path.exists(BASELINE_PATH):
+        return {'events': EVENTS, 'python': {}}
+    with open(BASELINE_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def baseline():
+    """This Python version's cases: {name: {time_ratio, peak_kib, calls}}"""
+    if UPDATE_BASELINE:
+        results = load_baseline()
+        if results['events'] != EVENTS:
+            # Other versions' figures were taken on a different corpus
+            results = {'events': EVENTS, 'python': {}}
+        cases = results['python'][PYTHON_VERSION] = {}
+        yield cases
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return
+    cases = load_baseline()['python'].get(PYTHON_VERSION)
+    if cases is None:
+        pytest.skip(f"No Python {PYTHON_VERSION} baseline in perf_baseline.json; "
+                    f"create it with PERF_UPDATE_BASELINE=1")
+    yield cases
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_no_regression(name, baseline):
+    result = measure(CASES[name])
+    if UPDATE_BASELINE:
+        baseline[name] = result
+        return
+
+    expected = baseline.get(name)
+    if expected is None:
+        pytest.skip(f"No baseline for {name}; regenerate perf_baseline.json")
+    failures = []
+    for key, tolerance in (('time_ratio', TIME_TOLERANCE), ('peak_kib', MEMORY_TOLERANCE),
+                           ('calls', CALLS_TOLERANCE)):
+        limit = expected[key] * (1 + tolerance)
+        if result[key] > limit:
+            failures.append(f"{key} {result[key]} is over {limit:.4g} (baseline {expected[key]})")
+    assert not failures, f"{name} regressed: " + '; '.join(failures)
+
+
+def test_per_event_call_budget():
+    """Test the hot paths do per-event work once: one parse, one encode and no clock reads per event"""
+    json_events = log_events(json_messages(EVENTS))
+    # Detect the format first; detection parses a sample of its own
+    process_log_events(json_events[:10], context_for('budget'))
+    process = count_calls(lambda: process_log_events(json_events, context_for('budget')), ('now', 'loads', 'dumps'))
+    assert process['now'] == 0
+    assert process['loads'] <= EVENTS
+    assert process['dumps'] == 0
+
+    records = process_log_records(json_events, context_for('budget'))
+    # Each event is encoded once, plus the joined lines to UTF-8; a second full dumps would double this
+    encodes = count_calls(lambda: serialize_records(records), ('encode', 'dumps', 'now'))
+    assert encodes['encode'] <= EVENTS + 1
+    assert encodes['dumps'] == 0
+    assert encodes['now'] == 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
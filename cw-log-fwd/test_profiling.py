@@ -0,0 +1,92 @@
+import gzip
+import json
+import marshal
+import os
+import pytest
+from unittest.mock import patch
+from src import profiling
+from src.emf import is_emf_line
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def test_disabled_profiling_is_a_no_op():
+    """Test nothing is recorded when DD_FORWARDER_PROFILE is off"""
+    with patch.object(profiling, 'PROFILE_ENABLED', False):
+        assert profiling.begin_invocation() is None
+        with profiling.stage('decode') as stage:
+            assert stage is profiling._NULL_STAGE
+        assert profiling.end_invocation() is None
+
+def test_stage_timings_recorded():
+    """Test per-stage wall-clock timings accumulate per invocation"""
+    with patch.object(profiling, 'PROFILE_ENABLED', True), \
+         patch.object(profiling, 'PROFILE_SAMPLE_RATE', 0):
+        profile = profiling.begin_invocation()
+        with profiling.stage('decode'):
+            pass
+        with profiling.stage('network'):
+            pass
+        with profiling.stage('network'):
+            pass
+        result = profiling.end_invocation()
+
+    assert profile.profiler is None
+    assert set(result['stages_ms']) == {'decode', 'network'}
+    assert result['total_ms'] >= result['stages_ms']['network']
+    assert 'profile' not in result
+
+def test_sampled_invocation_writes_profile(tmp_path):
+    """Test a sampled invocation writes gzipped pstats data"""
+    with patch.object(profiling, 'PROFILE_ENABLED', True), \
+         patch.object(profiling, 'PROFILE_SAMPLE_RATE', 1.0), \
+         patch.object(profiling, 'PROFILE_DEST', str(tmp_path)):
+        profiling.begin_invocation()
+        with profiling.stage('parse'):
+            sorted(range(1000), key=lambda x: -x)
+        result = profiling.end_invocation('req-1')
+
+    assert result['profile'] == str(tmp_path / 'forwarder-req-1.pstats.gz')
+    with open(result['profile'], 'rb') as f:
+        stats = marshal.loads(gzip.decompress(f.read()))
+    assert any(func[2] == '<lambda>' for func in stats)
+
+def test_memory_traced_invocation():
+    """Test a memory-sampled invocation records each stage's peak allocations and RSS"""
+    with patch.object(profiling, 'PROFILE_ENABLED', False), \
+         patch.object(profiling, 'MEMORY_SAMPLE_RATE', 1.0):
+        profiling.begin_invocation()
+        with profiling.stage('parse'):
+            data = [str(i) * 10 for i in range(10000)]
+        with profiling.stage('network'):
+            pass
+        result = profiling.end_invocation()
+
+    assert result['stages_peak_kb']['parse'] > 100 > result['stages_peak_kb']['network']
+    assert result['stages_rss_mb']['parse'] > 0
+    assert len(data) == 10000
+
+@patch('intake.IntakeClient.post')
+def test_lambda_handler_reports_stage_metrics(mock_post, mock_env, capsys):
+    """Test stage timings are added to the invocation's EMF line"""
+    mock_post.return_value = mock_intake_response()
+    event = create_cloudwatch_event([{'id': '1', 'timestamp': 1, 'message': 'hello'}])
+
+    from src.lambda_function import lambda_handler
+    with patch('profiling.PROFILE_ENABLED', True), patch('profiling.PROFILE_SAMPLE_RATE', 0):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    lines = [json.loads(l) for l in capsys.readouterr().out.splitlines() if is_emf_line(l)]
+    assert len(lines) == 1
+    for name in ('StageDecodeTime', 'StageParseTime', 'StageSerializeTime', 'StageNetworkTime', 'StageParseMaxRss'):
+        assert name in lines[0]
+    assert 'StageParsePeakMemory' not in lines[0]
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
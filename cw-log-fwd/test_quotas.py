@@ -0,0 +1,217 @@
+import gzip
+import json
+import os
+import pytest
+from unittest.mock import patch
+from src.buffering import LocalSpillStore
+from src.quotas import (
+    DynamoDBQuotaStore, LocalQuotaStore, QuotaManager, QuotaPolicy, TokenBucket, create_quota_manager, spilled_files
+)
+from src.routing import Route, RoutingTable
+from src.lambda_function import lambda_handler
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+class ConditionalCheckFailed(Exception):
+    response = {'Error': {'Code': 'ConditionalCheckFailedException'}}
+
+class LocalDynamoDB:
+    """In-memory stand-in for the DynamoDB client calls the quota store makes"""
+
+    def __init__(self):
+        self.items = {}
+        self.puts = 0
+        self.conflicts_to_inject = 0
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get(Key['log_group']['S'])
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression, ExpressionAttributeValues=None):
+        key = Item['log_group']['S']
+        existing = self.items.get(key)
+        if self.conflicts_to_inject:
+            self.conflicts_to_inject -= 1
+            raise ConditionalCheckFailed()
+        if ConditionExpression.startswith('attribute_not_exists'):
+            if existing:
+                raise ConditionalCheckFailed()
+        elif existing['version'] != ExpressionAttributeValues[':version']:
+            raise ConditionalCheckFailed()
+        self.items[key] = Item
+        self.puts += 1
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def events(count):
+    return [{'message': f'line {i}'} for i in range(count)]
+
+def test_token_bucket_refills():
+    """Test tokens refill at the rate and never exceed the burst"""
+    policy = QuotaPolicy(rate=10, burst=20)
+    bucket = TokenBucket(20, 0.0)
+    assert bucket.take(25, policy, 0.0) == 20
+    assert bucket.take(25, policy, 1.0) == 10
+    assert bucket.take(100, policy, 60.0) == 20
+
+def test_policy_validation():
+    with pytest.raises(ValueError):
+        QuotaPolicy(rate=0)
+    with pytest.raises(ValueError):
+        QuotaPolicy(rate=1, overflow='queue')
+    with pytest.raises(ValueError):
+        Route('/a', quota={'burst': 5})
+    assert Route('/a', quota={'rate': 5, 'overflow': 'drop'}).quota.overflow == 'drop'
+
+def test_local_store_is_per_log_group():
+    """Test a noisy log group does not use another one's tokens"""
+    store = LocalQuotaStore()
+    policy = QuotaPolicy(rate=1, burst=10)
+    assert store.take('/noisy', 50, policy, now=0.0) == 10
+    assert store.take('/noisy', 50, policy, now=0.0) == 0
+    assert store.take('/quiet', 5, policy, now=0.0) == 5
+
+def test_shared_store_across_instances():
+    """Test two instances sharing a table draw from one bucket"""
+    table = LocalDynamoDB()
+    first = DynamoDBQuotaStore('quotas', client=table)
+    second = DynamoDBQuotaStore('quotas', client=table)
+    policy = QuotaPolicy(rate=1, burst=10)
+
+    assert first.take('/app', 6, policy, now=100.0) == 6
+    assert second.take('/app', 6, policy, now=100.0) == 4
+    assert table.items['/app']['version'] == {'N': '2'}
+
+def test_shared_store_retries_lost_race():
+    """Test a conditional write conflict is retried with fresh state"""
+    table = LocalDynamoDB()
+    table.conflicts_to_inject = 1
+    store = DynamoDBQuotaStore('quotas', client=table)
+    assert store.take('/app', 3, QuotaPolicy(rate=1, burst=10), now=0.0) == 3
+    assert table.puts == 1
+
+def test_shared_store_falls_back_when_unavailable():
+    """Test delivery continues on the local bucket when the table errors"""
+    class Broken:
+        def get_item(self, **kwargs):
+            raise OSError("connection refused")
+
+    store = DynamoDBQuotaStore('quotas', client=Broken())
+    assert store.take('/app', 5, QuotaPolicy(rate=1, burst=3), now=0.0) == 3
+
+def test_overflow_sample():
+    """Test over-quota events are sampled and marked"""
+    manager = QuotaManager(LocalQuotaStore(), QuotaPolicy(rate=1, burst=10, overflow='sample', sample_rate=1.0))
+    admitted, over, spilled, failures = manager.admit('/app', events(15))
+    assert (len(admitted), over, spilled, failures) == (15, 5, 0, 0)
+    assert admitted[-1]['quota_sample_rate'] == 1.0
+    assert 'quota_sample_rate' not in admitted[0]
+
+def spill_policy(**options):
+    with patch('src.quotas.SPILL_DEST', 's3://spill-bucket/quotas'):
+        return QuotaPolicy(**options, overflow='spill')
+
+def test_spill_needs_s3():
+    """Test spill overflow is refused without a durable destination"""
+    for dest in ('', '/tmp'):
+        with patch('src.quotas.SPILL_DEST', dest), pytest.raises(ValueError):
+            QuotaPolicy(rate=1, overflow='spill')
+
+def test_overflow_spill(tmp_path):
+    """Test over-quota events are written to the spill store, one file per batch"""
+    store = LocalSpillStore(str(tmp_path))
+    manager = QuotaManager(LocalQuotaStore(), spill_policy(rate=1, burst=2), store)
+    admitted, over, spilled, failures = manager.admit('/aws/lambda/app', events(5))
+
+    assert (len(admitted), over, spilled, failures) == (2, 3, 3, 0)
+    # A log group whose name extends another's keeps its own files
+    assert spilled_files(store, '/aws/lambda/app-2') == []
+    files = spilled_files(store, '/aws/lambda/app')
+    assert len(files) == 1
+    lines = gzip.decompress(store.read(files[0])).decode().splitlines()
+    assert [json.loads(line)['message'] for line in lines] == ['line 2', 'line 3', 'line 4']
+
+class FailingSpillStore:
+    def write(self, name, data):
+        raise OSError("AccessDenied")
+
+def test_failed_spill_is_sampled():
+    """Test events a spill cannot write are sampled instead of dropped, and the failure is returned"""
+    manager = QuotaManager(LocalQuotaStore(), spill_policy(rate=1, burst=2, sample_rate=1.0), FailingSpillStore())
+    admitted, over, spilled, failures = manager.admit('/app', events(5))
+    assert (len(admitted), over, spilled, failures) == (5, 3, 0, 1)
+    assert admitted[-1]['quota_sample_rate'] == 1.0
+
+@patch('intake.get_client')
+def test_lambda_handler_counts_spill_failures(mock_get_client, mock_env, capsys):
+    """Test a failed spill shows up in SpillFailures and the sampled events are sent"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    manager = QuotaManager(LocalQuotaStore(), spill_policy(rate=1, burst=3, sample_rate=1.0), FailingSpillStore())
+    event = create_cloudwatch_event([{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(10)])
+
+    with patch('quotas.quota_manager', manager):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    assert len(json.loads(mock_get_client.return_value.post.call_args[0][0])) == 10
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws":')]
+    assert (emf[0]['EventsSpilled'], emf[0]['SpillFailures'], emf[0]['EventsDropped']) == (0, 1, 0)
+
+@patch('intake.get_client')
+def test_replay_spill(mock_get_client, mock_env, tmp_path):
+    """Test a replay sends spilled files oldest first and deletes each once it was delivered"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    store = LocalSpillStore(str(tmp_path))
+    manager = QuotaManager(LocalQuotaStore(), spill_policy(rate=1, burst=1), store)
+    manager.admit('/app', events(3))
+    manager.admit('/app', [{'message': 'late'}], manager.default_policy)
+    manager.admit('/other', events(2))
+
+    with patch('quotas.quota_manager', manager):
+        result = lambda_handler({'replaySpill': {'logGroup': '/app'}}, MockContext())
+
+    assert result['statusCode'] == 200
+    bodies = [json.loads(call[0][0]) for call in mock_get_client.return_value.post.call_args_list]
+    assert [event['message'] for body in bodies for event in body] == ['line 1', 'line 2', 'late']
+    assert spilled_files(store, '/app') == []
+    assert len(spilled_files(store, '/other')) == 1
+
+@patch('intake.get_client')
+def test_replay_spill_keeps_undelivered_files(mock_get_client, mock_env, tmp_path):
+    mock_get_client.return_value.post.side_effect = OSError('connection refused')
+    store = LocalSpillStore(str(tmp_path))
+    manager = QuotaManager(LocalQuotaStore(), spill_policy(rate=1, burst=1), store)
+    manager.admit('/app', events(3))
+
+    with patch('quotas.quota_manager', manager):
+        result = lambda_handler({'replaySpill': {'logGroup': '/app'}}, MockContext())
+
+    assert result['statusCode'] == 500
+    assert len(spilled_files(store, '/app')) == 1
+
+def test_no_quota_by_default():
+    """Test quotas are off unless a rate is configured"""
+    assert create_quota_manager().admit('/app', events(3)) == (events(3), 0, 0, 0)
+
+@patch('intake.get_client')
+def test_lambda_handler_enforces_route_quota(mock_get_client, mock_env, capsys):
+    """Test only the route's quota of events is sent and the rest is counted"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    table = RoutingTable([Route('/aws/lambda/*', quota={'rate': 1, 'burst': 3, 'overflow': 'drop'})])
+    event = create_cloudwatch_event([{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(10)])
+
+    with patch('routing.routing_table', table), patch('quotas.quota_manager', QuotaManager(LocalQuotaStore())):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    body = json.loads(mock_get_client.return_value.post.call_args[0][0])
+    assert len(body) == 3
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws":')]
+    assert (emf[0]['EventsOverQuota'], emf[0]['EventsDropped']) == (7, 7)
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,118 @@
+import json
+import pytest
+from src.records import ERROR, JSON, PLAIN, STRUCTURED, BatchContext, LogRecord, serialize_records
+# The hook the handler uses; src.records is a separate import of the same module
+from src.lambda_function import materialize, process_log_events, process_log_records
+from src.routing import Route
+
+CONTEXT = {'log_group_name': '/aws/lambda/app', 'log_stream_name': 'stream', 'aws_region': 'us-east-1'}
+
+def test_plain_record_matches_event_dict():
+    """Test a plain line is built with the standard fields and CloudWatch metadata"""
+    record = LogRecord(PLAIN, 1000, 'hello', None, BatchContext(CONTEXT))
+    data = record.to_dict()
+    assert data['message'] == 'hello'
+    assert data['timestamp'] == 1000
+    assert data['ddsource'] == 'cloudwatch'
+    assert data['cloudwatch'] == {'log_group': '/aws/lambda/app', 'log_stream': 'stream', 'aws_region': 'us-east-1'}
+
+def test_json_record_keeps_only_parsed_message():
+    """Test materializing a JSON record leaves the record's attributes untouched"""
+    attributes = {'level': 'INFO', 'logger': 'fastapi', 'path': '/users'}
+    record = LogRecord(JSON, 1000, None, attributes, BatchContext(CONTEXT))
+    data = record.to_dict()
+    assert data['path'] == '/users'
+    assert data['aws'] == {'logger': 'fastapi', 'log_group': '', 'log_stream': ''}
+    assert 'message' not in data
+    assert attributes == {'level': 'INFO', 'logger': 'fastapi', 'path': '/users'}
+
+def test_error_record_has_no_cloudwatch_metadata():
+    record = LogRecord(ERROR, 1000, 'bad', {'error': 'boom'}, BatchContext(CONTEXT))
+    data = record.to_dict()
+    assert data['status'] == 'error'
+    assert data['error'] == 'boom'
+    assert 'cloudwatch' not in data
+
+def test_route_overrides_and_extra_fields():
+    """Test route service/tags and fields set by later stages are applied"""
+    batch = BatchContext(CONTEXT, service='payments', tags='team:core')
+    record = LogRecord(STRUCTURED, 1000, 'GET /', {'method': 'GET'}, batch)
+    record['quota_sample_rate'] = 0.1
+    data = record.to_dict()
+    assert data['service'] == 'payments'
+    assert data['ddtags'].endswith(',team:core')
+    assert data['method'] == 'GET'
+    assert data['quota_sample_rate'] == 0.1
+
+def test_get_reads_fields_without_building_event():
+    batch = BatchContext(CONTEXT, service='payments')
+    record = LogRecord(STRUCTURED, 1000, 'GET /', {'status_code': 500}, batch, {'repeat_count': 3})
+    assert record.get('status_code') == 500
+    assert record.get('message') == 'GET /'
+    assert record.get('repeat_count') == 3
+    assert record.get('ddsource') == 'cloudwatch'
+    assert record.get('service') == 'payments'
+    assert record.get('missing', 'default') == 'default'
+    assert record.get('cloudwatch') is batch.cloudwatch
+
+def test_records_share_batch_context():
+    """Test every record of a batch references one copy of the CloudWatch metadata"""
+    events = [{'timestamp': i, 'message': f'line {i}'} for i in range(3)]
+    records = process_log_records(events, CONTEXT)
+    assert len({id(record.batch) for record in records}) == 1
+    assert [record.message for record in records] == ['line 0', 'line 1', 'line 2']
+
+@pytest.mark.parametrize('message', [
+    'plain text line',
+    '{"level": "INFO", "logger": "fastapi", "path": "/users"}',
+    '[1, 2, 3]',
+])
+def test_serialized_records_match_event_dicts(message):
+    """Test the records serialize to the same body as the event dicts"""
+    events = [{'timestamp': 1000, 'message': message}]
+    route = Route('/aws/lambda/*', service='api', tags='team:core')
+    assert (json.loads(json.dumps(process_log_records(events, CONTEXT, route), default=materialize))
+            == json.loads(json.dumps(process_log_events(events, CONTEXT, route))))
+
+def test_materialize_rejects_other_objects():
+    with pytest.raises(TypeError):
+        json.dumps({'value': object()}, default=materialize)
+
+# Non-ASCII and escaped characters, so encoded sizes differ from lengths
+BIG_MESSAGE = 'caf\u00e9 \U0001F600 "quoted" ' * 5000
+
+def test_oversized_event_truncated():
+    """Test an oversized event is cut to the limit and marked, leaving its neighbours alone"""
+    events = [{'timestamp': 1, 'message': BIG_MESSAGE}, {'timestamp': 2, 'message': 'small'}]
+    data, count = serialize_records(events, limit=10000)
+    lines = data.split(b'\n')
+    assert count == 2
+    assert len(lines[0]) <= 10000
+    first = json.loads(lines[0])
+    assert first['truncated'] is True
+    assert BIG_MESSAGE.startswith(first['message'])
+    assert json.loads(lines[1]) == {'timestamp': 2, 'message': 'small'}
+
+def test_oversized_event_split_into_parts():
+    """Test split parts each fit, share an id and join back into the original field"""
+    data, count = serialize_records([{'timestamp': 1, 'message': BIG_MESSAGE}], limit=10000, mode='split')
+    lines = data.split(b'\n')
+    parts = [json.loads(line) for line in lines]
+    assert count == len(parts) > 1
+    assert max(len(line) for line in lines) <= 10000
+    assert len({part['split']['id'] for part in parts}) == 1
+    assert [part['split']['part'] for part in parts] == list(range(1, count + 1))
+    assert {part['split']['parts'] for part in parts} == {count}
+    assert ''.join(part['message'] for part in parts) == BIG_MESSAGE
+
+def test_oversized_event_without_one_large_field():
+    """Test an event made big by many fields is forwarded as text within the limit"""
+    event = {'timestamp': 1, 'service': 'api', **{f'field{i}': 'x' * 500 for i in range(50)}}
+    data, count = serialize_records([event], limit=5000)
+    forwarded = json.loads(data)
+    assert count == 1 and len(data) <= 5000
+    assert forwarded['service'] == 'api' and forwarded['truncated'] is True
+    assert forwarded['message'].startswith('{"timestamp": 1')
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
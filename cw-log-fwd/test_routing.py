@@ -0,0 +1,109 @@
+import json
+import os
+import pytest
+from unittest.mock import patch
+from src.routing import Route, RoutingTable, literal_prefix, load_routes
+from src.lambda_function import lambda_handler, process_log_events
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+def test_literal_prefix():
+    """Test the literal part of a pattern stops at the first wildcard"""
+    assert literal_prefix('/aws/lambda/*') == '/aws/lambda/'
+    assert literal_prefix('/aws/*/prod') == '/aws/'
+    assert literal_prefix('/exact') == '/exact'
+
+def test_most_specific_route_wins():
+    """Test exact names beat prefixes and longer prefixes beat shorter ones"""
+    table = RoutingTable([
+        Route('/aws/*', service='aws'),
+        Route('/aws/lambda/*', service='lambda'),
+        Route('/aws/lambda/payments', service='payments-exact'),
+        Route('/aws/lambda/payments-*', service='payments'),
+    ])
+    assert table.resolve('/aws/lambda/payments').service == 'payments-exact'
+    assert table.resolve('/aws/lambda/payments-api').service == 'payments'
+    assert table.resolve('/aws/lambda/orders').service == 'lambda'
+    assert table.resolve('/aws/ecs/web').service == 'aws'
+    assert table.resolve('/poc/dd-log') is None
+
+def test_glob_with_inner_wildcard():
+    """Test globs are checked after reaching their literal prefix"""
+    table = RoutingTable([
+        Route('/aws/*/prod', service='prod'),
+        Route('/aws/*', service='fallback'),
+    ])
+    assert table.resolve('/aws/ecs/prod').service == 'prod'
+    assert table.resolve('/aws/ecs/staging').service == 'fallback'
+
+def test_declaration_order_breaks_ties():
+    """Test rules with the same literal prefix apply in declaration order"""
+    table = RoutingTable([
+        Route('/app/*-api', service='api'),
+        Route('/app/*', service='any'),
+    ])
+    assert table.resolve('/app/orders-api').service == 'api'
+    assert table.resolve('/app/orders-worker').service == 'any'
+
+def test_resolution_cached():
+    """Test a log group is matched against the trie only once"""
+    table = RoutingTable([Route('/aws/*', service='aws')])
+    with patch.object(table, '_lookup', wraps=table._lookup) as lookup:
+        table.resolve('/aws/ecs/web')
+        table.resolve('/aws/ecs/web')
+    assert lookup.call_count == 1
+
+def test_load_routes():
+    """Test rules load from JSON and are validated"""
+    routes = load_routes(json.dumps([
+        {'match': '/aws/vpc/*', 'parser': 'vpc_flow', 'tags': ['team:net', 'env:prod']},
+    ]))
+    assert routes[0].parser.name == 'vpc_flow'
+    assert routes[0].tags == 'team:net,env:prod'
+    assert load_routes('') == []
+
+    with pytest.raises(ValueError):
+        load_routes(json.dumps([{'match': '/a', 'parser': 'grok'}]))
+    with pytest.raises(ValueError):
+        load_routes(json.dumps([{'match': '/a', 'sample_rate': 2}]))
+    with pytest.raises(ValueError):
+        load_routes(json.dumps({'match': '/a'}))
+
+def test_process_log_events_applies_route():
+    """Test the route sets service, appends tags and forces its parser"""
+    route = Route('/nginx/*', service='web', tags='team:web', parser='plain')
+    events = [{'timestamp': 1, 'message': '203.0.113.7 - - [21/Feb/2025:10:00:01 +0000] "GET / HTTP/1.1" 200 5'}]
+    processed = process_log_events(events, {'log_group_name': '/nginx/access'}, route)
+
+    assert processed[0]['service'] == 'web'
+    assert processed[0]['ddtags'].endswith(',team:web')
+    assert 'http' not in processed[0]
+
+def test_process_log_events_samples():
+    """Test the route's sample rate drops events before parsing"""
+    events = [{'timestamp': i, 'message': 'line'} for i in range(100)]
+    assert process_log_events(events, {}, Route('/a', sample_rate=0.0)) == []
+    assert len(process_log_events(events, {}, Route('/a', sample_rate=1.0))) == 100
+
+@patch('intake.get_client')
+def test_lambda_handler_uses_route_destination(mock_get_client, mock_env):
+    """Test events for a routed log group go to the route's destination"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    table = RoutingTable([Route('/aws/lambda/*', service='lambdas', destination='datadoghq.eu')])
+
+    with patch('routing.routing_table', table):
+        result = lambda_handler(create_cloudwatch_event([{'id': '1', 'timestamp': 1, 'message': 'hello'}]), MockContext())
+
+    assert result['statusCode'] == 200
+    assert mock_get_client.call_args[0][0] == 'https://http-intake.logs.datadoghq.eu/api/v2/logs'
+    body = json.loads(mock_get_client.return_value.post.call_args[0][0])
+    assert body[0]['service'] == 'lambdas'
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
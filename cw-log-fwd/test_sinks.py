@@ -0,0 +1,182 @@
+import gzip
+import io
+import json
+import os
+import threading
+import time
+import urllib.error
+import pytest
+from unittest.mock import patch
+from src.records import SerializedEvents
+from src.sinks import DatadogSink, FanOut, FileSink, Sink, StdoutSink, create_sink, load_sinks
+from src.lambda_function import lambda_handler
+from test_lambda import MockContext, create_cloudwatch_event, mock_intake_response
+
+URL = 'https://http-intake.logs.datadoghq.com/api/v2/logs'
+
+@pytest.fixture
+def mock_env():
+    os.environ['DD_API_KEY'] = 'test-api-key'
+    yield
+    if 'DD_API_KEY' in os.environ:
+        del os.environ['DD_API_KEY']
+
+@pytest.fixture(autouse=True)
+def no_backoff():
+    with patch('src.sinks.RETRY_BACKOFF', 0):
+        yield
+
+def serialized(count):
+    return SerializedEvents([b'\n'.join(json.dumps({'message': f'line {i}'}).encode() for i in range(count))], count)
+
+def http_error(code):
+    return urllib.error.HTTPError(URL, code, 'error', {}, io.BytesIO(b''))
+
+class SlowSink(Sink):
+    kind = 'slow'
+
+    def __init__(self, delay, name='slow', **options):
+        super().__init__(name, 1000, 1000000, **options)
+        self.delay = delay
+        self.done = threading.Event()
+
+    def write(self, lines, log_group, dd_url, api_key):
+        time.sleep(self.delay)
+        self.done.set()
+        return 0, False
+
+def test_split_respects_limits():
+    sink = StdoutSink(max_events=2, max_bytes=1000)
+    assert [len(request) for request in sink.split([b'{}'] * 5)] == [2, 2, 1]
+    sink = StdoutSink(max_events=100, max_bytes=10)
+    assert [len(request) for request in sink.split([b'1234'] * 3)] == [2, 1]
+
+@patch('intake.get_client')
+def test_datadog_sink_retries_server_errors(mock_get_client):
+    mock_get_client.return_value.post.side_effect = [http_error(503), mock_intake_response()]
+    result = DatadogSink(url=URL).deliver(serialized(3), api_key=lambda: 'key')
+    assert (result.events, result.failed, result.retries, result.requests) == (3, 0, 1, 1)
+    body = json.loads(mock_get_client.return_value.post.call_args[0][0])
+    assert [event['message'] for event in body] == ['line 0', 'line 1', 'line 2']
+
+@patch('intake.get_client')
+def test_datadog_sink_adapts_request_size(mock_get_client):
+    """Test the sink cuts requests to the log group's sizer and feeds it the intake's answers"""
+    mock_get_client.return_value.post.side_effect = [http_error(429), mock_intake_response(), mock_intake_response()]
+    with patch('batching.sizers.limits', return_value=(2, 1000000)), patch('batching.sizers.observe') as observe:
+        result = DatadogSink().deliver(serialized(3), '/aws/lambda/app', URL, lambda: 'key')
+    assert (result.events, result.requests, result.retries) == (3, 2, 1)
+    assert [len(json.loads(call[0][0])) for call in mock_get_client.return_value.post.call_args_list] == [2, 2, 1]
+    assert [(call[0][0], call[0][1], call[0][4]) for call in observe.call_args_list] == [
+        ('/aws/lambda/app', 2, 429), ('/aws/lambda/app', 2, 202), ('/aws/lambda/app', 1, 202)]
+
+@patch('intake.get_client')
+def test_datadog_sink_does_not_retry_rejections(mock_get_client):
+    mock_get_client.return_value.post.side_effect = http_error(400)
+    result = DatadogSink(url=URL).deliver(serialized(3), api_key=lambda: 'key')
+    assert (result.events, result.failed, result.retries) == (0, 3, 0)
+    assert mock_get_client.return_value.post.call_count == 1
+
+def test_datadog_sink_own_key():
+    with patch.dict(os.environ, {'DD_EU_API_KEY': 'eu-key'}):
+        assert DatadogSink(site='datadoghq.eu', api_key_env='DD_EU_API_KEY').key(lambda: 'default') == 'eu-key'
+    assert DatadogSink(site='datadoghq.eu').url == 'https://http-intake.logs.datadoghq.eu/api/v2/logs'
+
+def test_file_sink_writes_json_lines(tmp_path):
+    result = FileSink(dest=str(tmp_path), max_events=2).deliver(serialized(3), '/aws/lambda/app')
+    assert (result.events, result.requests) == (3, 2)
+    files = sorted(str(path) for path in tmp_path.rglob('*.jsonl.gz'))
+    assert os.path.basename(files[0]).startswith('aws_lambda_app-')
+    lines = [line for path in files for line in gzip.decompress(open(path, 'rb').read()).splitlines()]
+    assert sorted(json.loads(line)['message'] for line in lines) == ['line 0', 'line 1', 'line 2']
+
+def test_slow_sink_does_not_delay_others():
+    """Test an optional sink still sending is left running once the required sinks are done"""
+    stream = io.StringIO()
+    slow = SlowSink(0.5, timeout=0.1, required=False)
+    fan_out = FanOut([StdoutSink(stream=stream), slow])
+
+    started = time.monotonic()
+    results = fan_out.deliver(serialized(2))
+    assert time.monotonic() - started < 0.1
+    assert (results[0].events, results[1].pending, results[1].failed) == (2, 2, 0)
+    assert len(stream.getvalue().splitlines()) == 2
+
+    # Still busy past its timeout: the next batch is not queued behind the first
+    time.sleep(0.15)
+    results = fan_out.deliver(serialized(3))
+    assert (results[1].pending, results[1].failed) == (0, 3)
+    assert 'Timed out' in results[1].error
+    assert slow.done.wait(1)
+
+def test_required_sink_timeout():
+    """Test a required sink is waited for up to its timeout and then reported failed"""
+    slow = SlowSink(0.3, timeout=0.1)
+    started = time.monotonic()
+    results = FanOut([slow]).deliver(serialized(2))
+    assert 0.1 <= time.monotonic() - started < 0.3
+    assert results[0].failed == 2
+    assert 'Timed out' in results[0].error
+    assert slow.done.wait(1)
+
+def test_late_failures_reported_with_next_batch():
+    """Test events an optional sink fails after the invocation returned count on its next result"""
+    class FailingSink(SlowSink):
+        def write(self, lines, log_group, dd_url, api_key):
+            super().write(lines, log_group, dd_url, api_key)
+            raise OSError('disk full')
+
+    primary = SlowSink(0, name='primary')
+    failing = FailingSink(0.1, name='archive', timeout=1, required=False, attempts=1)
+    fan_out = FanOut([primary, failing])
+    assert fan_out.deliver(serialized(2))[1].pending == 2
+    time.sleep(0.2)
+    # The primary now outlasts the archive, so its result is taken directly
+    primary.delay, failing.delay = 0.1, 0
+    result = fan_out.deliver(serialized(3))[1]
+    assert (result.pending, result.failed) == (0, 2 + 3)
+
+def test_sink_configuration():
+    fan_out = load_sinks('[{"type": "datadog"}, {"type": "file", "name": "archive", "dest": "/tmp/a"}]')
+    assert [sink.name for sink in fan_out.sinks] == ['datadog', 'archive']
+    assert load_sinks('') is None
+    with pytest.raises(ValueError):
+        create_sink({'type': 'kafka'})
+    with pytest.raises(ValueError):
+        create_sink({'type': 'file', 'bucket': 'x'})
+    with pytest.raises(ValueError):
+        load_sinks('[{"type": "stdout"}, {"type": "stdout"}]')
+
+@patch('intake.get_client')
+def test_lambda_handler_fans_out(mock_get_client, mock_env, tmp_path):
+    """Test one batch reaches Datadog and the archive, serialized once"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    fan_out = FanOut([DatadogSink(), FileSink(name='archive', dest=str(tmp_path))])
+    event = create_cloudwatch_event([{'id': str(i), 'timestamp': i, 'message': f'line {i}'} for i in range(3)])
+
+    with patch('sinks.fan_out', fan_out):
+        result = lambda_handler(event, MockContext())
+
+    assert result['statusCode'] == 200
+    assert len(json.loads(mock_get_client.return_value.post.call_args[0][0])) == 3
+    assert len(list(tmp_path.rglob('*.jsonl.gz'))) == 1
+
+@patch('intake.get_client')
+def test_lambda_handler_optional_sink_failure(mock_get_client, mock_env, capsys):
+    """Test only required sinks decide whether the invocation failed"""
+    mock_get_client.return_value.post.return_value = mock_intake_response()
+    event = create_cloudwatch_event([{'id': '1', 'timestamp': 1, 'message': 'line'}])
+    archive = FileSink(name='archive', dest='/proc/not-writable', required=False, attempts=1)
+
+    with patch('sinks.fan_out', FanOut([DatadogSink(), archive])):
+        assert lambda_handler(event, MockContext())['statusCode'] == 200
+
+    mock_get_client.return_value.post.side_effect = http_error(403)
+    archive = FileSink(name='archive', dest='/proc/not-writable', attempts=1)
+    with patch('sinks.fan_out', FanOut([DatadogSink(), archive])):
+        assert lambda_handler(event, MockContext())['statusCode'] == 500
+    emf = [json.loads(line) for line in capsys.readouterr().out.splitlines() if line.startswith('{"_aws":')]
+    assert emf[-1]['SinkFailures'] == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,93 @@
+import os
+import pytest
+from unittest.mock import patch
+from src.timestamps import event_time, parse_iso8601, to_millis
+from src.records import JSON, BatchContext, LogRecord, datadog_id
+from src.lambda_function import get_dd_url, process_log_events
+from src.health_check import get_dd_url as health_check_dd_url
+
+CONTEXT = {'log_group_name': '/aws/lambda/app', 'log_stream_name': 'stream', 'aws_region': 'us-east-1'}
+
+# 2025-02-21T10:00:00Z
+EPOCH_MS = 1740132000000
+
+@pytest.mark.parametrize('value, expected', [
+    ('2025-02-21T10:00:00Z', EPOCH_MS),
+    ('2025-02-21T10:00:00.123456Z', EPOCH_MS + 123),
+    ('2025-02-21T10:00:00.5', EPOCH_MS + 500),
+    ('2025-02-21 10:00:00', EPOCH_MS),
+    ('2025-02-21T12:00:00+02:00', EPOCH_MS),
+    ('2025-02-21T08:30:00.250-0130', EPOCH_MS + 250),
+])
+def test_parse_iso8601(value, expected):
+    assert parse_iso8601(value) == expected
+
+@pytest.mark.parametrize('value', ['2025-13-21T10:00:00Z', '2025-02-21T10:00:00 junk', 'not a timestamp at all'])
+def test_parse_iso8601_rejects_invalid(value):
+    assert parse_iso8601(value) is None
+
+def test_to_millis_formats():
+    assert to_millis('21/Feb/2025:11:00:00 +0100') == EPOCH_MS
+    assert to_millis(EPOCH_MS // 1000) == EPOCH_MS
+    assert to_millis(EPOCH_MS / 1000 + 0.5) == EPOCH_MS + 500
+    assert to_millis(EPOCH_MS) == EPOCH_MS
+    assert to_millis(True) is None
+    assert to_millis(float('inf')) is None
+    # Durations and counters are not times
+    assert to_millis(0.123) is None
+    assert to_millis(86400) is None
+
+def test_event_time_falls_back_to_cloudwatch():
+    assert event_time({'timestamp': 'yesterday', 'time': '2025-02-21T10:00:00Z'}, 5) == EPOCH_MS
+    assert event_time({'timestamp': 'yesterday'}, 5) == 5
+    assert event_time(None, 5) == 5
+
+def test_event_time_ignores_implausible_times():
+    """Test a time far from CloudWatch's, or before 2000, leaves the CloudWatch timestamp"""
+    assert event_time({'time': 0.123}, EPOCH_MS) == EPOCH_MS
+    assert event_time({'timestamp': '1970-01-01T00:00:01Z'}, EPOCH_MS) == EPOCH_MS
+    assert event_time({'timestamp': '2025-01-01T00:00:00Z'}, EPOCH_MS) == EPOCH_MS
+    assert event_time({'timestamp': '2025-02-21T13:00:00Z'}, EPOCH_MS) == EPOCH_MS
+    # Later keys are still tried, and a day late is within the window
+    assert event_time({'time': 12.5, 'ts': EPOCH_MS // 1000 - 86400}, EPOCH_MS) == EPOCH_MS - 86400000
+    assert event_time({'timestamp': '1999-12-31T23:59:59Z'}, 5) == 5
+
+def test_json_event_keeps_its_own_time():
+    """Test a message's own timestamp wins over when CloudWatch ingested it"""
+    events = [
+        {'id': '1', 'timestamp': EPOCH_MS + 60000, 'message': '{"timestamp": "2025-02-21T10:00:00.042Z"}'},
+        {'id': '2', 'timestamp': EPOCH_MS + 60000, 'message': 'plain line'},
+    ]
+    result = process_log_events(events, CONTEXT)
+    assert [event['timestamp'] for event in result] == [EPOCH_MS + 42, EPOCH_MS + 60000]
+
+    access_log = '127.0.0.1 - - [21/Feb/2025:10:00:00 +0000] "GET / HTTP/1.1" 200 5'
+    # Another log group: the format detected for the first one is cached
+    context = {**CONTEXT, 'log_group_name': '/aws/ecs/nginx'}
+    result = process_log_events([{'id': '3', 'timestamp': EPOCH_MS + 60000, 'message': access_log}], context)
+    assert result[0]['timestamp'] == EPOCH_MS
+
+def test_correlation_attributes():
+    """Test trace and request ids are mapped to Datadog's correlation attributes"""
+    attributes = {'trace_id': '4bf92f3577b34da6a3ce929d0e0e4736', 'span_id': 1234,
+                  'request_id': 'req_1', 'http': {'method': 'GET'}}
+    data = LogRecord(JSON, 1000, None, attributes, BatchContext(CONTEXT)).to_dict()
+    assert data['dd'] == {'trace_id': str(0xa3ce929d0e0e4736), 'span_id': '1234'}
+    assert data['http'] == {'method': 'GET', 'request_id': 'req_1'}
+    assert data['trace_id'] == '4bf92f3577b34da6a3ce929d0e0e4736'
+    assert attributes['http'] == {'method': 'GET'}
+
+def test_correlation_keeps_injected_ids():
+    attributes = {'trace_id': 'trace_1', 'dd': {'trace_id': '42', 'env': 'prod'}}
+    data = LogRecord(JSON, 1000, None, attributes, BatchContext(CONTEXT)).to_dict()
+    assert data['dd'] == {'trace_id': '42', 'env': 'prod'}
+    assert datadog_id('trace_1') == 'trace_1'
+
+def test_handler_and_health_check_share_endpoint():
+    with patch.dict(os.environ, {'DD_SITE': 'datadoghq.eu'}):
+        os.environ.pop('DD_INTAKE_URL', None)
+        assert get_dd_url() == health_check_dd_url() == 'https://http-intake.logs.datadoghq.eu/api/v2/logs'
+    assert get_dd_url('us5.datadoghq.com') == 'https://http-intake.logs.us5.datadoghq.com/api/v2/logs'
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])
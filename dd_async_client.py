@@ -0,0 +1,233 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+DD_INTAKE_URL = "https://http-intake.logs.datadoghq.com/api/v2/logs"
+
+# Intake limits for a single POST to the v2 logs API
+MAX_BATCH_LOGS = 1000
+MAX_BATCH_BYTES = 5 * 1024 * 1024
+
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_LOGS_PER_SECOND = 5000
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_RETRY_AFTER = 2
+DEFAULT_MAX_RETRIES = 3
+REQUEST_TIMEOUT = 10
+
+
+class AsyncLogStats:
+    def __init__(self):
+        self.total_sent = 0
+        self.successful = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.requests = 0
+        self.started_at = time.monotonic()
+
+    def logs_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started_at
+        return self.successful / elapsed if elapsed > 0 else 0.0
+
+
+class AsyncRateLimiter:
+    """Token bucket shared by every task using the same client."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(burst if burst is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int = 1) -> None:
+        """Wait until `tokens` logs may be sent."""
+        # A batch larger than the bucket would never fit; let it through at capacity
+        tokens = min(float(tokens), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class AsyncDatadogClient:
+    """Batching asyncio client for the Datadog logs intake.
+
+    Logs passed to `send_log` are grouped into batches and POSTed by a bounded
+    number of concurrent requests. Rate limiting and 429 backoff are shared, so
+    one rate-limited request pauses every task instead of each retrying alone.
+
+    Only the scheduling is asynchronous. Each POST is a blocking http.client
+    request run on a thread pool of `max_in_flight` workers, each keeping its
+    own keep-alive connection. The event loop batches, rate-limits and backs
+    off, and never blocks on the network itself.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        intake_url: str = DD_INTAKE_URL,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        logs_per_second: float = DEFAULT_LOGS_PER_SECOND,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        if not api_key:
+            raise ValueError("DD_API_KEY is required")
+
+        self.api_key = api_key
+        self.intake_url = intake_url
+        self.max_in_flight = max_in_flight
+        self.batch_size = min(batch_size, MAX_BATCH_LOGS)
+        self.max_retries = max_retries
+        self.stats = AsyncLogStats()
+
+        self._url = urlsplit(intake_url)
+        self._limiter = AsyncRateLimiter(logs_per_second, burst=max(logs_per_second, self.batch_size))
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="dd-intake")
+        self._local = threading.local()
+        self._connections: List[http.client.HTTPConnection] = []
+        self._connections_lock = threading.Lock()
+        self._resume_at = 0.0
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_bytes = 0
+        self._tasks: set = set()
+
+    async def __aenter__(self) -> "AsyncDatadogClient":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> None:
+        await self.close()
+
+    async def send_log(self, payload: Dict[str, Any]) -> None:
+        """Queue a log; a batch is dispatched once it is full."""
+        size = len(json.dumps(payload, separators=(',', ':')))
+        if self._pending and (
+            len(self._pending) >= self.batch_size or self._pending_bytes + size > MAX_BATCH_BYTES
+        ):
+            await self._dispatch()
+        self._pending.append(payload)
+        self._pending_bytes += size + 1
+
+        if len(self._pending) >= self.batch_size:
+            await self._dispatch()
+
+    async def flush(self) -> None:
+        """Send any queued logs and wait for all in-flight batches."""
+        if self._pending:
+            await self._dispatch()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def close(self) -> None:
+        """Flush queued logs and release connections."""
+        await self.flush()
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+
+    async def send_batch(self, logs: List[Dict[str, Any]]) -> bool:
+        """Send one batch, retrying on 429 and transient errors."""
+        body = json.dumps(logs, separators=(',', ':')).encode('utf-8')
+        await self._limiter.acquire(len(logs))
+
+        for attempt in range(self.max_retries):
+            await self._wait_for_backoff()
+            async with self._in_flight:
+                try:
+                    loop = asyncio.get_running_loop()
+                    status, retry_after = await loop.run_in_executor(self._executor, self._post_blocking, body)
+                except (OSError, http.client.HTTPException) as e:
+                    print(f"Error sending {len(logs)} logs: {str(e)}")
+                    status, retry_after = None, None
+
+            self.stats.requests += 1
+            if status is not None and 200 <= status < 300:
+                self.stats.total_sent += len(logs)
+                self.stats.successful += len(logs)
+                return True
+            if status == 429:
+                self.stats.rate_limited += len(logs)
+                self._back_off(retry_after or DEFAULT_RETRY_AFTER)
+                continue
+            if status is not None and status < 500:
+                print(f"Warning: Unexpected status code {status}, dropping {len(logs)} logs")
+                break
+            if attempt < self.max_retries - 1:
+                await asyncio.sleep(2 ** attempt * 0.1)
+
+        self.stats.total_sent += len(logs)
+        self.stats.failed += len(logs)
+        return False
+
+    async def _dispatch(self) -> None:
+        logs = self._pending
+        self._pending = []
+        self._pending_bytes = 0
+
+        # Block the producer while the in-flight window is full so queued
+        # batches cannot grow without bound
+        while len(self._tasks) >= self.max_in_flight * 2:
+            await asyncio.wait(self._tasks, return_when=asyncio.FIRST_COMPLETED)
+
+        task = asyncio.ensure_future(self.send_batch(logs))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _back_off(self, retry_after: float) -> None:
+        resume_at = time.monotonic() + retry_after
+        if resume_at > self._resume_at:
+            print(f"\nRate limit hit. Pausing all senders for {retry_after} seconds...")
+            self._resume_at = resume_at
+
+    async def _wait_for_backoff(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self._resume_at - time.monotonic()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn_class = http.client.HTTPSConnection if self._url.scheme == 'https' else http.client.HTTPConnection
+            conn = conn_class(self._url.netloc, timeout=REQUEST_TIMEOUT)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _post_blocking(self, body: bytes) -> Tuple[int, Optional[float]]:
+        """Blocking POST run on a pool thread; reuses that thread's keep-alive connection."""
+        headers = {
+            'Content-Type': 'application/json',
+            'DD-API-KEY': self.api_key,
+        }
+        conn = self._connection()
+        try:
+            conn.request('POST', self._url.path or '/', body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection so the next attempt reconnects
+            conn.close()
+            raise
+
+        retry_after = response.getheader('Retry-After')
+        try:
+            retry_after = float(retry_after) if retry_after else None
+        except ValueError:
+            retry_after = None
+        return response.status, retry_after
@@ -1,9 +1,13 @@
+import argparse
+import asyncio
 import requests
 import time
 import os
 from datetime import datetime
 import json
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+from dd_async_client import AsyncDatadogClient, AsyncLogStats
 
 # Datadog API configuration
 DD_API_KEY = os.environ.get('DD_API_KEY')
@@ -17,6 +21,11 @@ RATE_LIMIT_LOGS_PER_SECOND = 5  # Maximum logs per second
 RATE_LIMIT_RETRY_AFTER = 2      # Seconds to wait after hitting rate limit
 MAX_RETRIES = 3                 # Maximum number of retries per log
 
+# Load test configuration (--load-test)
+LOAD_TEST_MAX_IN_FLIGHT = 16        # Concurrent POSTs to the intake
+LOAD_TEST_LOGS_PER_SECOND = 5000    # Shared across all tasks
+LOAD_TEST_BATCH_SIZE = 500          # Logs per POST
+
 class LogStats:
     def __init__(self):
         self.total_sent = 0
@@ -33,23 +42,8 @@ def handle_rate_limit(retry_after: int = None) -> None:
     print(f"\nRate limit hit. Waiting {wait_time} seconds...")
     time.sleep(wait_time)
 
-def send_log(status: str, message: str, additional_attributes: Dict[str, Any] = None) -> bool:
-    if not DD_API_KEY:
-        print("Error: DD_API_KEY environment variable is not set or empty")
-        print("Current DD_API_KEY value:", DD_API_KEY)
-        return False
-
-    # Ensure we don't exceed rate limit
-    time_since_last = time.time() - log_stats.last_send_time
-    if time_since_last < 1.0 / RATE_LIMIT_LOGS_PER_SECOND:
-        sleep_time = (1.0 / RATE_LIMIT_LOGS_PER_SECOND) - time_since_last
-        time.sleep(sleep_time)
-
-    headers = {
-        "Content-Type": "application/json",
-        "DD-API-KEY": DD_API_KEY
-    }
-    
+def build_payload(status: str, message: str, additional_attributes: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Build a Datadog log payload shared by the sync and async senders"""
     payload = {
         "ddsource": "python-script",
         "service": "error-monitoring",
@@ -84,6 +78,27 @@ def send_log(status: str, message: str, additional_attributes: Dict[str, Any] =
             if key not in ["stack_trace", "error_type", "error_code", "http_status"]:
                 payload[key] = value
 
+    return payload
+
+def send_log(status: str, message: str, additional_attributes: Dict[str, Any] = None) -> bool:
+    if not DD_API_KEY:
+        print("Error: DD_API_KEY environment variable is not set or empty")
+        print("Current DD_API_KEY value:", DD_API_KEY)
+        return False
+
+    # Ensure we don't exceed rate limit
+    time_since_last = time.time() - log_stats.last_send_time
+    if time_since_last < 1.0 / RATE_LIMIT_LOGS_PER_SECOND:
+        sleep_time = (1.0 / RATE_LIMIT_LOGS_PER_SECOND) - time_since_last
+        time.sleep(sleep_time)
+
+    headers = {
+        "Content-Type": "application/json",
+        "DD-API-KEY": DD_API_KEY
+    }
+
+    payload = build_payload(status, message, additional_attributes)
+
     for attempt in range(MAX_RETRIES):
         try:
             print(f"\nSending log (attempt {attempt + 1}/{MAX_RETRIES}):")
@@ -124,58 +139,40 @@ def send_log(status: str, message: str, additional_attributes: Dict[str, Any] =
 
     return False
 
-def simulate_logs():
-    # Test log to verify connectivity
-    success = send_log("info", "Test connection to Datadog", {
-        "test": True,
-        "timestamp": datetime.now().isoformat()
-    })
-    
-    if not success:
-        print("\nInitial test log failed. Please check your DD_API_KEY and connectivity.")
-        return
-    
-    # ERROR log
-    send_log("error", "Database connection failed", {
+# Logs emitted by simulate_logs, after the initial connectivity test
+SIMULATED_LOGS = [
+    ("error", "Database connection failed", {
         "error_code": "DB_001",
         "connection_attempts": 3,
         "database": "users_db"
-    })
-    
-    time.sleep(1)  # Add small delay between logs
-    
-    # WARN log
-    send_log("warn", "High memory usage detected", {
+    }),
+    ("warn", "High memory usage detected", {
         "memory_usage": "85%",
         "threshold": "80%",
         "process": "web_server"
-    })
-    
-    # INFO log
-    send_log("info", "User login successful", {
+    }),
+    ("info", "User login successful", {
         "user_id": "12345",
         "login_method": "oauth",
         "ip_address": "192.168.1.1"
-    })
-    
-    # DEBUG log
-    send_log("debug", "Cache miss for user profile", {
+    }),
+    ("debug", "Cache miss for user profile", {
         "cache_key": "user:12345:profile",
         "cache_type": "redis",
         "query_time_ms": 150
-    })
-    
-    # TRACE log
-    send_log("trace", "HTTP request processed", {
+    }),
+    ("trace", "HTTP request processed", {
         "method": "GET",
         "path": "/api/v1/users",
         "processing_time_ms": 45,
         "response_size_bytes": 2048
-    })
+    }),
+]
 
-def simulate_500_errors():
+# Logs emitted by simulate_500_errors
+SIMULATED_500_ERRORS = [
     # Database connection error with improved error details
-    send_log("error", "Internal Server Error: Database Query Failed", {
+    ("error", "Internal Server Error: Database Query Failed", {
         "error_type": "DatabaseError",
         "stack_trace": "Error: Connection refused at Database.query (/app/db.js:15)",
         "http_status": 500,
@@ -185,12 +182,9 @@ def simulate_500_errors():
         "response_time": 5000,
         "database_name": "users_db",
         "query_id": "q_123456"
-    })
-    
-    time.sleep(1)
-    
+    }),
     # Memory overflow error
-    send_log("error", "Internal Server Error: Memory limit exceeded", {
+    ("error", "Internal Server Error: Memory limit exceeded", {
         "error_type": "MemoryError",
         "stack_trace": "Error: OutOfMemory: JavaScript heap out of memory at /app/server.js:123",
         "http_status": 500,
@@ -200,12 +194,9 @@ def simulate_500_errors():
         "process_id": "server_123",
         "host_memory_total": "8GB",
         "host_memory_free": "100MB"
-    })
-    
-    time.sleep(1)
-    
+    }),
     # Payment processing error
-    send_log("error", "Payment Processing Failed", {
+    ("error", "Payment Processing Failed", {
         "error_type": "PaymentError",
         "stack_trace": "TypeError: Cannot read property 'amount' of undefined at PaymentProcessor.charge (/app/payments.js:89)",
         "http_status": 500,
@@ -216,22 +207,95 @@ def simulate_500_errors():
         "currency": "USD",
         "customer_id": "cust_456",
         "payment_method": "credit_card"
+    }),
+]
+
+def simulate_logs(client: Optional[AsyncDatadogClient] = None, repeat: int = 1):
+    """Send the sample logs; pass an AsyncDatadogClient to get a coroutine for load tests"""
+    if client is not None:
+        return _simulate_async(client, SIMULATED_LOGS, repeat)
+
+    # Test log to verify connectivity
+    success = send_log("info", "Test connection to Datadog", {
+        "test": True,
+        "timestamp": datetime.now().isoformat()
     })
+    
+    if not success:
+        print("\nInitial test log failed. Please check your DD_API_KEY and connectivity.")
+        return
+    
+    for i, (status, message, attributes) in enumerate(SIMULATED_LOGS):
+        send_log(status, message, attributes)
+        if i == 0:
+            time.sleep(1)  # Add small delay between logs
+
+def simulate_500_errors(client: Optional[AsyncDatadogClient] = None, repeat: int = 1):
+    """Send the sample 500 errors; pass an AsyncDatadogClient to get a coroutine for load tests"""
+    if client is not None:
+        return _simulate_async(client, SIMULATED_500_ERRORS, repeat)
+
+    for i, (status, message, attributes) in enumerate(SIMULATED_500_ERRORS):
+        if i > 0:
+            time.sleep(1)
+        send_log(status, message, attributes)
 
-def print_stats():
+async def _simulate_async(client: AsyncDatadogClient, logs: List[Tuple[str, str, Dict[str, Any]]], repeat: int) -> None:
+    for i in range(repeat):
+        for status, message, attributes in logs:
+            payload = build_payload(status, message, attributes)
+            payload["sequence"] = i
+            await client.send_log(payload)
+
+async def run_load_test(repeat: int, max_in_flight: int, logs_per_second: float, batch_size: int) -> AsyncLogStats:
+    """Send `repeat` rounds of both simulators concurrently through one async client"""
+    async with AsyncDatadogClient(
+        DD_API_KEY,
+        intake_url=DD_INTAKE_URL,
+        max_in_flight=max_in_flight,
+        logs_per_second=logs_per_second,
+        batch_size=batch_size
+    ) as client:
+        await asyncio.gather(
+            simulate_500_errors(client, repeat),
+            simulate_logs(client, repeat)
+        )
+    return client.stats
+
+def print_stats(stats=None):
+    stats = stats or log_stats
     print("\nLog Sending Statistics:")
-    print(f"Total logs attempted: {log_stats.total_sent}")
-    print(f"Successful: {log_stats.successful}")
-    print(f"Failed: {log_stats.failed}")
-    print(f"Rate limited: {log_stats.rate_limited}")
+    print(f"Total logs attempted: {stats.total_sent}")
+    print(f"Successful: {stats.successful}")
+    print(f"Failed: {stats.failed}")
+    print(f"Rate limited: {stats.rate_limited}")
+    if isinstance(stats, AsyncLogStats):
+        print(f"Requests: {stats.requests}")
+        print(f"Throughput: {stats.logs_per_second():.0f} logs/second")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send simulated logs to Datadog")
+    parser.add_argument("--load-test", action="store_true", help="Send logs concurrently through the asyncio client")
+    parser.add_argument("--repeat", type=int, default=1000, help="Rounds of each simulator in load test mode")
+    parser.add_argument("--concurrency", type=int, default=LOAD_TEST_MAX_IN_FLIGHT, help="Maximum in-flight requests")
+    parser.add_argument("--rate", type=float, default=LOAD_TEST_LOGS_PER_SECOND, help="Maximum logs per second")
+    parser.add_argument("--batch-size", type=int, default=LOAD_TEST_BATCH_SIZE, help="Logs per request")
+    args = parser.parse_args()
+
     if not DD_API_KEY:
         print("Error: DD_API_KEY environment variable not set")
         exit(1)
         
     print("Starting log simulation...")
     print(f"Using Datadog URL: {DD_INTAKE_URL}")
+
+    if args.load_test:
+        print(f"Load test: {args.repeat} rounds, {args.concurrency} in flight, {args.rate:.0f} logs per second")
+        stats = asyncio.run(run_load_test(args.repeat, args.concurrency, args.rate, args.batch_size))
+        print_stats(stats)
+        print("\nLoad test completed!")
+        exit(0)
+
     print(f"Rate limit configuration: {RATE_LIMIT_LOGS_PER_SECOND} logs per second")
     
     print("\nSending 500 error logs...")
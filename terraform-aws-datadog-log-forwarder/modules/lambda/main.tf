@@ -107,6 +107,129 @@ resource "aws_iam_role_policy" "lambda_cloudwatch" {
   })
 }
 
+# Token-bucket state shared by concurrent instances when quotas are enabled
+resource "aws_dynamodb_table" "quotas" {
+  count = var.shared_quota_table ? 1 : 0
+
+  name         = "${local.lambda_function_name}-quotas"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "log_group"
+
+  attribute {
+    name = "log_group"
+    type = "S"
+  }
+
+  tags = local.tags
+}
+
+# Allow Lambda to read and update the shared quota table
+resource "aws_iam_role_policy" "lambda_quotas" {
+  count = var.shared_quota_table ? 1 : 0
+
+  name = "${local.lambda_role_name}-quotas"
+  role = aws_iam_role.lambda.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ]
+        Resource = aws_dynamodb_table.quotas[0].arn
+      }
+    ]
+  })
+}
+
+# Allow Lambda to spill over-quota events and replay them
+resource "aws_iam_role_policy" "lambda_quota_spill" {
+  count = var.quota_spill_bucket != "" ? 1 : 0
+
+  name = "${local.lambda_role_name}-quota-spill"
+  role = aws_iam_role.lambda.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "arn:aws:s3:::${var.quota_spill_bucket}/datadog-forwarder-spill/*"
+      },
+      {
+        Effect   = "Allow"
+        Action   = "s3:ListBucket"
+        Resource = "arn:aws:s3:::${var.quota_spill_bucket}"
+        Condition = {
+          StringLike = {
+            "s3:prefix" = "datadog-forwarder-spill/*"
+          }
+        }
+      }
+    ]
+  })
+}
+
+# Allow Lambda to write, recover and delete buffered events in the spill bucket
+resource "aws_iam_role_policy" "lambda_buffer" {
+  count = var.buffer_enabled && var.buffer_spill_bucket != "" ? 1 : 0
+
+  name = "${local.lambda_role_name}-buffer"
+  role = aws_iam_role.lambda.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject",
+          "s3:DeleteObject"
+        ]
+        Resource = "arn:aws:s3:::${var.buffer_spill_bucket}/datadog-forwarder-buffer/*"
+      },
+      {
+        Effect   = "Allow"
+        Action   = "s3:ListBucket"
+        Resource = "arn:aws:s3:::${var.buffer_spill_bucket}"
+        Condition = {
+          StringLike = {
+            "s3:prefix" = "datadog-forwarder-buffer/*"
+          }
+        }
+      }
+    ]
+  })
+}
+
+# Allow Lambda to write archived events for file sinks
+resource "aws_iam_role_policy" "lambda_sinks" {
+  count = length(var.sink_bucket_names) > 0 ? 1 : 0
+
+  name = "${local.lambda_role_name}-sinks"
+  role = aws_iam_role.lambda.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Effect   = "Allow"
+        Action   = "s3:PutObject"
+        Resource = [for bucket in var.sink_bucket_names : "arn:aws:s3:::${bucket}/*"]
+      }
+    ]
+  })
+}
+
 # Create CloudWatch log group for Lambda
 resource "aws_cloudwatch_log_group" "lambda" {
   name              = "/aws/lambda/${local.lambda_function_name}"
@@ -133,8 +256,32 @@ resource "aws_lambda_function" "forwarder" {
   environment {
     variables = merge(
       {
-        DD_API_KEY_SECRET_ARN = var.dd_api_key_secret_arn
-        DD_SITE               = var.datadog_site
+        DD_API_KEY_SECRET_ARN             = var.dd_api_key_secret_arn
+        DD_SITE                           = var.datadog_site
+        DD_FORWARDER_WARMUP               = tostring(var.warmup_enabled)
+        DD_FORWARDER_WARMUP_TIMEOUT       = tostring(var.warmup_timeout)
+        DD_FORWARDER_ROUTES               = jsonencode(var.log_group_routes)
+        DD_FORWARDER_DEDUP                = var.dedup_mode
+        DD_FORWARDER_DEDUP_WINDOW         = tostring(var.dedup_window)
+        DD_FORWARDER_SCRUB                = var.scrub_rules
+        DD_FORWARDER_SCRUB_ALLOW          = var.scrub_allowlist
+        DD_FORWARDER_QUOTA_RATE           = var.quota_rate == null ? "" : tostring(var.quota_rate)
+        DD_FORWARDER_QUOTA_BURST          = var.quota_burst == null ? "" : tostring(var.quota_burst)
+        DD_FORWARDER_QUOTA_OVERFLOW       = var.quota_overflow
+        DD_FORWARDER_QUOTA_TABLE          = var.shared_quota_table ? aws_dynamodb_table.quotas[0].name : ""
+        DD_FORWARDER_SPILL_DEST           = var.quota_spill_bucket != "" ? "s3://${var.quota_spill_bucket}/datadog-forwarder-spill" : ""
+        DD_FORWARDER_PARALLEL_WORKERS     = var.parallel_workers
+        DD_FORWARDER_PARALLEL_THRESHOLD   = tostring(var.parallel_threshold)
+        DD_FORWARDER_BUFFER               = tostring(var.buffer_enabled)
+        DD_FORWARDER_BUFFER_MAX_AGE       = tostring(var.buffer_max_age)
+        DD_FORWARDER_BUFFER_SPILL         = var.buffer_enabled ? "s3://${var.buffer_spill_bucket}/datadog-forwarder-buffer" : ""
+        DD_FORWARDER_SINKS                = length(var.sinks) > 0 ? jsonencode(var.sinks) : ""
+        DD_FORWARDER_OVERSIZE             = var.oversize_mode
+        DD_FORWARDER_MAX_EVENT_BYTES      = tostring(var.max_event_bytes)
+        DD_FORWARDER_MEMORY_BUDGET        = var.memory_budget == null ? "" : tostring(var.memory_budget)
+        DD_FORWARDER_MEMORY_SAMPLE_RATE   = tostring(var.memory_sample_rate)
+        DD_FORWARDER_ADAPTIVE_BATCHING    = tostring(var.adaptive_batching)
+        DD_FORWARDER_BATCH_TARGET_LATENCY = tostring(var.batch_target_latency)
       },
       var.environment_variables
     )
@@ -147,6 +294,17 @@ resource "aws_lambda_function" "forwarder" {
     aws_cloudwatch_log_group.lambda
   ]
 
+  lifecycle {
+    precondition {
+      condition     = var.quota_overflow != "spill" || var.quota_spill_bucket != ""
+      error_message = "quota_overflow = \"spill\" needs quota_spill_bucket; /tmp does not outlive the execution environment."
+    }
+    precondition {
+      condition     = !var.buffer_enabled || var.buffer_spill_bucket != ""
+      error_message = "buffer_enabled needs buffer_spill_bucket; /tmp does not outlive the execution environment."
+    }
+  }
+
   tags = local.tags
 }
 
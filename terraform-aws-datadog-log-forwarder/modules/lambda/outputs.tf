@@ -17,3 +17,8 @@ output "lambda_role_name" {
   description = "Name of the Lambda IAM role"
   value       = aws_iam_role.lambda.name
 }
+
+output "quota_table_name" {
+  description = "Name of the DynamoDB table holding shared quota state, if created"
+  value       = var.shared_quota_table ? aws_dynamodb_table.quotas[0].name : null
+}
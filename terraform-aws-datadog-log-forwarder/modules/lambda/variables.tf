@@ -77,3 +77,168 @@ variable "filter_pattern" {
   type        = string
   default     = ""
 }
+
+variable "warmup_enabled" {
+  description = "Fetch the Datadog API key and open the intake connection during the Lambda init phase"
+  type        = bool
+  default     = false
+}
+
+variable "warmup_timeout" {
+  description = "Maximum seconds the init-phase warmup may take before init continues without it"
+  type        = number
+  default     = 2
+}
+
+variable "log_group_routes" {
+  description = "Routing rules mapping log group names (exact, prefix* or glob) to service, tags, parser, sample_rate, destination, aggregate and quota"
+  type        = any
+  default     = []
+}
+
+variable "dedup_mode" {
+  description = "Collapse repeated log lines: off, batch (consecutive repeats within a batch) or window (also across warm invocations)"
+  type        = string
+  default     = "off"
+
+  validation {
+    condition     = contains(["off", "batch", "window"], var.dedup_mode)
+    error_message = "dedup_mode must be one of off, batch or window."
+  }
+}
+
+variable "dedup_window" {
+  description = "Seconds during which repeats of a forwarded line are counted instead of sent, when dedup_mode is window"
+  type        = number
+  default     = 10
+}
+
+variable "scrub_rules" {
+  description = "PII and secret redaction before forwarding: off, all, or a comma-separated list of rules and groups (email, ip, token, card, ...)"
+  type        = string
+  default     = "off"
+}
+
+variable "scrub_allowlist" {
+  description = "Per-attribute redaction exceptions as attribute=rule|rule pairs, e.g. client_ip=ip"
+  type        = string
+  default     = ""
+}
+
+variable "quota_rate" {
+  description = "Default events per second forwarded for each log group; null disables quotas for log groups without a route quota"
+  type        = number
+  default     = null
+}
+
+variable "quota_burst" {
+  description = "Default token-bucket size, in events, for each log group (defaults to quota_rate)"
+  type        = number
+  default     = null
+}
+
+variable "quota_overflow" {
+  description = "What happens to events over a log group's quota: sample, spill or drop"
+  type        = string
+  default     = "sample"
+
+  validation {
+    condition     = contains(["sample", "spill", "drop"], var.quota_overflow)
+    error_message = "quota_overflow must be one of sample, spill or drop."
+  }
+}
+
+variable "shared_quota_table" {
+  description = "Create a DynamoDB table so that concurrent instances share each log group's token bucket"
+  type        = bool
+  default     = false
+}
+
+variable "quota_spill_bucket" {
+  description = "S3 bucket that over-quota events are spilled to, for later replay; required by the spill overflow"
+  type        = string
+  default     = ""
+}
+
+variable "parallel_workers" {
+  description = "Processes that parse large batches: 0 for in-process only, a count, or auto for one per vCPU of memory_size"
+  type        = string
+  default     = "0"
+}
+
+variable "parallel_threshold" {
+  description = "Smallest batch, in events, parsed across processes when parallel_workers is set"
+  type        = number
+  default     = 5000
+}
+
+variable "buffer_enabled" {
+  description = "Hold small batches in the warm execution environment and send them together"
+  type        = bool
+  default     = false
+}
+
+variable "buffer_max_age" {
+  description = "Seconds buffered events may wait before they are sent"
+  type        = number
+  default     = 10
+}
+
+variable "buffer_spill_bucket" {
+  description = "S3 bucket that keeps buffered events safe when an execution environment is recycled; required when buffer_enabled is true"
+  type        = string
+  default     = ""
+}
+
+variable "sinks" {
+  description = "Destinations every batch is delivered to (datadog, file and stdout sink objects); empty sends to Datadog only"
+  type        = any
+  default     = []
+}
+
+variable "sink_bucket_names" {
+  description = "S3 buckets the function may write to for file sinks"
+  type        = list(string)
+  default     = []
+}
+
+variable "oversize_mode" {
+  description = "What happens to an event over max_event_bytes: truncate it, or split it into numbered parts"
+  type        = string
+  default     = "truncate"
+
+  validation {
+    condition     = contains(["truncate", "split"], var.oversize_mode)
+    error_message = "oversize_mode must be one of truncate or split."
+  }
+}
+
+variable "max_event_bytes" {
+  description = "Largest encoded event, in bytes, sent unchanged; Datadog accepts at most 1 MB per log"
+  type        = number
+  default     = 1000000
+}
+
+variable "memory_budget" {
+  description = "MB a payload may be projected to need before it is streamed; null for 80% of memory_size, 0 to never stream"
+  type        = number
+  default     = null
+}
+
+variable "memory_sample_rate" {
+  description = "Fraction of invocations whose stages are traced with tracemalloc for their peak memory"
+  type        = number
+  default     = 0
+}
+
+variable "adaptive_batching" {
+  description = "Size intake requests per log group from the intake's latency and 429 responses, within its 1000 event and 5 MB limits"
+  type        = bool
+  default     = true
+}
+
+variable "batch_target_latency" {
+  description = "Request latency, in milliseconds, that adaptive batching keeps requests under"
+  type        = number
+  default     = 1000
+}
@@ -0,0 +1,119 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+import pytest
+from dd_async_client import AsyncDatadogClient, AsyncRateLimiter
+
+
+class StubIntake:
+    """Local stand-in for the logs intake, answering from `statuses` in turn (then 202)"""
+
+    def __init__(self, statuses=(), latency=0.0, retry_after='0.2'):
+        self.statuses = list(statuses)
+        self.latency = latency
+        self.retry_after = retry_after
+        self.batches = []
+        self.arrivals = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                with stub.lock:
+                    stub.arrivals.append(time.monotonic())
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                    status = stub.statuses.pop(0) if stub.statuses else 202
+                    if status == 202:
+                        stub.batches.append(json.loads(body))
+                time.sleep(stub.latency)
+                with stub.lock:
+                    stub.in_flight -= 1
+                self.send_response(status)
+                if status == 429:
+                    self.send_header('Retry-After', stub.retry_after)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/api/v2/logs"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def send_all(intake, count, **options):
+    async def run():
+        async with AsyncDatadogClient('test-key', intake_url=intake.url, **options) as client:
+            for i in range(count):
+                await client.send_log({'message': f'log {i}'})
+        return client
+    return asyncio.run(run())
+
+
+def test_rate_limiter_waits_for_tokens():
+    """Test the bucket lets a burst through at once, then refills at its rate"""
+    async def run():
+        limiter = AsyncRateLimiter(rate=100, burst=10)
+        started = time.monotonic()
+        await limiter.acquire(10)
+        burst = time.monotonic() - started
+        await limiter.acquire(10)
+        return burst, time.monotonic() - started
+    burst, total = asyncio.run(run())
+    assert burst < 0.05
+    assert total >= 0.09
+
+
+def test_logs_are_batched():
+    with StubIntake() as intake:
+        client = send_all(intake, 1200, batch_size=500, logs_per_second=100000)
+    assert sorted(len(batch) for batch in intake.batches) == [200, 500, 500]
+    assert sorted(log['message'] for batch in intake.batches for log in batch) == \
+        sorted(f'log {i}' for i in range(1200))
+    assert (client.stats.successful, client.stats.failed, client.stats.requests) == (1200, 0, 3)
+
+
+def test_in_flight_requests_are_bounded():
+    with StubIntake(latency=0.05) as intake:
+        client = send_all(intake, 100, batch_size=10, max_in_flight=2, logs_per_second=100000)
+    assert client.stats.successful == 100
+    assert intake.max_in_flight == 2
+
+
+def test_rate_limit_pauses_every_sender():
+    """Test one 429 holds back all senders for Retry-After, then every batch is delivered"""
+    with StubIntake(statuses=[429], latency=0.01, retry_after='0.3') as intake:
+        client = send_all(intake, 40, batch_size=10, max_in_flight=4, logs_per_second=100000)
+    assert client.stats.successful == 40
+    assert client.stats.rate_limited == 10
+    # Requests arriving after the 429 waited out its Retry-After, whichever task sent them
+    first = intake.arrivals[0]
+    late = [t for t in intake.arrivals[1:] if t - first > 0.05]
+    assert late and all(t - first >= 0.29 for t in late)
+
+
+def test_client_errors_are_not_retried():
+    with StubIntake(statuses=[400]) as intake:
+        client = send_all(intake, 5, batch_size=5, logs_per_second=100000)
+    assert (client.stats.successful, client.stats.failed, client.stats.requests) == (0, 5, 1)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, '-v'])